@@ -1,9 +1,13 @@
 import disnake
-from disnake.ext import commands
+from disnake.ext import commands, tasks
+import logging
 import os
 from dotenv import load_dotenv
-from utils.database import initialize_database, get_database_pool, fetch_products
+from utils.database import initialize_database, get_database_pool, get_pool_metrics, get_query_stats
 from utils.logging_config import setup_logging
+from utils.encryption import ENCRYPTION_KEYS
+from utils.key_rotation import run_key_rotation
+from utils.http_client import close_http_session
 from handlers.verification_handler import VerificationButton
 from handlers.ticket_handler import TicketButton
 import threading
@@ -14,10 +18,48 @@ load_dotenv()
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+DB_POOL_METRICS_INTERVAL = int(os.getenv("DB_POOL_METRICS_INTERVAL", "300"))
+# Sharding: SHARD_COUNT is the total across all processes, SHARD_IDS the
+# shards this process runs ("0,1" or "0-3"). AUTO_SHARD lets Discord pick.
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_IDS = os.getenv("SHARD_IDS")
+AUTO_SHARD = os.getenv("AUTO_SHARD", "false").lower() in ("1", "true", "yes")
+# Re-encrypt stored secrets in the background while old keys are still configured
+KEY_ROTATION = os.getenv("KEY_ROTATION", "true").lower() in ("1", "true", "yes")
+key_rotation_task = None
+
+def parse_shard_ids(value):
+    """Parse "0,1,2" or "0-3" (or a mix) into a list of shard IDs"""
+    shard_ids = []
+    for part in value.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            shard_ids.extend(range(int(start), int(end) + 1))
+        else:
+            shard_ids.append(int(part))
+    return shard_ids
 
 # Initialize logging
 setup_logging(LOG_LEVEL)
 
+class SharedSessionMixin:
+    """Close the shared outbound HTTP session when the bot shuts down"""
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            await close_http_session()
+
+class KeyVerifyBot(SharedSessionMixin, commands.InteractionBot):
+    pass
+
+class ShardedKeyVerifyBot(SharedSessionMixin, commands.AutoShardedInteractionBot):
+    pass
+
 # Bot setup
 intents = disnake.Intents.default()
 intents.messages = True
@@ -26,7 +68,20 @@ intents.members = True
 command_sync_flags = commands.CommandSyncFlags.default()
 command_sync_flags.sync_commands_debug = True
 
-bot = commands.InteractionBot(intents=intents,command_sync_flags=command_sync_flags,)
+if SHARD_COUNT or SHARD_IDS or AUTO_SHARD:
+    shard_ids = parse_shard_ids(SHARD_IDS) if SHARD_IDS else None
+    # Application commands are global, so only the process holding shard 0 syncs them
+    if shard_ids is not None and 0 not in shard_ids:
+        command_sync_flags = commands.CommandSyncFlags.none()
+    bot = ShardedKeyVerifyBot(
+        intents=intents,
+        command_sync_flags=command_sync_flags,
+        shard_count=int(SHARD_COUNT) if SHARD_COUNT else None,
+        shard_ids=shard_ids,
+    )
+    print(f"Sharded mode: shards {shard_ids if shard_ids is not None else 'all'} of {SHARD_COUNT or 'auto'}")
+else:
+    bot = KeyVerifyBot(intents=intents,command_sync_flags=command_sync_flags,)
 
 # Load all cogs dynamically
 COG_DIR = "cogs"
@@ -45,6 +100,7 @@ cog_files = [
     "review_system.py",
     "server_log.py",
     "server_utilities.py",
+    "stale_data.py",
     "start_verification.py",
     "stock_management.py",
     "ticket_categories.py",
@@ -65,9 +121,20 @@ for filename in cog_files:
     else:
         print(f"Cog file not found: {filename}")
 
+@tasks.loop(seconds=max(DB_POOL_METRICS_INTERVAL, 1))
+async def log_pool_metrics():
+    logger = logging.getLogger("database.pool")
+    logger.info(f"[DB Pool] {get_pool_metrics()}")
+    logger.info(f"[DB Queries] {get_query_stats()}")
+
 @bot.event
 async def on_ready():
     print(f"Bot is online as {bot.user}!")
+    global key_rotation_task
+    if DB_POOL_METRICS_INTERVAL > 0 and not log_pool_metrics.is_running():
+        log_pool_metrics.start()
+    if KEY_ROTATION and len(ENCRYPTION_KEYS) > 1 and key_rotation_task is None:
+        key_rotation_task = bot.loop.create_task(run_key_rotation())
     for guild in bot.guilds:
         print(f"• {guild.name} (ID: {guild.id})")
     
@@ -109,9 +176,15 @@ async def on_ready():
         await bot.change_presence(activity=default_activity)
         
     # Load persistent views and messages
+    await restore_persistent_views()
+
+async def restore_persistent_views():
+    """Re-register persistent verification and ticket views with a few set-based queries"""
     async with (await get_database_pool()).acquire() as conn:
         # Load verification messages
         verification_rows = await conn.fetch("SELECT guild_id, message_id, channel_id FROM verification_message")
+        stale_verification_guilds = []
+        loaded = 0
         for row in verification_rows:
             guild_id, message_id, channel_id = row["guild_id"], row["message_id"], row["channel_id"]
 
@@ -119,23 +192,33 @@ async def on_ready():
             if not guild:
                 continue
 
-            channel = guild.get_channel(int(channel_id))
-            if not channel:
-                await conn.execute("DELETE FROM verification_message WHERE guild_id = $1", guild_id)
-                continue
-
-            products = await fetch_products(guild_id)
-            if not products:
+            if not guild.get_channel(int(channel_id)):
+                stale_verification_guilds.append(guild_id)
                 continue
 
             # Initialize the persistent verification view
-            view = VerificationButton(guild_id)
-            bot.add_view(view, message_id=int(message_id))
-            print(f"Verification message loaded for guild {guild_id}.")
+            bot.add_view(VerificationButton(guild_id), message_id=int(message_id))
+            loaded += 1
+
+        if stale_verification_guilds:
+            await conn.execute(
+                "DELETE FROM verification_message WHERE guild_id = ANY($1)",
+                stale_verification_guilds
+            )
+        print(f"Verification messages loaded: {loaded} "
+              f"({len(stale_verification_guilds)} stale removed).")
             
-        # Load ticket boxes
+        # Load ticket boxes together with their button customization
         try:
-            ticket_rows = await conn.fetch("SELECT guild_id, message_id, channel_id FROM ticket_boxes")
+            ticket_rows = await conn.fetch(
+                """
+                SELECT b.guild_id, b.message_id, b.channel_id, c.button_text, c.button_emoji
+                FROM ticket_boxes b
+                LEFT JOIN ticket_customization c ON c.guild_id = b.guild_id
+                """
+            )
+            stale_ticket_messages = []
+            loaded = 0
             for row in ticket_rows:
                 guild_id, message_id, channel_id = row["guild_id"], row["message_id"], row["channel_id"]
 
@@ -143,17 +226,23 @@ async def on_ready():
                 if not guild:
                     continue
 
-                channel = guild.get_channel(int(channel_id))
-                if not channel:
-                    await conn.execute("DELETE FROM ticket_boxes WHERE guild_id = $1 AND message_id = $2", 
-                                     guild_id, message_id)
+                if not guild.get_channel(int(channel_id)):
+                    stale_ticket_messages.append(message_id)
                     continue
 
                 # Initialize the persistent ticket view with custom settings
                 view = TicketButton(guild_id)
-                await view.setup_button(guild)  # Setup custom button text/emoji
+                view.apply_customization(row)
                 bot.add_view(view, message_id=int(message_id))
-                print(f"Ticket box loaded for guild {guild_id}.")
+                loaded += 1
+
+            if stale_ticket_messages:
+                await conn.execute(
+                    "DELETE FROM ticket_boxes WHERE message_id = ANY($1)",
+                    stale_ticket_messages
+                )
+            print(f"Ticket boxes loaded: {loaded} "
+                  f"({len(stale_ticket_messages)} stale removed).")
         except Exception as e:
             print(f"Note: Ticket system tables not yet created: {e}")
 
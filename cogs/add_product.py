@@ -3,7 +3,7 @@
 import disnake
 from disnake.ext import commands
 from utils.encryption import encrypt_data
-from utils.database import get_database_pool
+from utils.database import get_database_pool, notify_cache_change
 from utils.permissions import owner_or_permission
 import config
 import logging
@@ -242,6 +242,7 @@ class PaymentMethodView(disnake.ui.View):
                     payhip_secret,
                     product_data.get('gamepass_id')
                 )
+                await notify_cache_change(interaction.guild.id, "products")
                 
                 # Success message
                 success_embed = disnake.Embed(
@@ -2,7 +2,7 @@ import disnake
 from disnake.ext import commands
 import requests
 from utils.database import get_database_pool
-from utils.encryption import decrypt_data
+from utils.encryption import decrypt_many
 import os  # To access environment variables
 import config
 
@@ -57,10 +57,11 @@ class RemoveUser(commands.Cog):
             deactivated_licenses = []
             failed_licenses = []
 
-            for row in rows:
+            license_keys = decrypt_many(row["license_key"] for row in rows)
+            product_secrets = decrypt_many(row["product_secret"] for row in rows)
+
+            for row, license_key, product_secret in zip(rows, license_keys, product_secrets):
                 product_name = row["product_name"]
-                license_key = decrypt_data(row["license_key"])
-                product_secret = decrypt_data(row["product_secret"])
 
                 try:
                     PAYHIP_DISABLE_LICENSE_URL = "https://payhip.com/api/v2/license/disable"
@@ -11,21 +11,7 @@ logger = logging.getLogger(__name__)
 class BotSettings(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.bot.loop.create_task(self.setup_table())
         
-    async def setup_table(self):
-        """Creates table for storing bot settings"""
-        await self.bot.wait_until_ready()
-        async with (await get_database_pool()).acquire() as conn:
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS bot_settings (
-                    guild_id TEXT NOT NULL,
-                    setting_name TEXT NOT NULL,
-                    setting_value TEXT NOT NULL,
-                    PRIMARY KEY (guild_id, setting_name)
-                );
-            """)
-
     @commands.slash_command(
         description="Set the bot's status message (server owner only).",
         default_member_permissions=disnake.Permissions(manage_guild=True),
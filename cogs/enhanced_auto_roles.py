@@ -2,7 +2,7 @@
 
 import disnake
 from disnake.ext import commands
-from utils.database import get_database_pool, fetch_products
+from utils.database import get_database_pool, fetch_product_names, get_auto_role_ids, notify_cache_change
 from utils.permissions import requires_permission, owner_or_permission
 import config
 import logging
@@ -21,7 +21,7 @@ class EnhancedAutoRoles(commands.Cog):
     async def set_product_auto_roles(self, inter: disnake.ApplicationCommandInteraction):
         """Configure product-specific auto-roles"""
         # Get all products for this guild
-        products = await fetch_products(str(inter.guild.id))
+        products = await fetch_product_names(str(inter.guild.id))
         
         if not products:
             await inter.response.send_message(
@@ -38,7 +38,7 @@ class EnhancedAutoRoles(commands.Cog):
                 value=product_name,
                 description=f"Configure auto-roles for {product_name}"
             )
-            for product_name in products.keys()
+            for product_name in products
         ][:25]  # Discord limit
 
         dropdown = disnake.ui.StringSelect(
@@ -169,6 +169,7 @@ class EnhancedAutoRoles(commands.Cog):
                             "DELETE FROM auto_roles WHERE guild_id = $1 AND product_name = $2",
                             str(inter.guild.id), product_name
                         )
+                    await notify_cache_change(inter.guild.id, "auto_roles")
                     
                     await button_inter.response.send_message(
                         f"✅ Removed all auto-roles for **{product_name}**.",
@@ -214,13 +215,9 @@ class ProductAutoRoleView(disnake.ui.View):
 
     @disnake.ui.button(label="📋 View Current", style=disnake.ButtonStyle.secondary)
     async def view_current(self, button, inter):
-        async with (await get_database_pool()).acquire() as conn:
-            auto_roles = await conn.fetch(
-                "SELECT role_id FROM auto_roles WHERE guild_id = $1 AND product_name = $2 AND role_type = $3",
-                str(inter.guild.id), self.product_name, "verified"
-            )
+        auto_role_ids = await get_auto_role_ids(inter.guild.id, "verified", self.product_name)
 
-        if not auto_roles:
+        if not auto_role_ids:
             await inter.response.send_message(
                 f"📋 No auto-roles set for **{self.product_name}**.",
                 ephemeral=True
@@ -228,8 +225,8 @@ class ProductAutoRoleView(disnake.ui.View):
             return
 
         role_mentions = []
-        for auto_role in auto_roles:
-            role = inter.guild.get_role(int(auto_role["role_id"]))
+        for role_id in auto_role_ids:
+            role = inter.guild.get_role(int(role_id))
             if role:
                 role_mentions.append(role.mention)
 
@@ -272,6 +269,7 @@ class ProductAutoRoleView(disnake.ui.View):
                             """,
                             str(inter.guild.id), "verified", str(role.id), self.product_name
                         )
+                        await notify_cache_change(inter.guild.id, "auto_roles")
                         
                         await select_inter.response.send_message(
                             f"✅ Added {role.mention} as auto-role for **{self.product_name}**",
@@ -287,13 +285,9 @@ class ProductAutoRoleView(disnake.ui.View):
             
         else:  # remove
             # Show current auto-roles to remove
-            async with (await get_database_pool()).acquire() as conn:
-                auto_roles = await conn.fetch(
-                    "SELECT role_id FROM auto_roles WHERE guild_id = $1 AND product_name = $2 AND role_type = $3",
-                    str(inter.guild.id), self.product_name, "verified"
-                )
+            auto_role_ids = await get_auto_role_ids(inter.guild.id, "verified", self.product_name)
 
-            if not auto_roles:
+            if not auto_role_ids:
                 await inter.response.send_message(
                     f"❌ No auto-roles to remove for **{self.product_name}**.",
                     ephemeral=True
@@ -301,8 +295,8 @@ class ProductAutoRoleView(disnake.ui.View):
                 return
 
             role_options = []
-            for auto_role in auto_roles:
-                role = inter.guild.get_role(int(auto_role["role_id"]))
+            for role_id in auto_role_ids:
+                role = inter.guild.get_role(int(role_id))
                 if role:
                     role_options.append(disnake.SelectOption(
                         label=role.name,
@@ -324,6 +318,7 @@ class ProductAutoRoleView(disnake.ui.View):
                         "DELETE FROM auto_roles WHERE guild_id = $1 AND role_type = $2 AND role_id = $3 AND product_name = $4",
                         str(inter.guild.id), "verified", str(role_id), self.product_name
                     )
+                await notify_cache_change(inter.guild.id, "auto_roles")
                 
                 await select_inter.response.send_message(
                     f"✅ Removed {role.mention} from auto-roles for **{self.product_name}**",
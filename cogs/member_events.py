@@ -1,54 +1,208 @@
 # Fixed cogs/member_events.py with circular import resolution
 
+import asyncio
+import os
+import time
+from collections import deque
 import disnake
 from disnake.ext import commands
-from utils.database import get_database_pool
+from utils.database import (
+    get_database_pool, get_auto_role_ids, get_log_channel_id, get_verified_product_roles,
+    register_invalidation_handler
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Joins are queued per guild and drained by one worker per guild, so a join
+# flood costs one config lookup and one verified-role query per batch
+JOIN_BATCH_SIZE = int(os.getenv("JOIN_BATCH_SIZE", "50"))
+JOIN_BATCH_WINDOW = float(os.getenv("JOIN_BATCH_WINDOW", "1"))
+# Above this many joins per minute, welcome messages are combined into one post per batch
+WELCOME_BATCH_THRESHOLD = int(os.getenv("WELCOME_BATCH_THRESHOLD", "20"))
+WELCOME_BATCH_MAX_MENTIONS = 50
+JOIN_RATE_WINDOW = 60
+
+# guild_id -> {"join_role_ids": [...], "welcome_enabled": bool}, dropped on
+# auto_roles / bot_settings invalidations from any process
+join_config_cache = {}
+join_config_generation = {}
+
+def invalidate_join_config(guild_id):
+    """Forget a guild's join config (every guild's if None)"""
+    if guild_id is None:
+        join_config_cache.clear()
+        for cached_guild_id in join_config_generation:
+            join_config_generation[cached_guild_id] += 1
+        return
+
+    guild_id = str(guild_id)
+    join_config_cache.pop(guild_id, None)
+    join_config_generation[guild_id] = join_config_generation.get(guild_id, 0) + 1
+
+register_invalidation_handler("auto_roles", invalidate_join_config)
+register_invalidation_handler("bot_settings", invalidate_join_config)
+
+async def get_join_config(guild_id, conn):
+    """Join auto-roles and welcome setting of a guild, cached until invalidated"""
+    guild_id = str(guild_id)
+    join_config = join_config_cache.get(guild_id)
+    if join_config is not None:
+        return join_config
+
+    generation = join_config_generation.setdefault(guild_id, 0)
+    welcome_setting = await conn.fetchval(
+        "SELECT setting_value FROM bot_settings WHERE guild_id = $1 AND setting_name = $2",
+        guild_id, "welcome_message"
+    )
+    join_config = {
+        "join_role_ids": await get_auto_role_ids(guild_id, "join", conn=conn),
+        "welcome_enabled": welcome_setting == "enabled",
+    }
+
+    # Only keep it if no invalidation arrived while we were loading
+    if join_config_generation.get(guild_id) == generation:
+        join_config_cache[guild_id] = join_config
+    return join_config
+
+def resolve_roles(guild, role_ids):
+    """Split role IDs into assignable roles and names of roles above the bot"""
+    roles = []
+    failed_roles = []
+    for role_id in role_ids:
+        role = guild.get_role(int(role_id))
+        if not role or role in roles or role.name in failed_roles:
+            continue
+        if role < guild.me.top_role:
+            roles.append(role)
+        else:
+            failed_roles.append(role.name)
+            logger.warning(f"[Auto-Role Skipped] Can't assign '{role.name}' in '{guild.name}' (role too high)")
+    return roles, failed_roles
+
+def welcome_channel(guild):
+    """System channel, or the first text channel the bot can post in"""
+    channel = guild.system_channel
+    if not channel:
+        channel = next((c for c in guild.text_channels if c.permissions_for(guild.me).send_messages), None)
+    return channel
+
 class EnhancedMemberEvents(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.join_queues = {}  # guild_id -> [member, ...]
+        self.join_workers = {}  # guild_id -> worker task
+        self.join_times = {}  # guild_id -> join timestamps within JOIN_RATE_WINDOW
+
+    def cog_unload(self):
+        for worker in self.join_workers.values():
+            worker.cancel()
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        """Handle member joining - assign auto-roles"""
+        """Handle member joining - queue auto-roles and verified role restore"""
         if member.bot:
             return  # Don't process bots
 
+        guild_id = member.guild.id
+        self.join_queues.setdefault(guild_id, []).append(member)
+
+        now = time.monotonic()
+        join_times = self.join_times.setdefault(guild_id, deque())
+        join_times.append(now)
+        while join_times and now - join_times[0] > JOIN_RATE_WINDOW:
+            join_times.popleft()
+
+        worker = self.join_workers.get(guild_id)
+        if worker is None or worker.done():
+            self.join_workers[guild_id] = asyncio.create_task(self.join_worker(guild_id))
+
+    def join_rate(self, guild_id):
+        """Joins in the last JOIN_RATE_WINDOW seconds"""
+        join_times = self.join_times.get(guild_id, ())
+        now = time.monotonic()
+        return sum(1 for joined in join_times if now - joined <= JOIN_RATE_WINDOW)
+
+    async def join_worker(self, guild_id):
+        """Drain a guild's join queue in batches, then exit"""
         try:
-            # Get join auto-roles for this guild
-            async with (await get_database_pool()).acquire() as conn:
-                auto_roles = await conn.fetch(
-                    "SELECT role_id FROM auto_roles WHERE guild_id = $1 AND role_type = $2 AND product_name IS NULL",
-                    str(member.guild.id), "join"
-                )
+            while self.join_queues.get(guild_id):
+                # Let a burst build up so it's handled as one batch
+                await asyncio.sleep(JOIN_BATCH_WINDOW)
+                queue = self.join_queues[guild_id]
+                batch = queue[:JOIN_BATCH_SIZE]
+                self.join_queues[guild_id] = queue[JOIN_BATCH_SIZE:]
+                try:
+                    await self.process_join_batch(guild_id, batch)
+                except Exception as e:
+                    logger.error(f"[Member Join Error] Failed to handle {len(batch)} join(s) in guild {guild_id}: {e}")
+        finally:
+            self.join_workers.pop(guild_id, None)
+            if not self.join_queues.get(guild_id):
+                self.join_queues.pop(guild_id, None)
+                if not self.join_rate(guild_id):
+                    self.join_times.pop(guild_id, None)
 
-            if not auto_roles:
-                return  # No auto-roles set
+    async def process_join_batch(self, guild_id, members):
+        """Assign join auto-roles and restore verified product roles for a batch of joins"""
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
 
-            roles_to_add = []
-            failed_roles = []
-            
-            for auto_role in auto_roles:
-                role = member.guild.get_role(int(auto_role["role_id"]))
-                if role and role < member.guild.me.top_role:
-                    roles_to_add.append(role)
-                elif role:
-                    failed_roles.append(role.name)
-                    logger.warning(f"[Auto-Role Skipped] Can't assign '{role.name}' to {member} in '{member.guild.name}' (role too high)")
-
-            if roles_to_add:
-                await member.add_roles(*roles_to_add, reason="Auto-role on join")
-                role_names = [role.name for role in roles_to_add]
-                logger.info(f"[Auto-Role Join] Assigned {', '.join(role_names)} to {member} in '{member.guild.name}'")
-
-                # Optional: Send welcome message with role info
+        async with (await get_database_pool()).acquire() as conn:
+            join_config = await get_join_config(guild_id, conn)
+            # Products these members verified before leaving
+            verified_roles = await get_verified_product_roles(guild_id, [member.id for member in members], conn=conn)
+
+        join_roles, join_failed = resolve_roles(guild, join_config["join_role_ids"])
+        welcomed = []
+
+        for member in members:
+            if guild.get_member(member.id) is None:
+                continue  # Already left again
+
+            restored = verified_roles.get(str(member.id), [])
+            product_roles, product_failed = resolve_roles(guild, [role_id for _, role_id in restored])
+            roles_to_add = join_roles + [role for role in product_roles if role not in join_roles]
+            failed_roles = join_failed + [name for name in product_failed if name not in join_failed]
+            if not roles_to_add:
+                continue
+
+            # One request per member for every role; members are handled one at a
+            # time so the guild's role route bucket is never hammered
+            if not await self.add_join_roles(member, roles_to_add):
+                continue
+
+            role_names = [role.name for role in roles_to_add]
+            logger.info(f"[Auto-Role Join] Assigned {', '.join(role_names)} to {member} in '{guild.name}'")
+            if restored:
+                logger.info(f"[Role Restore] {member} rejoined '{guild.name}' verified for {', '.join(name for name, _ in restored)}")
+            welcomed.append((member, roles_to_add, failed_roles))
+
+        if not join_config["welcome_enabled"] or not welcomed:
+            return
+
+        if self.join_rate(guild_id) >= WELCOME_BATCH_THRESHOLD:
+            await self.send_batched_welcome(guild, welcomed)
+        else:
+            for member, roles_to_add, failed_roles in welcomed:
                 await self.send_welcome_message(member, roles_to_add, failed_roles)
 
-        except Exception as e:
-            logger.error(f"[Member Join Error] Failed to handle member join for {member}: {e}")
+    async def add_join_roles(self, member, roles):
+        """add_roles, waiting out a rate limit once if disnake gives up on it"""
+        for attempt in range(2):
+            try:
+                await member.add_roles(*roles, reason="Auto-role on join / verified role restore")
+                return True
+            except disnake.NotFound:
+                return False  # Member left meanwhile
+            except disnake.HTTPException as e:
+                if e.status != 429 or attempt:
+                    logger.error(f"[Auto-Role Error] Failed to assign roles to {member}: {e}")
+                    return False
+                retry_after = e.response.headers.get("Retry-After") if e.response is not None else None
+                await asyncio.sleep(float(retry_after or 1))
+        return False
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
@@ -58,14 +212,10 @@ class EnhancedMemberEvents(commands.Cog):
 
         try:
             # Check if logging is enabled
-            async with (await get_database_pool()).acquire() as conn:
-                log_channel = await conn.fetchrow(
-                    "SELECT channel_id FROM server_log_channels WHERE guild_id = $1",
-                    str(member.guild.id)
-                )
+            log_channel_id = await get_log_channel_id(member.guild.id)
 
-            if log_channel:
-                channel = member.guild.get_channel(int(log_channel["channel_id"]))
+            if log_channel_id:
+                channel = member.guild.get_channel(int(log_channel_id))
                 if channel:
                     embed = disnake.Embed(
                         title="Member Left",
@@ -93,49 +243,76 @@ class EnhancedMemberEvents(commands.Cog):
             logger.error(f"[Member Leave Error] Failed to handle member leave for {member}: {e}")
 
     async def send_welcome_message(self, member, assigned_roles, failed_roles):
-        """Send welcome message if enabled"""
+        """Send a welcome message for one member (welcome messages must be enabled)"""
         try:
-            async with (await get_database_pool()).acquire() as conn:
-                welcome_setting = await conn.fetchrow(
-                    "SELECT setting_value FROM bot_settings WHERE guild_id = $1 AND setting_name = $2",
-                    str(member.guild.id), "welcome_message"
+            embed = disnake.Embed(
+                title=f"Welcome to {member.guild.name}!",
+                description=f"{member.mention}, welcome to our server!",
+                color=disnake.Color.green()
+            )
+            
+            if assigned_roles:
+                embed.add_field(
+                    name="🎭 Roles Assigned",
+                    value=" ".join([role.mention for role in assigned_roles]),
+                    inline=False
                 )
-
-            if welcome_setting and welcome_setting["setting_value"] == "enabled":
-                embed = disnake.Embed(
-                    title=f"Welcome to {member.guild.name}!",
-                    description=f"{member.mention}, welcome to our server!",
-                    color=disnake.Color.green()
+            
+            if failed_roles:
+                embed.add_field(
+                    name="⚠️ Role Assignment Issues",
+                    value=f"Could not assign: {', '.join(failed_roles)}\n*Please contact an administrator.*",
+                    inline=False
                 )
-                
-                if assigned_roles:
-                    embed.add_field(
-                        name="🎭 Roles Assigned",
-                        value=" ".join([role.mention for role in assigned_roles]),
-                        inline=False
-                    )
-                
-                if failed_roles:
-                    embed.add_field(
-                        name="⚠️ Role Assignment Issues",
-                        value=f"Could not assign: {', '.join(failed_roles)}\n*Please contact an administrator.*",
-                        inline=False
-                    )
-                
-                embed.set_thumbnail(url=member.display_avatar.url)
-                embed.set_footer(text="Powered by KeyVerify")
-
-                # Try to send to system channel or first available channel
-                channel = member.guild.system_channel
-                if not channel:
-                    channel = next((c for c in member.guild.text_channels if c.permissions_for(member.guild.me).send_messages), None)
-                
-                if channel:
-                    await channel.send(embed=embed)
+            
+            embed.set_thumbnail(url=member.display_avatar.url)
+            embed.set_footer(text="Powered by KeyVerify")
+
+            # Try to send to system channel or first available channel
+            channel = welcome_channel(member.guild)
+            if channel:
+                await channel.send(embed=embed)
 
         except Exception as e:
             logger.error(f"[Welcome Message Error] Failed to send welcome message: {e}")
 
+    async def send_batched_welcome(self, guild, welcomed):
+        """Welcome a burst of members with one post per WELCOME_BATCH_MAX_MENTIONS members"""
+        channel = welcome_channel(guild)
+        if not channel:
+            return
+
+        for start in range(0, len(welcomed), WELCOME_BATCH_MAX_MENTIONS):
+            chunk = welcomed[start:start + WELCOME_BATCH_MAX_MENTIONS]
+            assigned_roles = []
+            failed_roles = []
+            for _, roles, failed in chunk:
+                assigned_roles += [role for role in roles if role not in assigned_roles]
+                failed_roles += [name for name in failed if name not in failed_roles]
+
+            embed = disnake.Embed(
+                title=f"Welcome to {guild.name}!",
+                description=f"Welcome to our server, {' '.join(member.mention for member, _, _ in chunk)}!",
+                color=disnake.Color.green()
+            )
+            embed.add_field(
+                name="🎭 Roles Assigned",
+                value=" ".join(role.mention for role in assigned_roles),
+                inline=False
+            )
+            if failed_roles:
+                embed.add_field(
+                    name="⚠️ Role Assignment Issues",
+                    value=f"Could not assign: {', '.join(failed_roles)}\n*Please contact an administrator.*",
+                    inline=False
+                )
+            embed.set_footer(text="Powered by KeyVerify")
+
+            try:
+                await channel.send(embed=embed)
+            except Exception as e:
+                logger.error(f"[Welcome Message Error] Failed to send batched welcome message: {e}")
+
 # Utility function to assign verified auto-roles - FIXED to avoid circular imports
 async def assign_verified_auto_roles(member, product_name=None):
     """Utility function to assign auto-roles when user verifies a product"""
@@ -143,29 +320,20 @@ async def assign_verified_auto_roles(member, product_name=None):
         # Get both general and product-specific verified auto-roles
         async with (await get_database_pool()).acquire() as conn:
             # General verified auto-roles
-            general_auto_roles = await conn.fetch(
-                "SELECT role_id FROM auto_roles WHERE guild_id = $1 AND role_type = $2 AND product_name IS NULL",
-                str(member.guild.id), "verified"
-            )
+            all_auto_role_ids = await get_auto_role_ids(member.guild.id, "verified", conn=conn)
             
             # Product-specific auto-roles
-            product_auto_roles = []
             if product_name:
-                product_auto_roles = await conn.fetch(
-                    "SELECT role_id FROM auto_roles WHERE guild_id = $1 AND role_type = $2 AND product_name = $3",
-                    str(member.guild.id), "verified", product_name
-                )
-
-        all_auto_roles = general_auto_roles + product_auto_roles
+                all_auto_role_ids += await get_auto_role_ids(member.guild.id, "verified", product_name, conn=conn)
 
-        if not all_auto_roles:
+        if not all_auto_role_ids:
             return []  # No auto-roles set
 
         roles_to_add = []
         failed_roles = []
         
-        for auto_role in all_auto_roles:
-            role = member.guild.get_role(int(auto_role["role_id"]))
+        for role_id in all_auto_role_ids:
+            role = member.guild.get_role(int(role_id))
             if role and role not in member.roles and role < member.guild.me.top_role:
                 roles_to_add.append(role)
             elif role and role >= member.guild.me.top_role:
@@ -11,28 +11,7 @@ logger = logging.getLogger(__name__)
 class MessageManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.bot.loop.create_task(self.setup_table())
         
-    async def setup_table(self):
-        """Creates table for storing custom messages"""
-        await self.bot.wait_until_ready()
-        async with (await get_database_pool()).acquire() as conn:
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS custom_messages (
-                    guild_id TEXT NOT NULL,
-                    message_name TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    color INTEGER DEFAULT 5793266,
-                    fields TEXT,
-                    footer TEXT,
-                    timestamp BOOLEAN DEFAULT FALSE,
-                    channel_id TEXT,
-                    message_id TEXT,
-                    PRIMARY KEY (guild_id, message_name)
-                );
-            """)
-
     @commands.slash_command(
         description="Create a custom embed message (server owner only).",
         default_member_permissions=disnake.Permissions(manage_guild=True),
@@ -1,6 +1,6 @@
 import disnake
 from disnake.ext import commands
-from utils.database import get_database_pool, fetch_products
+from utils.database import get_database_pool, fetch_product_names, notify_cache_change
 import config
 import logging
 
@@ -19,7 +19,7 @@ class RemoveProduct(commands.Cog):
             return
         
         # Fetch all products registered in the current guild
-        products = await fetch_products(str(inter.guild.id))
+        products = await fetch_product_names(str(inter.guild.id))
         if not products:
             logger.info(f"[No Products] {inter.author} opened /remove_product but no products exist in '{inter.guild.name}'")
             await inter.response.send_message("❌ No products to remove.", ephemeral=True, delete_after=config.message_timeout)
@@ -28,7 +28,7 @@ class RemoveProduct(commands.Cog):
         # Build a dropdown menu with all product names
         options = [
             disnake.SelectOption(label=product, description=f"Remove '{product}'")
-            for product in products.keys()
+            for product in products
         ]
 
         dropdown = disnake.ui.StringSelect(
@@ -52,6 +52,7 @@ class RemoveProduct(commands.Cog):
                             "DELETE FROM products WHERE guild_id = $1 AND product_name = $2",
                             str(inter.guild.id), selected
                         )
+                    await notify_cache_change(inter.guild.id, "products")
                         
                     # No matching product found in DB    
                     if result == "DELETE 0":
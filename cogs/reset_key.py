@@ -2,7 +2,7 @@ import disnake
 from disnake.ext import commands
 import requests
 import os  
-from utils.encryption import decrypt_data
+from utils.encryption import decrypt_cached
 from utils.database import get_database_pool
 import config
 
@@ -43,7 +43,7 @@ class ResetKey(commands.Cog):
                 )
                 return
 
-            product_secret_key = decrypt_data(row["product_secret"])
+            product_secret_key = decrypt_cached(row["product_secret"])
             
         # Prepare request to Payhip to reset license usage
         PAYHIP_RESET_USAGE_URL = "https://payhip.com/api/v2/license/decrease"
@@ -2,7 +2,8 @@
 
 import disnake
 from disnake.ext import commands
-from utils.database import get_database_pool
+from utils.database import get_database_pool, notify_cache_change
+from utils.permissions import set_cached_role_permission
 import config
 import logging
 
@@ -11,33 +12,7 @@ logger = logging.getLogger(__name__)
 class EnhancedRoleManagement(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.bot.loop.create_task(self.setup_table())
         
-    async def setup_table(self):
-        """Creates tables for storing role permissions and auto-roles"""
-        await self.bot.wait_until_ready()
-        async with (await get_database_pool()).acquire() as conn:
-            # Role permissions table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS role_permissions (
-                    guild_id TEXT NOT NULL,
-                    role_id TEXT NOT NULL,
-                    permission_type TEXT NOT NULL,
-                    PRIMARY KEY (guild_id, role_id, permission_type)
-                );
-            """)
-            
-            # Auto-roles table
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS auto_roles (
-                    guild_id TEXT NOT NULL,
-                    role_type TEXT NOT NULL,
-                    role_id TEXT NOT NULL,
-                    product_name TEXT DEFAULT '',
-                    PRIMARY KEY (guild_id, role_type, role_id, product_name)
-                );
-            """)
-
     @commands.slash_command(
         description="Set role permissions for bot functions (server owner only).",
         default_member_permissions=disnake.Permissions(manage_guild=True),
@@ -151,6 +126,7 @@ class EnhancedRoleManagement(commands.Cog):
                                 "DELETE FROM auto_roles WHERE guild_id = $1 AND role_type = $2 AND product_name = $3",
                                 str(inter.guild.id), role_type, ''
                             )
+                            await notify_cache_change(inter.guild.id, "auto_roles")
                             await select_inter.response.send_message(
                                 f"✅ {role_type_name} disabled.",
                                 ephemeral=True
@@ -166,6 +142,7 @@ class EnhancedRoleManagement(commands.Cog):
                                 """,
                                 str(inter.guild.id), role_type, str(role.id), ''
                             )
+                            await notify_cache_change(inter.guild.id, "auto_roles")
                             await select_inter.response.send_message(
                                 f"✅ {role_type_name} set to {role.mention}",
                                 ephemeral=True
@@ -376,28 +353,14 @@ class PermissionConfigView(disnake.ui.View):
                 )
                 status = "✅ Added"
 
+        set_cached_role_permission(inter.guild.id, self.role_id, permission_type, not existing)
+        await notify_cache_change(inter.guild.id, "role_permissions", local=False)
+
         await inter.response.send_message(
             f"{status} **{PERMISSIONS[permission_type]}** for **{self.role_name}**",
             ephemeral=True,
             delete_after=3
         )
 
-# Utility function to check permissions
-async def has_permission(user, guild, permission_type):
-    """Check if user has specific permission"""
-    if user.id == guild.owner_id:
-        return True
-
-    async with (await get_database_pool()).acquire() as conn:
-        user_role_ids = [str(role.id) for role in user.roles]
-        if not user_role_ids:
-            return False
-
-        result = await conn.fetchrow(
-            "SELECT 1 FROM role_permissions WHERE guild_id = $1 AND role_id = ANY($2) AND permission_type = $3",
-            str(guild.id), user_role_ids, permission_type
-        )
-        return result is not None
-
 def setup(bot):
     bot.add_cog(EnhancedRoleManagement(bot))
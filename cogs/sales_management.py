@@ -1,6 +1,6 @@
 import disnake
 from disnake.ext import commands
-from utils.database import get_database_pool
+from utils.database import get_database_pool, notify_cache_change
 from utils.permissions import owner_or_permission
 import config
 import logging
@@ -56,6 +56,7 @@ class SalesManagement(commands.Cog):
                 """,
                 str(inter.guild.id), product_name, total_sold
             )
+        await notify_cache_change(inter.guild.id, "products")
 
         await inter.response.send_message(
             f"✅ Total sales for **{product_name}** set to: {total_sold:,}",
@@ -102,6 +103,7 @@ class SalesManagement(commands.Cog):
                 """,
                 str(inter.guild.id), product_name, new_count
             )
+        await notify_cache_change(inter.guild.id, "products")
 
         change_text = f"+{change}" if change > 0 else str(change)
         await inter.response.send_message(
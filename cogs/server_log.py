@@ -8,20 +8,7 @@ import asyncio
 class SetLogChannel(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        # Schedule the database table creation as a background task after the bot is ready
-        self.bot.loop.create_task(self.setup_table())
         
-    # Ensures the required table exists for storing log channel mappings
-    async def setup_table(self):
-        await self.bot.wait_until_ready()  # Ensure bot is fully loaded
-        async with (await get_database_pool()).acquire() as conn:
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS server_log_channels (
-                    guild_id TEXT PRIMARY KEY,
-                    channel_id TEXT NOT NULL
-                );
-            """)
-
     @commands.slash_command(
         description="Set a channel to log successful verifications (server owner only).",
         default_member_permissions=disnake.Permissions(manage_guild=True)
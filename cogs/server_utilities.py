@@ -1,17 +1,102 @@
 # Create cogs/server_utilities.py
 
+import asyncio
+import os
+import time
 import disnake
-from disnake.ext import commands
-from utils.database import get_database_pool
+from disnake.ext import commands, tasks
+from utils.database import get_database_pool, notify_cache_change
+from utils.cleanup import cleanup_guild_data
+from utils.export import export_guild_data
 from utils.permissions import owner_or_permission, has_permission, get_user_permissions, PermissionView
 import config
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Background janitor: runs /cleanup_data for every guild every JANITOR_INTERVAL
+# seconds (0 disables it), spending at most JANITOR_GUILD_BUDGET seconds per guild
+JANITOR_INTERVAL = int(os.getenv("JANITOR_INTERVAL", "3600"))
+JANITOR_GUILD_BUDGET = float(os.getenv("JANITOR_GUILD_BUDGET", "2"))
+
+# /server_stats counters per guild, reused for SERVER_STATS_TTL seconds so
+# repeated refreshes don't rescan verified_licenses
+SERVER_STATS_TTL = float(os.getenv("SERVER_STATS_TTL", "60"))
+server_stats_cache = {}  # guild_id -> (expires_at, stats)
+
+SERVER_STATS_SQL = """
+    WITH product_stats AS (
+        SELECT
+            COUNT(*) AS products,
+            COALESCE(SUM(stock) FILTER (WHERE stock <> -1), 0) AS total_stock,
+            COUNT(*) FILTER (WHERE stock = -1) AS unlimited_products,
+            COUNT(*) FILTER (WHERE stock = 0) AS sold_out
+        FROM products WHERE guild_id = $1
+    ),
+    auto_role_stats AS (
+        SELECT
+            COUNT(*) AS auto_roles,
+            COUNT(*) FILTER (WHERE role_type = 'join') AS join_roles,
+            COUNT(*) FILTER (WHERE role_type = 'verified') AS verified_roles,
+            COUNT(*) FILTER (WHERE product_name <> '') AS product_specific_roles
+        FROM auto_roles WHERE guild_id = $1
+    )
+    SELECT
+        product_stats.*,
+        auto_role_stats.*,
+        (SELECT COUNT(*) FROM active_tickets WHERE guild_id = $1) AS active_tickets,
+        (SELECT COUNT(*) FROM verified_licenses WHERE guild_id = $1) AS verified_licenses,
+        (SELECT COUNT(*) FROM custom_messages WHERE guild_id = $1) AS custom_messages
+    FROM product_stats, auto_role_stats
+"""
+
+async def get_server_stats(guild_id):
+    """All /server_stats counters for a guild from one query, cached briefly"""
+    guild_id = str(guild_id)
+    cached = server_stats_cache.get(guild_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return cached[1]
+
+    async with (await get_database_pool()).acquire() as conn:
+        stats = dict(await conn.fetchrow(SERVER_STATS_SQL, guild_id))
+
+    server_stats_cache[guild_id] = (time.monotonic() + SERVER_STATS_TTL, stats)
+    return stats
+
 class ServerUtilities(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        if JANITOR_INTERVAL > 0:
+            self.janitor.change_interval(seconds=JANITOR_INTERVAL)
+            self.janitor.start()
+
+    def cog_unload(self):
+        self.janitor.cancel()
+
+    @tasks.loop(seconds=3600)
+    async def janitor(self):
+        """Purge stale records of every guild this process serves"""
+        guilds = cleaned = 0
+        for guild in list(self.bot.guilds):
+            if guild.unavailable:
+                continue
+            try:
+                removed = await cleanup_guild_data(guild, JANITOR_GUILD_BUDGET)
+            except Exception as e:
+                logger.error(f"[Janitor] Cleanup failed for '{guild.name}': {e}")
+                continue
+
+            guilds += 1
+            if any(removed.values()):
+                cleaned += 1
+                logger.info(f"[Janitor] Cleaned '{guild.name}': {removed}")
+            await asyncio.sleep(0)  # Let other tasks run between guilds
+
+        logger.info(f"[Janitor] Checked {guilds} guild(s), cleaned {cleaned}")
+
+    @janitor.before_loop
+    async def before_janitor(self):
+        await self.bot.wait_until_ready()
 
     @commands.slash_command(
         description="Check permissions for a specific user (server owner only).",
@@ -78,6 +163,7 @@ class ServerUtilities(commands.Cog):
                 """,
                 str(inter.guild.id), "welcome_message", "enabled" if enabled else "disabled"
             )
+        await notify_cache_change(inter.guild.id, "bot_settings")
 
         status = "enabled" if enabled else "disabled"
         await inter.response.send_message(
@@ -95,22 +181,7 @@ class ServerUtilities(commands.Cog):
         """Display comprehensive server statistics"""
         guild = inter.guild
         
-        # Get database stats
-        async with (await get_database_pool()).acquire() as conn:
-            # Products
-            products = await conn.fetch("SELECT product_name, stock FROM products WHERE guild_id = $1", str(guild.id))
-            
-            # Active tickets
-            active_tickets = await conn.fetchval("SELECT COUNT(*) FROM active_tickets WHERE guild_id = $1", str(guild.id))
-            
-            # Verified licenses
-            verified_licenses = await conn.fetchval("SELECT COUNT(*) FROM verified_licenses WHERE guild_id = $1", str(guild.id))
-            
-            # Auto-roles
-            auto_roles = await conn.fetch("SELECT role_type, product_name FROM auto_roles WHERE guild_id = $1", str(guild.id))
-            
-            # Custom messages
-            custom_messages = await conn.fetchval("SELECT COUNT(*) FROM custom_messages WHERE guild_id = $1", str(guild.id))
+        stats = await get_server_stats(guild.id)
 
         # Create comprehensive stats embed
         embed = disnake.Embed(
@@ -131,16 +202,12 @@ class ServerUtilities(commands.Cog):
         )
 
         # Product stats
-        if products:
-            total_stock = sum(p["stock"] for p in products if p["stock"] != -1)
-            unlimited_products = sum(1 for p in products if p["stock"] == -1)
-            sold_out = sum(1 for p in products if p["stock"] == 0)
-            
+        if stats["products"]:
             product_info = (
-                f"**Products:** {len(products)}\n"
-                f"**Total Stock:** {total_stock}\n"
-                f"**Unlimited:** {unlimited_products}\n"
-                f"**Sold Out:** {sold_out}"
+                f"**Products:** {stats['products']}\n"
+                f"**Total Stock:** {stats['total_stock']}\n"
+                f"**Unlimited:** {stats['unlimited_products']}\n"
+                f"**Sold Out:** {stats['sold_out']}"
             )
         else:
             product_info = "**Products:** 0\n*No products configured*"
@@ -155,26 +222,22 @@ class ServerUtilities(commands.Cog):
         embed.add_field(
             name="🤖 Bot Usage",
             value=(
-                f"**Active Tickets:** {active_tickets}\n"
-                f"**Verified Licenses:** {verified_licenses}\n"
-                f"**Custom Messages:** {custom_messages}\n"
-                f"**Auto-Roles:** {len(auto_roles)}"
+                f"**Active Tickets:** {stats['active_tickets']}\n"
+                f"**Verified Licenses:** {stats['verified_licenses']}\n"
+                f"**Custom Messages:** {stats['custom_messages']}\n"
+                f"**Auto-Roles:** {stats['auto_roles']}"
             ),
             inline=True
         )
 
         # Auto-role breakdown
-        if auto_roles:
-            join_roles = len([r for r in auto_roles if r["role_type"] == "join"])
-            verified_roles = len([r for r in auto_roles if r["role_type"] == "verified"])
-            product_specific = len([r for r in auto_roles if r["product_name"]])
-            
+        if stats["auto_roles"]:
             embed.add_field(
                 name="⚙️ Auto-Role Details",
                 value=(
-                    f"**Join Roles:** {join_roles}\n"
-                    f"**Verified Roles:** {verified_roles}\n"
-                    f"**Product-Specific:** {product_specific}"
+                    f"**Join Roles:** {stats['join_roles']}\n"
+                    f"**Verified Roles:** {stats['verified_roles']}\n"
+                    f"**Product-Specific:** {stats['product_specific_roles']}"
                 ),
                 inline=True
             )
@@ -226,84 +289,17 @@ class ServerUtilities(commands.Cog):
         """Clean up stale data and optimize database"""
         await inter.response.defer(ephemeral=True)
         
+        removed = await cleanup_guild_data(inter.guild)
         cleanup_results = []
-        
-        async with (await get_database_pool()).acquire() as conn:
-            # Clean up stale ticket records
-            stale_tickets = await conn.fetch(
-                "SELECT channel_id FROM active_tickets WHERE guild_id = $1",
-                str(inter.guild.id)
-            )
-            
-            removed_tickets = 0
-            for ticket in stale_tickets:
-                channel = inter.guild.get_channel(int(ticket["channel_id"]))
-                if not channel:
-                    await conn.execute(
-                        "DELETE FROM active_tickets WHERE guild_id = $1 AND channel_id = $2",
-                        str(inter.guild.id), ticket["channel_id"]
-                    )
-                    removed_tickets += 1
-            
-            if removed_tickets > 0:
-                cleanup_results.append(f"🧹 Removed {removed_tickets} stale ticket records")
 
-            # Clean up verification messages for deleted channels
-            verification_messages = await conn.fetch(
-                "SELECT message_id, channel_id FROM verification_message WHERE guild_id = $1",
-                str(inter.guild.id)
-            )
-            
-            removed_verifications = 0
-            for vm in verification_messages:
-                channel = inter.guild.get_channel(int(vm["channel_id"]))
-                if not channel:
-                    await conn.execute(
-                        "DELETE FROM verification_message WHERE guild_id = $1",
-                        str(inter.guild.id)
-                    )
-                    removed_verifications += 1
-            
-            if removed_verifications > 0:
-                cleanup_results.append(f"📝 Cleaned up {removed_verifications} verification message records")
-
-            # Clean up auto-roles for deleted roles
-            auto_roles = await conn.fetch(
-                "SELECT role_id, role_type, product_name FROM auto_roles WHERE guild_id = $1",
-                str(inter.guild.id)
-            )
-            
-            removed_auto_roles = 0
-            for ar in auto_roles:
-                role = inter.guild.get_role(int(ar["role_id"]))
-                if not role:
-                    await conn.execute(
-                        "DELETE FROM auto_roles WHERE guild_id = $1 AND role_id = $2",
-                        str(inter.guild.id), ar["role_id"]
-                    )
-                    removed_auto_roles += 1
-            
-            if removed_auto_roles > 0:
-                cleanup_results.append(f"🎭 Removed {removed_auto_roles} auto-roles for deleted roles")
-
-            # Clean up stock channels for deleted channels
-            stock_channels = await conn.fetch(
-                "SELECT channel_id, product_name FROM stock_channels WHERE guild_id = $1",
-                str(inter.guild.id)
-            )
-            
-            removed_stock_channels = 0
-            for sc in stock_channels:
-                channel = inter.guild.get_channel(int(sc["channel_id"]))
-                if not channel:
-                    await conn.execute(
-                        "DELETE FROM stock_channels WHERE guild_id = $1 AND channel_id = $2",
-                        str(inter.guild.id), sc["channel_id"]
-                    )
-                    removed_stock_channels += 1
-            
-            if removed_stock_channels > 0:
-                cleanup_results.append(f"📦 Removed {removed_stock_channels} stock channel records")
+        if removed.get("tickets"):
+            cleanup_results.append(f"🧹 Removed {removed['tickets']} stale ticket records")
+        if removed.get("verification_messages"):
+            cleanup_results.append(f"📝 Cleaned up {removed['verification_messages']} verification message records")
+        if removed.get("auto_roles"):
+            cleanup_results.append(f"🎭 Removed {removed['auto_roles']} auto-roles for deleted roles")
+        if removed.get("stock_channels"):
+            cleanup_results.append(f"📦 Removed {removed['stock_channels']} stock channel records")
 
         if cleanup_results:
             embed = disnake.Embed(
@@ -327,87 +323,48 @@ class ServerUtilities(commands.Cog):
     )
     @owner_or_permission("view_admin")
     async def export_config(self, inter: disnake.ApplicationCommandInteraction):
-        """Export server configuration for backup purposes"""
+        """Export server data for backup purposes as a gzipped NDJSON attachment"""
         await inter.response.defer(ephemeral=True)
         
-        config_data = {}
-        
-        async with (await get_database_pool()).acquire() as conn:
-            # Export products (without secrets for security)
-            products = await conn.fetch(
-                "SELECT product_name, role_id, stock FROM products WHERE guild_id = $1",
-                str(inter.guild.id)
-            )
-            config_data["products"] = [
-                {
-                    "name": p["product_name"],
-                    "role_id": p["role_id"],
-                    "stock": p["stock"]
-                } for p in products
-            ]
-            
-            # Export auto-roles
-            auto_roles = await conn.fetch(
-                "SELECT role_type, role_id, product_name FROM auto_roles WHERE guild_id = $1",
-                str(inter.guild.id)
+        export_file, counts = await export_guild_data(inter.guild.id)
+        with export_file:
+            size = export_file.seek(0, os.SEEK_END)
+            export_file.seek(0)
+
+            if size > inter.guild.filesize_limit:
+                await inter.followup.send(
+                    f"❌ The export is {size / (1024 * 1024):.1f} MB, above this server's upload limit.",
+                    ephemeral=True
+                )
+                return
+
+            # Create summary embed
+            embed = disnake.Embed(
+                title="📄 Configuration Export",
+                description="\n".join(
+                    f"**{table.replace('_', ' ').title()}:** {count:,}" for table, count in counts.items() if count
+                ) or "No data stored for this server.",
+                color=disnake.Color.blue()
             )
-            config_data["auto_roles"] = [
-                {
-                    "type": ar["role_type"],
-                    "role_id": ar["role_id"],
-                    "product": ar["product_name"]
-                } for ar in auto_roles
-            ]
             
-            # Export role permissions
-            role_perms = await conn.fetch(
-                "SELECT role_id, permission_type FROM role_permissions WHERE guild_id = $1",
-                str(inter.guild.id)
+            embed.add_field(
+                name="⚠️ Security Notice",
+                value="This export does NOT include sensitive data like product secrets or license keys for security reasons.",
+                inline=False
             )
-            config_data["role_permissions"] = [
-                {
-                    "role_id": rp["role_id"],
-                    "permission": rp["permission_type"]
-                } for rp in role_perms
-            ]
             
-            # Export bot settings
-            bot_settings = await conn.fetch(
-                "SELECT setting_name, setting_value FROM bot_settings WHERE guild_id = $1",
-                str(inter.guild.id)
+            embed.add_field(
+                name="💡 Usage",
+                value="One JSON object per line (gzip compressed), each tagged with its table. "
+                      "It can be used as a reference for server setup or migration planning.",
+                inline=False
             )
-            config_data["bot_settings"] = {
-                bs["setting_name"]: bs["setting_value"] for bs in bot_settings
-            }
-
-        # Create summary embed
-        embed = disnake.Embed(
-            title="📄 Configuration Export",
-            description=(
-                f"**Products:** {len(config_data['products'])}\n"
-                f"**Auto-Roles:** {len(config_data['auto_roles'])}\n"
-                f"**Role Permissions:** {len(config_data['role_permissions'])}\n"
-                f"**Bot Settings:** {len(config_data['bot_settings'])}"
-            ),
-            color=disnake.Color.blue()
-        )
-        
-        embed.add_field(
-            name="⚠️ Security Notice",
-            value="This export does NOT include sensitive data like product secrets or license keys for security reasons.",
-            inline=False
-        )
-        
-        embed.add_field(
-            name="💡 Usage",
-            value="This configuration can be used as a reference for server setup or migration planning.",
-            inline=False
-        )
 
-        embed.set_footer(text=f"Export generated for {inter.guild.name}")
-        embed.timestamp = inter.created_at
+            embed.set_footer(text=f"Export generated for {inter.guild.name}")
+            embed.timestamp = inter.created_at
 
-        await inter.followup.send(embed=embed, ephemeral=True)
+            filename = f"keyverify-export-{inter.guild.id}-{inter.created_at:%Y%m%d}.ndjson.gz"
+            await inter.followup.send(embed=embed, file=disnake.File(export_file, filename=filename), ephemeral=True)
 
 def setup(bot):
     bot.add_cog(ServerUtilities(bot))
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+from disnake.ext import commands
+from utils.database import get_database_pool, notify_cache_change, evict_guild_caches
+
+logger = logging.getLogger(__name__)
+
+# Deletions are collected for this long so a burst (a deleted category, a
+# message purge) becomes one statement per kind instead of one per object
+STALE_FLUSH_DELAY = 1.0
+
+# Each query takes parallel arrays of guild IDs and deleted object IDs
+CHANNEL_PURGE_SQL = """
+    WITH deleted AS (
+        SELECT * FROM unnest($1::text[], $2::text[]) AS d(guild_id, channel_id)
+    ),
+    tickets AS (
+        DELETE FROM active_tickets t USING deleted d
+        WHERE t.guild_id = d.guild_id AND t.channel_id = d.channel_id RETURNING 1
+    ),
+    ticket_boxes AS (
+        DELETE FROM ticket_boxes b USING deleted d
+        WHERE b.guild_id = d.guild_id AND b.channel_id = d.channel_id RETURNING 1
+    ),
+    verification AS (
+        DELETE FROM verification_message v USING deleted d
+        WHERE v.guild_id = d.guild_id AND v.channel_id = d.channel_id RETURNING 1
+    ),
+    stock_channels AS (
+        DELETE FROM stock_channels s USING deleted d
+        WHERE s.guild_id = d.guild_id AND s.channel_id = d.channel_id RETURNING 1
+    ),
+    log_channels AS (
+        DELETE FROM server_log_channels l USING deleted d
+        WHERE l.guild_id = d.guild_id AND l.channel_id = d.channel_id RETURNING 1
+    ),
+    review_channels AS (
+        DELETE FROM review_settings r USING deleted d
+        WHERE r.guild_id = d.guild_id AND r.review_channel_id = d.channel_id RETURNING 1
+    )
+    SELECT
+        (SELECT COUNT(*) FROM tickets) AS tickets,
+        (SELECT COUNT(*) FROM ticket_boxes) AS ticket_boxes,
+        (SELECT COUNT(*) FROM verification) AS verification_messages,
+        (SELECT COUNT(*) FROM stock_channels) AS stock_channels,
+        (SELECT COUNT(*) FROM log_channels) AS log_channels,
+        (SELECT COUNT(*) FROM review_channels) AS review_channels
+"""
+
+ROLE_PURGE_SQL = """
+    WITH deleted AS (
+        SELECT * FROM unnest($1::text[], $2::text[]) AS d(guild_id, role_id)
+    ),
+    auto_roles AS (
+        DELETE FROM auto_roles a USING deleted d
+        WHERE a.guild_id = d.guild_id AND a.role_id = d.role_id RETURNING a.guild_id
+    ),
+    permissions AS (
+        DELETE FROM role_permissions p USING deleted d
+        WHERE p.guild_id = d.guild_id AND p.role_id = d.role_id RETURNING p.guild_id
+    )
+    SELECT
+        ARRAY(SELECT DISTINCT guild_id FROM auto_roles) AS auto_role_guilds,
+        ARRAY(SELECT DISTINCT guild_id FROM permissions) AS permission_guilds
+"""
+
+MESSAGE_PURGE_SQL = """
+    WITH deleted AS (
+        SELECT * FROM unnest($1::text[], $2::text[]) AS d(guild_id, message_id)
+    ),
+    ticket_boxes AS (
+        DELETE FROM ticket_boxes b USING deleted d
+        WHERE b.guild_id = d.guild_id AND b.message_id = d.message_id RETURNING 1
+    ),
+    verification AS (
+        DELETE FROM verification_message v USING deleted d
+        WHERE v.guild_id = d.guild_id AND v.message_id = d.message_id RETURNING 1
+    ),
+    stock_monitors AS (
+        -- The stock channel stays; its monitor message gets reposted
+        UPDATE stock_channels s SET message_id = NULL FROM deleted d
+        WHERE s.guild_id = d.guild_id AND s.message_id = d.message_id RETURNING 1
+    )
+    SELECT
+        (SELECT COUNT(*) FROM ticket_boxes) AS ticket_boxes,
+        (SELECT COUNT(*) FROM verification) AS verification_messages,
+        (SELECT COUNT(*) FROM stock_monitors) AS stock_monitors
+"""
+
+# Rows that only mean something while the bot is in the guild. Products,
+# licenses, sales and settings are kept in case the bot is invited back.
+GUILD_PURGE_SQL = """
+    WITH tickets AS (DELETE FROM active_tickets WHERE guild_id = $1 RETURNING 1),
+    ticket_boxes AS (DELETE FROM ticket_boxes WHERE guild_id = $1 RETURNING 1),
+    verification AS (DELETE FROM verification_message WHERE guild_id = $1 RETURNING 1),
+    stock_channels AS (DELETE FROM stock_channels WHERE guild_id = $1 RETURNING 1)
+    SELECT
+        (SELECT COUNT(*) FROM tickets) AS tickets,
+        (SELECT COUNT(*) FROM ticket_boxes) AS ticket_boxes,
+        (SELECT COUNT(*) FROM verification) AS verification_messages,
+        (SELECT COUNT(*) FROM stock_channels) AS stock_channels
+"""
+
+class StaleDataListener(commands.Cog):
+    """Removes rows pointing at channels, roles and messages as soon as they're deleted"""
+    def __init__(self, bot):
+        self.bot = bot
+        self.pending = {"channel": set(), "role": set(), "message": set()}
+        self.flush_task = None
+
+    def cog_unload(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+
+    def queue_deletion(self, kind, guild_id, object_ids):
+        self.pending[kind].update((str(guild_id), str(object_id)) for object_id in object_ids)
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Purge everything queued, one statement per kind"""
+        while any(self.pending.values()):
+            await asyncio.sleep(STALE_FLUSH_DELAY)
+            pending = self.pending
+            self.pending = {kind: set() for kind in pending}
+
+            try:
+                async with (await get_database_pool()).acquire() as conn:
+                    if pending["channel"]:
+                        await self.purge(conn, CHANNEL_PURGE_SQL, pending["channel"], "channel")
+                    if pending["role"]:
+                        await self.purge_roles(conn, pending["role"])
+                    if pending["message"]:
+                        await self.purge(conn, MESSAGE_PURGE_SQL, pending["message"], "message")
+            except Exception as e:
+                logger.error(f"[Stale Data] Failed to purge deleted objects: {e}")
+
+    async def purge(self, conn, sql, pairs, kind):
+        guild_ids, object_ids = zip(*pairs)
+        counts = await conn.fetchrow(sql, list(guild_ids), list(object_ids))
+        removed = {name: count for name, count in counts.items() if count}
+        if removed:
+            logger.info(f"[Stale Data] {len(pairs)} deleted {kind}(s): {removed}")
+
+    async def purge_roles(self, conn, pairs):
+        guild_ids, role_ids = zip(*pairs)
+        row = await conn.fetchrow(ROLE_PURGE_SQL, list(guild_ids), list(role_ids))
+        for guild_id in row["auto_role_guilds"]:
+            await notify_cache_change(guild_id, "auto_roles", conn=conn)
+        for guild_id in row["permission_guilds"]:
+            await notify_cache_change(guild_id, "role_permissions", conn=conn)
+        if row["auto_role_guilds"] or row["permission_guilds"]:
+            logger.info(f"[Stale Data] Removed auto-roles/permissions of {len(pairs)} deleted role(s)")
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.queue_deletion("channel", channel.guild.id, [channel.id])
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        self.queue_deletion("role", role.guild.id, [role.id])
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        if payload.guild_id:
+            self.queue_deletion("message", payload.guild_id, [payload.message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        if payload.guild_id:
+            self.queue_deletion("message", payload.guild_id, payload.message_ids)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        evict_guild_caches(guild.id)
+        try:
+            async with (await get_database_pool()).acquire() as conn:
+                counts = await conn.fetchrow(GUILD_PURGE_SQL, str(guild.id))
+            logger.info(f"[Stale Data] Left '{guild.name}', removed {dict(counts)}")
+        except Exception as e:
+            logger.error(f"[Stale Data] Failed to clean up after leaving '{guild.name}': {e}")
+
+def setup(bot):
+    bot.add_cog(StaleDataListener(bot))
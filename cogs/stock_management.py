@@ -1,38 +1,58 @@
+import asyncio
+import time
+from collections import deque
 import disnake
 from disnake.ext import commands
-from utils.database import get_database_pool, fetch_products
+from utils.database import get_database_pool, fetch_products, notify_cache_change
 import config
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Discord allows 2 channel renames per channel every 10 minutes
+CHANNEL_RENAME_LIMIT = 2
+CHANNEL_RENAME_WINDOW = 600
+# Wait this long after a stock change so bursts collapse into one update
+STOCK_UPDATE_DEBOUNCE = 2
+
+def stock_channel_name(product_name, stock):
+    """Channel name showing a product's stock"""
+    slug = product_name.lower().replace(' ', '-')
+    if stock == -1:
+        return f"♾️┃{slug}"
+    if stock == 0:
+        return f"🔴┃sold-out-{slug}"
+    return f"📦┃{stock}-{slug}"
+
+def stock_monitor_embed(product_name, stock, updated_at):
+    """The info embed posted in a stock channel"""
+    embed = disnake.Embed(
+        title=f"📊 {product_name} - Stock Monitor",
+        description=(
+            "This channel displays the current stock level for this product.\n\n"
+            f"**Current Stock:** {stock if stock != -1 else 'Unlimited'}\n"
+            f"**Last Updated:** <t:{int(updated_at.timestamp())}:F>\n\n"
+            "*This channel updates automatically when stock changes.*"
+        ),
+        color=disnake.Color.green() if stock > 0 or stock == -1 else disnake.Color.red()
+    )
+    embed.set_footer(text="Stock management powered by KeyVerify")
+    return embed
+
 class StockManagement(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        # Schedule the database table creation as a background task after the bot is ready
-        self.bot.loop.create_task(self.setup_table())
+        # (guild_id, product_name) -> latest stock waiting to be shown
+        self.pending_stock = {}
+        self.latest_stock = {}
+        self.rename_history = {}  # channel_id -> deque of rename times
+        self.deferred_renames = set()
+        self.stock_update_event = asyncio.Event()
+        self.stock_updater = self.bot.loop.create_task(self.stock_channel_worker())
+
+    def cog_unload(self):
+        self.stock_updater.cancel()
         
-    async def setup_table(self):
-        """Ensures the required tables exist for stock management"""
-        await self.bot.wait_until_ready()
-        async with (await get_database_pool()).acquire() as conn:
-            # Add stock column to products table
-            await conn.execute("""
-                ALTER TABLE products 
-                ADD COLUMN IF NOT EXISTS stock INTEGER DEFAULT -1
-            """)
-            
-            # Table for stock display channels
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS stock_channels (
-                    guild_id TEXT NOT NULL,
-                    product_name TEXT NOT NULL,
-                    channel_id TEXT NOT NULL,
-                    category_id TEXT,
-                    PRIMARY KEY (guild_id, product_name)
-                );
-            """)
-
     @commands.slash_command(
         description="Set the stock amount for a product (server owner only). Use -1 for unlimited stock.",
         default_member_permissions=disnake.Permissions(manage_guild=True),
@@ -72,6 +92,7 @@ class StockManagement(commands.Cog):
                 "UPDATE products SET stock = $1 WHERE guild_id = $2 AND product_name = $3",
                 amount, str(inter.guild.id), product_name
             )
+        await notify_cache_change(inter.guild.id, "products")
 
         stock_display = "Unlimited" if amount == -1 else str(amount)
         await inter.response.send_message(
@@ -80,7 +101,7 @@ class StockManagement(commands.Cog):
             delete_after=config.message_timeout
         )
 
-        # Update stock channel if it exists
+        # Queue a stock channel update if it exists
         await self.update_stock_channel(inter.guild.id, product_name, amount)
         logger.info(f"[Stock Set] {inter.author} set stock for '{product_name}' to {amount} in '{inter.guild.name}'")
 
@@ -104,38 +125,35 @@ class StockManagement(commands.Cog):
             return
 
         async with (await get_database_pool()).acquire() as conn:
-            # Get current stock
-            product = await conn.fetchrow(
-                "SELECT stock FROM products WHERE guild_id = $1 AND product_name = $2",
-                str(inter.guild.id), product_name
+            # Adjust in one statement so concurrent changes can't overwrite each other
+            new_stock = await conn.fetchval(
+                """
+                UPDATE products
+                SET stock = CASE WHEN stock = -1 THEN -1 ELSE GREATEST(0, stock + $1) END
+                WHERE guild_id = $2 AND product_name = $3
+                RETURNING stock
+                """,
+                change, str(inter.guild.id), product_name
             )
             
-            if not product:
-                await inter.response.send_message(
-                    f"❌ Product '{product_name}' not found.",
-                    ephemeral=True,
-                    delete_after=config.message_timeout
-                )
-                return
-
-            current_stock = product["stock"]
-            
-            # Can't adjust unlimited stock
-            if current_stock == -1:
-                await inter.response.send_message(
-                    f"❌ Cannot adjust unlimited stock. Use `/set_stock` instead.",
-                    ephemeral=True,
-                    delete_after=config.message_timeout
-                )
-                return
+        if new_stock is None:
+            await inter.response.send_message(
+                f"❌ Product '{product_name}' not found.",
+                ephemeral=True,
+                delete_after=config.message_timeout
+            )
+            return
 
-            new_stock = max(0, current_stock + change)
-            
-            # Update stock
-            await conn.execute(
-                "UPDATE products SET stock = $1 WHERE guild_id = $2 AND product_name = $3",
-                new_stock, str(inter.guild.id), product_name
+        # Can't adjust unlimited stock
+        if new_stock == -1:
+            await inter.response.send_message(
+                f"❌ Cannot adjust unlimited stock. Use `/set_stock` instead.",
+                ephemeral=True,
+                delete_after=config.message_timeout
             )
+            return
+
+        await notify_cache_change(inter.guild.id, "products")
 
         change_text = f"+{change}" if change > 0 else str(change)
         await inter.response.send_message(
@@ -144,7 +162,7 @@ class StockManagement(commands.Cog):
             delete_after=config.message_timeout
         )
 
-        # Update stock channel if it exists
+        # Queue a stock channel update if it exists
         await self.update_stock_channel(inter.guild.id, product_name, new_stock)
         logger.info(f"[Stock Adjusted] {inter.author} adjusted '{product_name}' stock by {change} in '{inter.guild.name}'")
 
@@ -259,12 +277,7 @@ class StockManagement(commands.Cog):
             stock = product["stock"]
             
             # Create channel name based on stock
-            if stock == -1:
-                channel_name = f"♾️┃{product_name.lower().replace(' ', '-')}"
-            elif stock == 0:
-                channel_name = f"🔴┃sold-out-{product_name.lower().replace(' ', '-')}"
-            else:
-                channel_name = f"📦┃{stock}-{product_name.lower().replace(' ', '-')}"
+            channel_name = stock_channel_name(product_name, stock)
 
             # Set up permissions (private channel)
             overwrites = {
@@ -287,30 +300,19 @@ class StockManagement(commands.Cog):
                     reason=f"Stock display channel for {product_name}"
                 )
 
-                # Save to database
+                # Send info message to the channel
+                message = await channel.send(embed=stock_monitor_embed(product_name, stock, inter.created_at))
+
+                # Save to database, keeping the message so updates can edit it directly
                 await conn.execute(
                     """
-                    INSERT INTO stock_channels (guild_id, product_name, channel_id, category_id)
-                    VALUES ($1, $2, $3, $4)
+                    INSERT INTO stock_channels (guild_id, product_name, channel_id, category_id, message_id)
+                    VALUES ($1, $2, $3, $4, $5)
                     """,
-                    str(inter.guild.id), product_name, str(channel.id), str(category.id) if category else None
+                    str(inter.guild.id), product_name, str(channel.id), str(category.id) if category else None,
+                    str(message.id)
                 )
 
-                # Send info message to the channel
-                embed = disnake.Embed(
-                    title=f"📊 {product_name} - Stock Monitor",
-                    description=(
-                        "This channel displays the current stock level for this product.\n\n"
-                        f"**Current Stock:** {stock if stock != -1 else 'Unlimited'}\n"
-                        f"**Last Updated:** <t:{int(inter.created_at.timestamp())}:F>\n\n"
-                        "*This channel updates automatically when stock changes.*"
-                    ),
-                    color=disnake.Color.green() if stock > 0 or stock == -1 else disnake.Color.red()
-                )
-                embed.set_footer(text="Stock management powered by KeyVerify")
-                
-                await channel.send(embed=embed)
-
                 await inter.response.send_message(
                     f"✅ Stock channel created: {channel.mention}",
                     ephemeral=True,
@@ -384,10 +386,75 @@ class StockManagement(commands.Cog):
                 )
 
     async def update_stock_channel(self, guild_id, product_name, new_stock):
-        """Updates the stock display channel name and embed when stock changes"""
+        """Queue a stock channel refresh; bursts for the same product are coalesced"""
+        key = (str(guild_id), product_name)
+        self.pending_stock[key] = new_stock
+        self.latest_stock[key] = new_stock
+        self.stock_update_event.set()
+
+    async def stock_channel_worker(self):
+        """Applies queued stock channel updates in the background"""
+        await self.bot.wait_until_ready()
+        while True:
+            await self.stock_update_event.wait()
+            await asyncio.sleep(STOCK_UPDATE_DEBOUNCE)
+            self.stock_update_event.clear()
+
+            pending, self.pending_stock = self.pending_stock, {}
+            for key, new_stock in pending.items():
+                guild_id, product_name = key
+                try:
+                    await self.apply_stock_channel_update(guild_id, product_name, new_stock)
+                except Exception as e:
+                    logger.error(f"[Stock Channel Update Error] Failed to update stock channel: {e}")
+
+                # Keep the value only while a newer update or a deferred rename still needs it
+                if key not in self.pending_stock and key not in self.deferred_renames:
+                    self.latest_stock.pop(key, None)
+
+            self.prune_rename_history()
+
+    def rename_delay(self, channel_id):
+        """Seconds until the channel may be renamed again (0 if it can be renamed now)"""
+        history = self.rename_history.get(channel_id)
+        if not history:
+            return 0
+        now = time.monotonic()
+        while history and now - history[0] >= CHANNEL_RENAME_WINDOW:
+            history.popleft()
+        if len(history) < CHANNEL_RENAME_LIMIT:
+            return 0
+        return CHANNEL_RENAME_WINDOW - (now - history[0])
+
+    def record_rename(self, channel_id):
+        self.rename_history.setdefault(channel_id, deque(maxlen=CHANNEL_RENAME_LIMIT)).append(time.monotonic())
+
+    def prune_rename_history(self):
+        """Forget channels whose last rename is outside the rename window"""
+        now = time.monotonic()
+        for channel_id, history in list(self.rename_history.items()):
+            if not history or now - history[-1] >= CHANNEL_RENAME_WINDOW:
+                del self.rename_history[channel_id]
+
+    def defer_rename(self, key, delay):
+        """Re-queue a product once the channel's rename budget frees up"""
+        if key in self.deferred_renames:
+            return
+        self.deferred_renames.add(key)
+
+        def requeue():
+            self.deferred_renames.discard(key)
+            if key not in self.pending_stock and key in self.latest_stock:
+                self.pending_stock[key] = self.latest_stock[key]
+                self.stock_update_event.set()
+
+        asyncio.get_running_loop().call_later(delay, requeue)
+
+    async def apply_stock_channel_update(self, guild_id, product_name, new_stock):
+        """Updates the stock display channel name and embed"""
         async with (await get_database_pool()).acquire() as conn:
             stock_channel_data = await conn.fetchrow(
-                "SELECT channel_id FROM stock_channels WHERE guild_id = $1 AND product_name = $2",
+                "SELECT channel_id, message_id FROM stock_channels WHERE guild_id = $1 AND product_name = $2",
                 str(guild_id), product_name
             )
             
@@ -407,41 +474,40 @@ class StockManagement(commands.Cog):
                 )
                 return
 
-            # Update channel name
-            if new_stock == -1:
-                new_name = f"♾️┃{product_name.lower().replace(' ', '-')}"
-            elif new_stock == 0:
-                new_name = f"🔴┃sold-out-{product_name.lower().replace(' ', '-')}"
-            else:
-                new_name = f"📦┃{new_stock}-{product_name.lower().replace(' ', '-')}"
-
-            try:
-                if channel.name != new_name:
+        try:
+            # Update channel name within the rename budget
+            new_name = stock_channel_name(product_name, new_stock)
+            if channel.name != new_name:
+                delay = self.rename_delay(channel.id)
+                if delay:
+                    self.defer_rename((str(guild_id), product_name), delay)
+                else:
+                    self.record_rename(channel.id)
                     await channel.edit(name=new_name)
 
-                # Update the embed in the channel
-                embed = disnake.Embed(
-                    title=f"📊 {product_name} - Stock Monitor",
-                    description=(
-                        "This channel displays the current stock level for this product.\n\n"
-                        f"**Current Stock:** {new_stock if new_stock != -1 else 'Unlimited'}\n"
-                        f"**Last Updated:** <t:{int(disnake.utils.utcnow().timestamp())}:F>\n\n"
-                        "*This channel updates automatically when stock changes.*"
-                    ),
-                    color=disnake.Color.green() if new_stock > 0 or new_stock == -1 else disnake.Color.red()
-                )
-                embed.set_footer(text="Stock management powered by KeyVerify")
-                
-                # Try to edit the first message (the stock info message)
-                async for message in channel.history(limit=10, oldest_first=True):
-                    if message.author == guild.me and message.embeds:
-                        await message.edit(embed=embed)
-                        break
-
-            except disnake.Forbidden:
-                logger.warning(f"[Stock Channel Update Failed] No permission to update stock channel for '{product_name}' in '{guild.name}'")
-            except Exception as e:
-                logger.error(f"[Stock Channel Update Error] Failed to update stock channel: {e}")
+            # Update the embed in the channel
+            embed = stock_monitor_embed(product_name, new_stock, disnake.utils.utcnow())
+            message_id = stock_channel_data["message_id"]
+            if message_id:
+                try:
+                    await channel.get_partial_message(int(message_id)).edit(embed=embed)
+                    return
+                except disnake.NotFound:
+                    pass
+
+            # Older channels have no stored message; find it once and remember it
+            async for message in channel.history(limit=10, oldest_first=True):
+                if message.author == guild.me and message.embeds:
+                    await message.edit(embed=embed)
+                    async with (await get_database_pool()).acquire() as conn:
+                        await conn.execute(
+                            "UPDATE stock_channels SET message_id = $1 WHERE guild_id = $2 AND product_name = $3",
+                            str(message.id), str(guild_id), product_name
+                        )
+                    break
+
+        except disnake.Forbidden:
+            logger.warning(f"[Stock Channel Update Failed] No permission to update stock channel for '{product_name}' in '{guild.name}'")
 
 def setup(bot):
     bot.add_cog(StockManagement(bot))
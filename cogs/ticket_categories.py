@@ -11,23 +11,7 @@ logger = logging.getLogger(__name__)
 class TicketCategories(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.bot.loop.create_task(self.setup_table())
         
-    async def setup_table(self):
-        """Creates table for storing custom ticket categories"""
-        await self.bot.wait_until_ready()
-        async with (await get_database_pool()).acquire() as conn:
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS ticket_categories (
-                    guild_id TEXT NOT NULL,
-                    category_name TEXT NOT NULL,
-                    category_description TEXT NOT NULL,
-                    display_order INTEGER NOT NULL DEFAULT 0,
-                    emoji TEXT DEFAULT '🎫',
-                    PRIMARY KEY (guild_id, category_name)
-                );
-            """)
-
     @commands.slash_command(
         description="Add a custom ticket category (server owner only).",
         default_member_permissions=disnake.Permissions(manage_guild=True),
@@ -1,38 +1,16 @@
 import disnake
 from disnake.ext import commands
-from utils.database import get_database_pool, fetch_products_with_stock
+from utils.database import get_database_pool
+from utils.templates import render_template
 import config
 import logging
-import re
 
 logger = logging.getLogger(__name__)
 
 class TicketCustomization(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.bot.loop.create_task(self.setup_table())
         
-    async def setup_table(self):
-        """Creates table for storing custom ticket box settings"""
-        await self.bot.wait_until_ready()
-        async with (await get_database_pool()).acquire() as conn:
-            await conn.execute("""
-                CREATE TABLE IF NOT EXISTS ticket_customization (
-                    guild_id TEXT PRIMARY KEY,
-                    title TEXT DEFAULT 'Support Tickets',
-                    description TEXT DEFAULT 'Need help with one of our products? Click the button below to create a support ticket!
-
-**What happens next?**
-• Select the product you need help with
-• A private channel will be created for you
-• Provide your license key for verification
-• Get personalized support from our team',
-                    button_text TEXT DEFAULT 'Create Ticket',
-                    button_emoji TEXT DEFAULT '🎫',
-                    show_stock_info BOOLEAN DEFAULT TRUE
-                );
-            """)
-
     @commands.slash_command(
         description="Customize the ticket box appearance and text (server owner only).",
         default_member_permissions=disnake.Permissions(manage_guild=True),
@@ -168,64 +146,9 @@ class TicketCustomization(commands.Cog):
             ephemeral=True
         )
 
-async def parse_variables(text: str, guild, products_data=None) -> str:
+async def parse_variables(text: str, guild) -> str:
     """Parse variables in text and replace with actual values"""
-    if not text:
-        return text
-
-    # Get products data if not provided
-    if products_data is None:
-        products_data = await fetch_products_with_stock(str(guild.id))
-    
-    # Server variables
-    text = text.replace("{SERVER_NAME}", guild.name)
-    text = text.replace("{SERVER_MEMBER_COUNT}", str(guild.member_count))
-    text = text.replace("{SERVER_OWNER}", guild.owner.mention if guild.owner else "Unknown")
-    
-    # Date/time variables
-    from datetime import datetime
-    now = datetime.now()
-    text = text.replace("{CURRENT_DATE}", now.strftime("%B %d, %Y"))
-    text = text.replace("{CURRENT_TIME}", now.strftime("%H:%M"))
-    
-    # Product variables
-    text = text.replace("{PRODUCT_COUNT}", str(len(products_data)))
-    
-    total_stock = sum(data["stock"] for data in products_data.values() if data["stock"] != -1)
-    unlimited_count = sum(1 for data in products_data.values() if data["stock"] == -1)
-    
-    if unlimited_count > 0:
-        text = text.replace("{TOTAL_STOCK}", f"{total_stock} + {unlimited_count} unlimited")
-    else:
-        text = text.replace("{TOTAL_STOCK}", str(total_stock))
-    
-    products_in_stock = sum(1 for data in products_data.values() if data["stock"] != 0)
-    text = text.replace("{PRODUCTS_IN_STOCK}", str(products_in_stock))
-    
-    products_sold_out = sum(1 for data in products_data.values() if data["stock"] == 0)
-    text = text.replace("{PRODUCTS_SOLD_OUT}", str(products_sold_out))
-    
-    # Product-specific stock variables: {ProductName.STOCK}
-    stock_pattern = r'\{([^}]+)\.STOCK\}'
-    matches = re.finditer(stock_pattern, text)
-    
-    for match in matches:
-        var_name = match.group(0)  # Full match like {ProductName.STOCK}
-        product_name = match.group(1).replace("_", " ")  # Product name with spaces restored
-        
-        if product_name in products_data:
-            stock = products_data[product_name]["stock"]
-            if stock == -1:
-                stock_text = "Unlimited"
-            elif stock == 0:
-                stock_text = "SOLD OUT"
-            else:
-                stock_text = str(stock)
-            text = text.replace(var_name, stock_text)
-        else:
-            text = text.replace(var_name, "N/A")
-    
-    return text
+    return await render_template(text, guild)
 
 class CustomizeTicketModal(disnake.ui.Modal):
     def __init__(self, current_settings=None):
@@ -310,8 +233,7 @@ class CustomizeTicketModal(disnake.ui.Modal):
             )
 
         # Show preview
-        products_data = await fetch_products_with_stock(str(interaction.guild.id))
-        parsed_description = await parse_variables(description, interaction.guild, products_data)
+        parsed_description = await parse_variables(description, interaction.guild)
         
         embed = disnake.Embed(
             title=title,
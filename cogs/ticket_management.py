@@ -1,86 +1,142 @@
 import disnake
 from disnake.ext import commands
-from utils.database import get_database_pool
+from utils.database import get_database_pool, TICKET_RESERVATION_GRACE
 import config
 import logging
 import asyncio
 
 logger = logging.getLogger(__name__)
 
-class TicketManagement(commands.Cog):
-    def __init__(self, bot):
-        self.bot = bot
+TICKETS_PER_PAGE = 10
 
-    @commands.slash_command(
-        description="List all active tickets in the server (server owner/moderators only).",
-        default_member_permissions=disnake.Permissions(manage_channels=True),
-    )
-    async def list_tickets(self, inter: disnake.ApplicationCommandInteraction):
-        """Lists all active tickets in the server"""
-        async with (await get_database_pool()).acquire() as conn:
-            tickets = await conn.fetch(
+async def fetch_ticket_page(guild, before=None):
+    """Up to TICKETS_PER_PAGE tickets numbered below `before` (newest first), and whether more follow
+
+    Rows whose channel is gone are purged in one statement per chunk read;
+    rows still inside the reservation grace period are just skipped.
+    """
+    tickets = []
+    async with (await get_database_pool()).acquire() as conn:
+        while len(tickets) < TICKETS_PER_PAGE:
+            rows = await conn.fetch(
                 """
-                SELECT channel_id, user_id, product_name, ticket_number, created_at
-                FROM active_tickets 
-                WHERE guild_id = $1 
+                SELECT channel_id, user_id, product_name, ticket_number, created_at,
+                       created_at < CURRENT_TIMESTAMP - make_interval(secs => $4) AS settled
+                FROM active_tickets
+                WHERE guild_id = $1 AND ($2::int IS NULL OR ticket_number < $2)
                 ORDER BY ticket_number DESC
+                LIMIT $3
                 """,
-                str(inter.guild.id)
+                str(guild.id), before, TICKETS_PER_PAGE + 1, TICKET_RESERVATION_GRACE
             )
-            
-        if not tickets:
-            await inter.response.send_message(
-                "📋 No active tickets found in this server.",
-                ephemeral=True,
-                delete_after=config.message_timeout
+
+            # The extra row only tells us whether anything follows this chunk
+            more = len(rows) > TICKETS_PER_PAGE
+            stale = []
+            for row in rows[:TICKETS_PER_PAGE]:
+                if len(tickets) == TICKETS_PER_PAGE:
+                    more = True
+                    break
+                before = row["ticket_number"]
+                if guild.get_channel(int(row["channel_id"])):
+                    tickets.append(row)
+                elif row["settled"]:
+                    stale.append(row["channel_id"])
+
+            if stale:
+                await conn.execute(
+                    "DELETE FROM active_tickets WHERE guild_id = $1 AND channel_id = ANY($2::text[])",
+                    str(guild.id), stale
+                )
+
+            if not more:
+                return tickets, False
+
+    return tickets, True
+
+class TicketListView(disnake.ui.View):
+    """Pages through active tickets with keyset pagination on ticket_number"""
+    def __init__(self, author_id, guild):
+        super().__init__(timeout=300)
+        self.author_id = author_id
+        self.guild = guild
+        self.page_starts = [None]  # `before` cursor of every page visited so far
+        self.has_next = False
+
+    async def interaction_check(self, inter):
+        return inter.author.id == self.author_id
+
+    async def load_page(self):
+        tickets, self.has_next = await fetch_ticket_page(self.guild, self.page_starts[-1])
+        if tickets and self.has_next:
+            self.next_cursor = tickets[-1]["ticket_number"]
+        self.previous_page.disabled = len(self.page_starts) == 1
+        self.next_page.disabled = not self.has_next
+        return tickets
+
+    async def build_embed(self, tickets):
+        async with (await get_database_pool()).acquire() as conn:
+            total = await conn.fetchval("SELECT COUNT(*) FROM active_tickets WHERE guild_id = $1", str(self.guild.id))
+
+        ticket_list = []
+        for ticket in tickets:
+            channel = self.guild.get_channel(int(ticket["channel_id"]))
+            user = self.guild.get_member(int(ticket["user_id"]))
+            user_display = user.display_name if user else "Unknown User"
+            product = ticket["product_name"] or "General Support"
+            created = f"<t:{int(ticket['created_at'].timestamp())}:R>"
+
+            ticket_list.append(
+                f"**#{ticket['ticket_number']:04d}** - {channel.mention}\n"
+                f"└ User: {user_display} | Product: {product} | Created: {created}"
             )
-            return
 
         embed = disnake.Embed(
             title="🎫 Active Tickets",
+            description="\n\n".join(ticket_list) or "No tickets on this page.",
             color=disnake.Color.blurple()
         )
+        embed.set_footer(text=f"Page {len(self.page_starts)} | Total: {total} active tickets")
+        return embed
 
-        ticket_list = []
-        for ticket in tickets:
-            channel = inter.guild.get_channel(int(ticket["channel_id"]))
-            user = inter.guild.get_member(int(ticket["user_id"]))
-            
-            if channel:  # Only show if channel still exists
-                channel_mention = channel.mention
-                user_display = user.display_name if user else "Unknown User"
-                product = ticket["product_name"] or "General Support"
-                created = f"<t:{int(ticket['created_at'].timestamp())}:R>"
-                
-                ticket_list.append(
-                    f"**#{ticket['ticket_number']:04d}** - {channel_mention}\n"
-                    f"└ User: {user_display} | Product: {product} | Created: {created}"
-                )
-            else:
-                # Clean up stale ticket records
-                async with (await get_database_pool()).acquire() as conn:
-                    await conn.execute(
-                        "DELETE FROM active_tickets WHERE guild_id = $1 AND channel_id = $2",
-                        str(inter.guild.id), ticket["channel_id"]
-                    )
-
-        if not ticket_list:
+    async def show_page(self, inter):
+        tickets = await self.load_page()
+        await inter.response.edit_message(embed=await self.build_embed(tickets), view=self)
+
+    @disnake.ui.button(label="◀ Previous", style=disnake.ButtonStyle.secondary)
+    async def previous_page(self, button, inter):
+        if len(self.page_starts) > 1:
+            self.page_starts.pop()
+        await self.show_page(inter)
+
+    @disnake.ui.button(label="Next ▶", style=disnake.ButtonStyle.secondary)
+    async def next_page(self, button, inter):
+        if self.has_next:
+            self.page_starts.append(self.next_cursor)
+        await self.show_page(inter)
+
+class TicketManagement(commands.Cog):
+    def __init__(self, bot):
+        self.bot = bot
+
+    @commands.slash_command(
+        description="List all active tickets in the server (server owner/moderators only).",
+        default_member_permissions=disnake.Permissions(manage_channels=True),
+    )
+    async def list_tickets(self, inter: disnake.ApplicationCommandInteraction):
+        """Lists active tickets in the server, a page at a time"""
+        view = TicketListView(inter.author.id, inter.guild)
+        tickets = await view.load_page()
+
+        if not tickets:
             await inter.response.send_message(
-                "📋 No active tickets found (cleaned up stale records).",
+                "📋 No active tickets found in this server.",
                 ephemeral=True,
                 delete_after=config.message_timeout
             )
             return
 
-        # Split into pages if too long
-        description = "\n\n".join(ticket_list)
-        if len(description) > 4096:
-            description = description[:4093] + "..."
-            
-        embed.description = description
-        embed.set_footer(text=f"Total: {len(ticket_list)} active tickets")
-
-        await inter.response.send_message(embed=embed, ephemeral=True)
+        await inter.response.send_message(embed=await view.build_embed(tickets), view=view, ephemeral=True)
 
     @commands.slash_command(
         description="Force close a ticket by ticket number (server owner only).",
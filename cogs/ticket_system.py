@@ -3,8 +3,8 @@
 import disnake
 from disnake.ext import commands
 
-from utils.database import get_database_pool, fetch_products
-from handlers.ticket_handler import create_ticket_embed, create_ticket_view, fetch_ticket_categories
+from utils.database import get_database_pool, fetch_product_names
+from handlers.ticket_handler import create_ticket_embed, create_ticket_view, fetch_ticket_categories, fetch_ticket_customization
 import config
 import logging
 import asyncio
@@ -36,7 +36,7 @@ class TicketSystem(commands.Cog):
                 "SELECT category_name FROM ticket_categories WHERE guild_id = $1",
                 str(inter.guild.id)
             )
-            products = await fetch_products(str(inter.guild.id))
+            products = await fetch_product_names(str(inter.guild.id))
 
         # Create embed with custom text support
         embed = await create_ticket_embed(inter.guild)
@@ -123,9 +123,11 @@ class TicketSystem(commands.Cog):
 
         updated_count = 0
         failed_count = 0
+        stale_message_ids = []
 
-        # Create new embed and view
-        embed = await create_ticket_embed(inter.guild)
+        # Render the embed and button once for every box
+        custom = await fetch_ticket_customization(inter.guild.id)
+        embed = await create_ticket_embed(inter.guild, custom)
 
         for box in boxes:
             try:
@@ -133,20 +135,22 @@ class TicketSystem(commands.Cog):
                 if not channel:
                     continue
 
-                message = await channel.fetch_message(int(box["message_id"]))
                 view = create_ticket_view(str(inter.guild.id))
-                await view.setup_button(inter.guild)
-                await message.edit(embed=embed, view=view)
+                view.apply_customization(custom)
+                await channel.get_partial_message(int(box["message_id"])).edit(embed=embed, view=view)
                 updated_count += 1
 
             except (disnake.NotFound, disnake.Forbidden):
                 failed_count += 1
-                # Clean up stale records
-                async with (await get_database_pool()).acquire() as conn:
-                    await conn.execute(
-                        "DELETE FROM ticket_boxes WHERE guild_id = $1 AND message_id = $2",
-                        str(inter.guild.id), box["message_id"]
-                    )
+                stale_message_ids.append(box["message_id"])
+
+        # Clean up stale records
+        if stale_message_ids:
+            async with (await get_database_pool()).acquire() as conn:
+                await conn.execute(
+                    "DELETE FROM ticket_boxes WHERE guild_id = $1 AND message_id = ANY($2)",
+                    str(inter.guild.id), stale_message_ids
+                )
 
         result_msg = f"✅ Updated {updated_count} ticket box(es)."
         if failed_count > 0:
@@ -426,7 +430,7 @@ class TicketTypeView(disnake.ui.View):
 
     async def show_product_selection(self, button_inter):
         """Show product selection for category assignment"""
-        products = await fetch_products(str(self.guild.id))
+        products = await fetch_product_names(str(self.guild.id))
         
         if not products:
             await button_inter.response.send_message(
@@ -441,7 +445,7 @@ class TicketTypeView(disnake.ui.View):
                 value=product_name,
                 description=f"Set Discord category for {product_name} tickets"
             )
-            for product_name in products.keys()
+            for product_name in products
         ][:25]
 
         dropdown = disnake.ui.StringSelect(
@@ -1,9 +1,15 @@
 # Updated handlers/ticket_handler.py with payment method dropdown for tickets
 
+import asyncpg
 import disnake
 from disnake.ext.commands import CooldownMapping, BucketType
-from utils.database import fetch_products, get_database_pool
+from utils.database import (
+    fetch_products, get_active_ticket_channel, get_database_pool,
+    get_product_catalog, TICKET_RESERVATION_GRACE
+)
 from utils.helper import safe_followup
+from utils.permissions import get_roles_with_permissions, has_any_permission
+from utils.templates import render_template
 import config
 import time
 import logging
@@ -14,23 +20,121 @@ logger = logging.getLogger(__name__)
 
 async def has_ticket_permission(user, guild):
     """Check if user can access tickets"""
-    if user.id == guild.owner_id:
-        return True
+    return await has_any_permission(user, guild, {"handle_tickets", "manage_tickets"})
+
+async def build_ticket_overwrites(guild, user):
+    """Channel overwrites for a new ticket, granting staff access per role"""
+    staff_access = disnake.PermissionOverwrite(
+        read_messages=True, 
+        send_messages=True, 
+        manage_messages=True
+    )
 
+    overwrites = {
+        guild.default_role: disnake.PermissionOverwrite(read_messages=False),
+    }
+
+    # One overwrite per staff role instead of one per staff member
+    staff_role_ids = await get_roles_with_permissions(guild.id, {"handle_tickets", "manage_tickets"})
+    for role_id in staff_role_ids:
+        role = guild.get_role(int(role_id))
+        if role and role != guild.default_role:
+            overwrites[role] = staff_access
+
+    if guild.owner:
+        overwrites[guild.owner] = staff_access
+
+    overwrites[user] = disnake.PermissionOverwrite(
+        read_messages=True, 
+        send_messages=True, 
+        attach_files=True,
+        embed_links=True
+    )
+    overwrites[guild.me] = disnake.PermissionOverwrite(
+        read_messages=True, 
+        send_messages=True, 
+        manage_messages=True,
+        embed_links=True
+    )
+    return overwrites
+
+async def reserve_ticket(guild_id, user_id, product_name, placeholder_id):
+    """Allocate the next ticket number and hold an active_tickets row for the user
+
+    One statement, so the counter bump and the reservation commit together.
+    The row uses placeholder_id (the interaction ID) as its channel_id until
+    confirm_ticket() swaps in the real channel. Returns None if the user
+    already holds a ticket (enforced by the unique (guild_id, user_id) index).
+    """
     async with (await get_database_pool()).acquire() as conn:
-        user_role_ids = [str(role.id) for role in user.roles]
-        if not user_role_ids:
-            return False
+        try:
+            return await conn.fetchval(
+                """
+                WITH counter AS (
+                    INSERT INTO ticket_counters (guild_id, counter)
+                    VALUES ($1, 1)
+                    ON CONFLICT (guild_id) DO UPDATE SET counter = ticket_counters.counter + 1
+                    RETURNING counter
+                )
+                INSERT INTO active_tickets (guild_id, channel_id, user_id, product_name, ticket_number)
+                SELECT $1, $2, $3, $4, counter FROM counter
+                RETURNING ticket_number
+                """,
+                str(guild_id), str(placeholder_id), str(user_id), product_name
+            )
+        except asyncpg.UniqueViolationError:
+            return None
 
-        result = await conn.fetchrow(
+async def confirm_ticket(guild_id, placeholder_id, channel_id, user_id, product_name, ticket_number):
+    """Point a reservation at the created channel"""
+    async with (await get_database_pool()).acquire() as conn:
+        result = await conn.execute(
+            "UPDATE active_tickets SET channel_id = $3 WHERE guild_id = $1 AND channel_id = $2",
+            str(guild_id), str(placeholder_id), str(channel_id)
+        )
+        if result == "UPDATE 0":
+            # Reservation was cleaned up while the channel was being created
+            await conn.execute(
+                """
+                INSERT INTO active_tickets (guild_id, channel_id, user_id, product_name, ticket_number)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT DO NOTHING
+                """,
+                str(guild_id), str(channel_id), str(user_id), product_name, ticket_number
+            )
+
+async def clear_stale_ticket(guild_id, channel_id):
+    """Delete a ticket row whose channel is gone; returns False if it may still be a fresh reservation"""
+    async with (await get_database_pool()).acquire() as conn:
+        result = await conn.execute(
             """
-            SELECT 1 FROM role_permissions 
-            WHERE guild_id = $1 AND role_id = ANY($2) 
-            AND (permission_type = $3 OR permission_type = $4)
+            DELETE FROM active_tickets
+            WHERE guild_id = $1 AND channel_id = $2
+            AND created_at < CURRENT_TIMESTAMP - make_interval(secs => $3)
             """,
-            str(guild.id), user_role_ids, "handle_tickets", "manage_tickets"
+            str(guild_id), str(channel_id), TICKET_RESERVATION_GRACE
         )
-        return result is not None
+    return result != "DELETE 0"
+
+async def release_ticket(guild_id, placeholder_id):
+    """Drop a reservation whose channel couldn't be created, returning its number if still the latest"""
+    try:
+        async with (await get_database_pool()).acquire() as conn:
+            await conn.execute(
+                """
+                WITH released AS (
+                    DELETE FROM active_tickets
+                    WHERE guild_id = $1 AND channel_id = $2
+                    RETURNING ticket_number
+                )
+                UPDATE ticket_counters
+                SET counter = counter - 1
+                WHERE guild_id = $1 AND counter = (SELECT ticket_number FROM released)
+                """,
+                str(guild_id), str(placeholder_id)
+            )
+    except Exception as e:
+        logger.error(f"[Ticket Release Failed] Could not release reservation {placeholder_id} in guild {guild_id}: {e}")
 
 async def get_ticket_discord_category(guild_id, ticket_type, category_name=None):
     """Get the Discord category for a specific ticket type"""
@@ -43,81 +147,22 @@ async def get_ticket_discord_category(guild_id, ticket_type, category_name=None)
     
     return result["discord_category_id"] if result else None
 
-async def parse_variables(text: str, guild, products_data=None) -> str:
+async def parse_variables(text: str, guild) -> str:
     """Parse variables in text and replace with actual values"""
-    if not text:
-        return text
+    return await render_template(text, guild)
 
-    if products_data is None:
-        products_data = await fetch_products_with_payment_info(str(guild.id))
-        
-    # Get total sales from database
+async def fetch_ticket_customization(guild_id):
+    """Fetches the ticket box customization row for a guild (or None)"""
     async with (await get_database_pool()).acquire() as conn:
-        total_sales_result = await conn.fetchval(
-            "SELECT COALESCE(SUM(total_sold), 0) FROM product_sales WHERE guild_id = $1",
-            str(guild.id)
+        return await conn.fetchrow(
+            "SELECT * FROM ticket_customization WHERE guild_id = $1",
+            str(guild_id)
         )
-    
-    total_sales = total_sales_result or 0
-    text = text.replace("{TOTAL_SALES}", f"{total_sales:,}")
-    
-    # Server variables
-    text = text.replace("{SERVER_NAME}", guild.name)
-    text = text.replace("{SERVER_MEMBER_COUNT}", str(guild.member_count))
-    text = text.replace("{SERVER_OWNER}", guild.owner.mention if guild.owner else "Unknown")
-    
-    # Date/time variables
-    from datetime import datetime
-    now = datetime.now()
-    text = text.replace("{CURRENT_DATE}", now.strftime("%B %d, %Y"))
-    text = text.replace("{CURRENT_TIME}", now.strftime("%H:%M"))
-    
-    # Product variables
-    text = text.replace("{PRODUCT_COUNT}", str(len(products_data)))
-    
-    total_stock = sum(data["stock"] for data in products_data.values() if data["stock"] != -1)
-    unlimited_count = sum(1 for data in products_data.values() if data["stock"] == -1)
-    
-    if unlimited_count > 0:
-        text = text.replace("{TOTAL_STOCK}", f"{total_stock} + {unlimited_count} unlimited")
-    else:
-        text = text.replace("{TOTAL_STOCK}", str(total_stock))
-    
-    products_in_stock = sum(1 for data in products_data.values() if data["stock"] != 0)
-    text = text.replace("{PRODUCTS_IN_STOCK}", str(products_in_stock))
-    
-    products_sold_out = sum(1 for data in products_data.values() if data["stock"] == 0)
-    text = text.replace("{PRODUCTS_SOLD_OUT}", str(products_sold_out))
-    
-    # Product-specific stock variables
-    stock_pattern = r'\{([^}]+)\.STOCK\}'
-    matches = re.finditer(stock_pattern, text)
-    
-    for match in matches:
-        var_name = match.group(0)
-        product_name = match.group(1).replace("_", " ")
-        
-        if product_name in products_data:
-            stock = products_data[product_name]["stock"]
-            if stock == -1:
-                stock_text = "Unlimited"
-            elif stock == 0:
-                stock_text = "SOLD OUT"
-            else:
-                stock_text = str(stock)
-            text = text.replace(var_name, stock_text)
-        else:
-            text = text.replace(var_name, "N/A")
-    
-    return text
 
-async def create_ticket_embed(guild):
+async def create_ticket_embed(guild, custom=None):
     """Creates the main ticket box embed with custom text support"""
-    async with (await get_database_pool()).acquire() as conn:
-        custom = await conn.fetchrow(
-            "SELECT * FROM ticket_customization WHERE guild_id = $1",
-            str(guild.id)
-        )
+    if custom is None:
+        custom = await fetch_ticket_customization(guild.id)
     
     if custom:
         title = custom["title"] or "🎫 Support Tickets"
@@ -154,44 +199,25 @@ def create_ticket_view(guild_id):
 
 async def fetch_products_with_payment_info(guild_id):
     """Fetches all products with payment information for tickets"""
-    async with (await get_database_pool()).acquire() as conn:
-        rows = await conn.fetch(
-            """SELECT product_name, payment_methods, stock, description 
-               FROM products WHERE guild_id = $1""", 
-            guild_id
-        )
-        
-        products = {}
-        for row in rows:
-            payment_methods = parse_payment_methods(row["payment_methods"]) if row["payment_methods"] else {}
-            
-            products[row["product_name"]] = {
-                "payment_methods": payment_methods,
-                "stock": row["stock"] if row["stock"] is not None else -1,
-                "description": row["description"]
-            }
-        
-        # Always add Test product
-        products["Test"] = {
-            "payment_methods": {"usd": "Free"},
-            "stock": -1,
-            "description": "Test product for verification system testing"
+    catalog = await get_product_catalog(guild_id)
+
+    products = {
+        name: {
+            "payment_methods": dict(product["payment_methods"]),
+            "stock": product["stock"],
+            "description": product["description"]
         }
-        
-        return products
+        for name, product in catalog["products"].items()
+    }
 
-def parse_payment_methods(payment_methods_str):
-    """Parse payment methods string into dictionary"""
-    if not payment_methods_str:
-        return {}
-    
-    methods = {}
-    for method in payment_methods_str.split("|"):
-        if ":" in method:
-            method_type, price = method.split(":", 1)
-            methods[method_type] = price
-    
-    return methods
+    # Always add Test product
+    products["Test"] = {
+        "payment_methods": {"usd": "Free"},
+        "stock": -1,
+        "description": "Test product for verification system testing"
+    }
+
+    return products
 
 async def fetch_ticket_categories(guild_id):
     """Fetches custom ticket categories for a guild"""
@@ -306,6 +332,10 @@ class TicketButton(disnake.ui.View):
                 str(guild.id)
             )
         
+        self.apply_customization(custom)
+
+    def apply_customization(self, custom):
+        """Build the button from a ticket_customization row (or None for defaults)"""
         button_text = "Create Ticket"
         button_emoji = "🎫"
         
@@ -323,6 +353,45 @@ class TicketButton(disnake.ui.View):
         self.clear_items()
         self.add_item(button)
         
+    async def report_open_ticket(self, interaction):
+        """Tell the user about their open ticket; returns False if they have none"""
+        existing_channel_id = await get_active_ticket_channel(interaction.guild.id, interaction.author.id)
+        if not existing_channel_id:
+            return False
+
+        channel = interaction.guild.get_channel(int(existing_channel_id))
+        if channel:
+            message = f"❌ You already have an open ticket: {channel.mention}"
+        elif await clear_stale_ticket(interaction.guild.id, existing_channel_id):
+            return False
+        else:
+            message = "⏳ Your ticket is already being created, please wait a moment."
+
+        await safe_followup(
+            interaction,
+            message,
+            ephemeral=True,
+            delete_after=config.message_timeout
+        )
+        return True
+
+    async def take_reservation(self, interaction, product_name):
+        """Reserve a ticket number for the user, or report the ticket they already hold"""
+        for _ in range(2):
+            ticket_number = await reserve_ticket(interaction.guild.id, interaction.author.id, product_name, interaction.id)
+            if ticket_number is not None:
+                return ticket_number
+            # A stale row was cleared, so the reservation can be retried once
+            if await self.report_open_ticket(interaction):
+                return None
+
+        await safe_followup(
+            interaction,
+            "❌ Failed to create ticket. Please try again later.",
+            ephemeral=True
+        )
+        return None
+
     async def on_button_click(self, interaction: disnake.MessageInteraction):
         """Handles the ticket creation button click"""
         current = time.time()
@@ -340,27 +409,8 @@ class TicketButton(disnake.ui.View):
 
         await interaction.response.defer(ephemeral=True)
 
-        async with (await get_database_pool()).acquire() as conn:
-            existing_ticket = await conn.fetchrow(
-                "SELECT channel_id FROM active_tickets WHERE guild_id = $1 AND user_id = $2",
-                str(interaction.guild.id), str(interaction.author.id)
-            )
-            
-            if existing_ticket:
-                channel = interaction.guild.get_channel(int(existing_ticket["channel_id"]))
-                if channel:
-                    await safe_followup(
-                        interaction,
-                        f"❌ You already have an open ticket: {channel.mention}",
-                        ephemeral=True,
-                        delete_after=config.message_timeout
-                    )
-                    return
-                else:
-                    await conn.execute(
-                        "DELETE FROM active_tickets WHERE guild_id = $1 AND channel_id = $2",
-                        str(interaction.guild.id), existing_ticket["channel_id"]
-                    )
+        if await self.report_open_ticket(interaction):
+            return
 
         categories = await fetch_ticket_categories(str(interaction.guild.id))
         products = await fetch_products_with_payment_info(str(interaction.guild.id))
@@ -501,27 +551,6 @@ class TicketButton(disnake.ui.View):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            async with (await get_database_pool()).acquire() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO ticket_counters (guild_id, counter)
-                    VALUES ($1, 0)
-                    ON CONFLICT (guild_id) DO NOTHING
-                    """,
-                    str(interaction.guild.id)
-                )
-                
-                result = await conn.fetchrow(
-                    """
-                    UPDATE ticket_counters 
-                    SET counter = counter + 1 
-                    WHERE guild_id = $1 
-                    RETURNING counter
-                    """,
-                    str(interaction.guild.id)
-                )
-                ticket_number = result["counter"]
-
             # Get Discord category for this ticket type
             discord_category = None
             if selected_type == "custom":
@@ -556,56 +585,27 @@ class TicketButton(disnake.ui.View):
             guild = interaction.guild
             user = interaction.author
             
-            overwrites = {
-                guild.default_role: disnake.PermissionOverwrite(read_messages=False),
-                user: disnake.PermissionOverwrite(
-                    read_messages=True, 
-                    send_messages=True, 
-                    attach_files=True,
-                    embed_links=True
-                ),
-                guild.me: disnake.PermissionOverwrite(
-                    read_messages=True, 
-                    send_messages=True, 
-                    manage_messages=True,
-                    embed_links=True
-                ),
-            }
-            
-            if guild.owner:
-                overwrites[guild.owner] = disnake.PermissionOverwrite(
-                    read_messages=True, 
-                    send_messages=True, 
-                    manage_messages=True
-                )
-            
-            for member in guild.members:
-                if await has_ticket_permission(member, guild) and member != user and member != guild.owner:
-                    overwrites[member] = disnake.PermissionOverwrite(
-                        read_messages=True, 
-                        send_messages=True, 
-                        manage_messages=True
-                    )
-
-            channel_name = f"ticket-{ticket_number:04d}-{user.display_name.lower().replace(' ', '-')}"
-            channel_name = re.sub(r'[^a-z0-9\-]', '', channel_name)
-            
-            channel = await guild.create_text_channel(
-                name=channel_name,
-                category=discord_category,
-                overwrites=overwrites,
-                reason=f"Private ticket created by {user} for {selected_name}"
-            )
-
             product_name_for_db = selected_name if selected_type == "product" else None
-            async with (await get_database_pool()).acquire() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO active_tickets (guild_id, channel_id, user_id, product_name, ticket_number)
-                    VALUES ($1, $2, $3, $4, $5)
-                    """,
-                    str(guild.id), str(channel.id), str(user.id), product_name_for_db, ticket_number
+            ticket_number = await self.take_reservation(interaction, product_name_for_db)
+            if ticket_number is None:
+                return
+            try:
+                overwrites = await build_ticket_overwrites(guild, user)
+
+                channel_name = f"ticket-{ticket_number:04d}-{user.display_name.lower().replace(' ', '-')}"
+                channel_name = re.sub(r'[^a-z0-9\-]', '', channel_name)
+                
+                channel = await guild.create_text_channel(
+                    name=channel_name,
+                    category=discord_category,
+                    overwrites=overwrites,
+                    reason=f"Private ticket created by {user} for {selected_name}"
                 )
+            except Exception:
+                await release_ticket(guild.id, interaction.id)
+                raise
+
+            await confirm_ticket(guild.id, interaction.id, channel.id, user.id, product_name_for_db, ticket_number)
 
             # Create appropriate embed based on type
             if selected_type == "product" and selected_data:
@@ -724,27 +724,6 @@ class TicketButton(disnake.ui.View):
     async def create_default_ticket(self, interaction, category_name="General Support"):
         """Creates a default ticket when no categories/products exist"""
         try:
-            async with (await get_database_pool()).acquire() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO ticket_counters (guild_id, counter)
-                    VALUES ($1, 0)
-                    ON CONFLICT (guild_id) DO NOTHING
-                    """,
-                    str(interaction.guild.id)
-                )
-                
-                result = await conn.fetchrow(
-                    """
-                    UPDATE ticket_counters 
-                    SET counter = counter + 1 
-                    WHERE guild_id = $1 
-                    RETURNING counter
-                    """,
-                    str(interaction.guild.id)
-                )
-                ticket_number = result["counter"]
-
             discord_category = None
             category_id = await get_ticket_discord_category(str(interaction.guild.id), "general", None)
             if category_id:
@@ -753,55 +732,26 @@ class TicketButton(disnake.ui.View):
             guild = interaction.guild
             user = interaction.author
             
-            overwrites = {
-                guild.default_role: disnake.PermissionOverwrite(read_messages=False),
-                user: disnake.PermissionOverwrite(
-                    read_messages=True, 
-                    send_messages=True, 
-                    attach_files=True,
-                    embed_links=True
-                ),
-                guild.me: disnake.PermissionOverwrite(
-                    read_messages=True, 
-                    send_messages=True, 
-                    manage_messages=True,
-                    embed_links=True
-                ),
-            }
-            
-            if guild.owner:
-                overwrites[guild.owner] = disnake.PermissionOverwrite(
-                    read_messages=True, 
-                    send_messages=True, 
-                    manage_messages=True
+            ticket_number = await self.take_reservation(interaction, None)
+            if ticket_number is None:
+                return
+            try:
+                overwrites = await build_ticket_overwrites(guild, user)
+
+                channel_name = f"ticket-{ticket_number:04d}-{user.display_name.lower().replace(' ', '-')}"
+                channel_name = re.sub(r'[^a-z0-9\-]', '', channel_name)
+                
+                channel = await guild.create_text_channel(
+                    name=channel_name,
+                    category=discord_category,
+                    overwrites=overwrites,
+                    reason=f"Private ticket created by {user} for {category_name}"
                 )
-            
-            for member in guild.members:
-                if await has_ticket_permission(member, guild) and member != user and member != guild.owner:
-                    overwrites[member] = disnake.PermissionOverwrite(
-                        read_messages=True, 
-                        send_messages=True, 
-                        manage_messages=True
-                    )
+            except Exception:
+                await release_ticket(guild.id, interaction.id)
+                raise
 
-            channel_name = f"ticket-{ticket_number:04d}-{user.display_name.lower().replace(' ', '-')}"
-            channel_name = re.sub(r'[^a-z0-9\-]', '', channel_name)
-            
-            channel = await guild.create_text_channel(
-                name=channel_name,
-                category=discord_category,
-                overwrites=overwrites,
-                reason=f"Private ticket created by {user} for {category_name}"
-            )
-
-            async with (await get_database_pool()).acquire() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO active_tickets (guild_id, channel_id, user_id, product_name, ticket_number)
-                    VALUES ($1, $2, $3, $4, $5)
-                    """,
-                    str(guild.id), str(channel.id), str(user.id), None, ticket_number
-                )
+            await confirm_ticket(guild.id, interaction.id, channel.id, user.id, None, ticket_number)
 
             welcome_embed = disnake.Embed(
                 title=f"🎫 Private Support Ticket #{ticket_number:04d}",
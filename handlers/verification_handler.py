@@ -1,7 +1,7 @@
 import disnake
 import logging
 from disnake.ext import commands
-from utils.database import get_database_pool, fetch_products
+from utils.database import get_database_pool, fetch_product_names
 from handlers.verification_handler import create_verification_embed, create_verification_view
 import config
 
@@ -24,7 +24,7 @@ class StartVerification(commands.Cog):
             )
             return
 
-        products = await fetch_products(str(inter.guild.id))
+        products = await fetch_product_names(str(inter.guild.id))
         has_products = bool(products)
 
         embed = create_verification_embed()
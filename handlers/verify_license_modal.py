@@ -1,18 +1,26 @@
 # Complete updated handlers/verify_license_modal.py with enhanced Roblox support
 
 import disnake
-import requests
-from utils.database import get_database_pool
+from utils.database import get_database_pool, get_log_channel_id, get_product_role_id
 from utils.validation import validate_license_key
 import config
-from utils.database import save_verified_license
-import json
+from utils.database import get_product_secret, record_product_sale, save_verified_license
+from utils.payhip import verify_license, increment_license_usage, PayhipError
+from utils.roblox import (
+    get_user_id as get_roblox_user_id,
+    owns_gamepass as roblox_owns_gamepass,
+    RobloxError,
+    RobloxTimeoutError,
+    RobloxConnectionError,
+    RobloxAPIError,
+    RobloxAuthError,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
 class VerifyLicenseModal(disnake.ui.Modal):
-    def __init__(self, product_name, product_secret_key, product_type="payhip", gamepass_id=None):
+    def __init__(self, product_name, product_secret_key=None, product_type="payhip", gamepass_id=None):
         self.product_name = product_name
         self.product_secret_key = product_secret_key
         self.product_type = product_type
@@ -45,6 +53,12 @@ class VerifyLicenseModal(disnake.ui.Modal):
         super().__init__(title=modal_title, custom_id="verify_license_modal", components=components)
         
     async def callback(self, interaction: disnake.ModalInteraction):
+        # The secret is only decrypted once the user actually submits
+        if self.product_secret_key is None:
+            self.product_secret_key = await get_product_secret(
+                interaction.guild.id, self.product_name, self.product_type
+            )
+
         if self.product_type == "roblox" and not self.is_test_product:
             await self.handle_roblox_verification(interaction)
         else:
@@ -79,40 +93,17 @@ class VerifyLicenseModal(disnake.ui.Modal):
                 return
         
         try:
-            # Step 1: Get Roblox User ID with better error handling
+            # Step 1: Get Roblox User ID (cached across retries)
             try:
-                user_id_response = requests.get(
-                    f"https://api.roblox.com/users/get-by-username?username={roblox_username}",
-                    timeout=15
-                )
-                
-                if user_id_response.status_code == 200:
-                    user_data = user_id_response.json()
-                    roblox_user_id = user_data.get("Id")
-                    
-                    if not roblox_user_id:
-                        await interaction.followup.send(
-                            f"❌ Roblox user **{roblox_username}** not found. Please check the spelling and try again.",
-                            ephemeral=True,
-                            delete_after=config.message_timeout
-                        )
-                        return
-                else:
-                    await interaction.followup.send(
-                        f"❌ Could not find Roblox user **{roblox_username}**. Please verify the username is correct.",
-                        ephemeral=True,
-                        delete_after=config.message_timeout
-                    )
-                    return
-                    
-            except requests.exceptions.Timeout:
+                roblox_user_id = await get_roblox_user_id(roblox_username)
+            except RobloxTimeoutError:
                 await interaction.followup.send(
                     "❌ Roblox servers are slow to respond. Please try again in a few moments.",
                     ephemeral=True,
                     delete_after=config.message_timeout
                 )
                 return
-            except requests.exceptions.RequestException as e:
+            except RobloxError as e:
                 logger.error(f"[Roblox Username API Error] {e}")
                 await interaction.followup.send(
                     "❌ Unable to connect to Roblox servers. Please try again later.",
@@ -121,6 +112,14 @@ class VerifyLicenseModal(disnake.ui.Modal):
                 )
                 return
 
+            if not roblox_user_id:
+                await interaction.followup.send(
+                    f"❌ Roblox user **{roblox_username}** not found. Please check the spelling and try again.",
+                    ephemeral=True,
+                    delete_after=config.message_timeout
+                )
+                return
+
             # Step 2: Check if this Roblox user already used for verification
             async with (await get_database_pool()).acquire() as conn:
                 existing_roblox_user = await conn.fetchrow(
@@ -153,33 +152,19 @@ class VerifyLicenseModal(disnake.ui.Modal):
                 logger.error(f"[Roblox Config Error] Invalid cookie format for product {self.product_name}")
                 return
             
-            headers = {
-                'Cookie': f'.ROBLOSECURITY={roblox_cookie}',
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Accept': 'application/json',
-                'Content-Type': 'application/json'
-            }
-            
-            # Enhanced API call with better error handling
             try:
-                ownership_response = requests.get(
-                    f"https://inventory.roblox.com/v1/users/{roblox_user_id}/items/GamePass/{self.gamepass_id}/is-owned",
-                    headers=headers,
-                    timeout=20
+                owns_gamepass = await roblox_owns_gamepass(roblox_cookie, roblox_user_id, self.gamepass_id)
+            except RobloxAuthError:
+                await interaction.followup.send(
+                    "❌ **Configuration Error:** Roblox authentication failed. Please contact an administrator.\n\n"
+                    "**Admin Note:** The Roblox cookie has expired or is invalid. Please update it in the product configuration.",
+                    ephemeral=True,
+                    delete_after=config.message_timeout
                 )
-                
-                logger.info(f"[Roblox API] Status: {ownership_response.status_code}, Response: {ownership_response.text[:200]}")
-                
-                if ownership_response.status_code == 401:
-                    await interaction.followup.send(
-                        "❌ **Configuration Error:** Roblox authentication failed. Please contact an administrator.\n\n"
-                        "**Admin Note:** The Roblox cookie has expired or is invalid. Please update it in the product configuration.",
-                        ephemeral=True,
-                        delete_after=config.message_timeout
-                    )
-                    logger.error(f"[Roblox Auth Error] 401 Unauthorized for product {self.product_name}")
-                    return
-                elif ownership_response.status_code == 403:
+                logger.error(f"[Roblox Auth Error] 401 Unauthorized for product {self.product_name}")
+                return
+            except RobloxAPIError as e:
+                if e.status == 403:
                     await interaction.followup.send(
                         "❌ **Configuration Error:** Access denied to Roblox API. Please contact an administrator.\n\n"
                         "**Admin Note:** The account may have 2FA enabled or API access restrictions.",
@@ -187,8 +172,7 @@ class VerifyLicenseModal(disnake.ui.Modal):
                         delete_after=config.message_timeout
                     )
                     logger.error(f"[Roblox Access Error] 403 Forbidden for product {self.product_name}")
-                    return
-                elif ownership_response.status_code == 404:
+                elif e.status == 404:
                     await interaction.followup.send(
                         f"❌ **Configuration Error:** Gamepass {self.gamepass_id} not found. Please contact an administrator.\n\n"
                         "**Admin Note:** Check if the gamepass ID is correct and the gamepass exists.",
@@ -196,60 +180,36 @@ class VerifyLicenseModal(disnake.ui.Modal):
                         delete_after=config.message_timeout
                     )
                     logger.error(f"[Roblox Gamepass Error] 404 Not Found for gamepass {self.gamepass_id}")
-                    return
-                elif ownership_response.status_code != 200:
-                    await interaction.followup.send(
-                        f"❌ **Verification Error:** Roblox API returned status {ownership_response.status_code}. Please try again later or contact an administrator.",
-                        ephemeral=True,
-                        delete_after=config.message_timeout
-                    )
-                    logger.error(f"[Roblox API Error] Status {ownership_response.status_code}: {ownership_response.text}")
-                    return
-                
-                # Parse response
-                try:
-                    ownership_data = ownership_response.json()
-                    owns_gamepass = ownership_data.get("isOwned", False)
-                except json.JSONDecodeError:
+                elif e.status == 200:
                     await interaction.followup.send(
                         "❌ **API Error:** Invalid response from Roblox. Please try again later.",
                         ephemeral=True,
                         delete_after=config.message_timeout
                     )
-                    logger.error(f"[Roblox JSON Error] Invalid JSON response: {ownership_response.text}")
-                    return
-                
-                if not owns_gamepass:
-                    gamepass_url = f"https://www.roblox.com/catalog/{self.gamepass_id}"
+                    logger.error(f"[Roblox JSON Error] Invalid JSON response: {e.body}")
+                else:
                     await interaction.followup.send(
-                        f"❌ **{roblox_username}** does not own the required gamepass for **{self.product_name}**.\n\n"
-                        f"🎮 **Gamepass ID:** {self.gamepass_id}\n"
-                        f"🛒 **Purchase here:** {gamepass_url}\n\n"
-                        f"**Please buy the gamepass first, then try verification again.**\n"
-                        f"⏰ It may take a few minutes for the purchase to register on Roblox.",
+                        f"❌ **Verification Error:** Roblox API returned status {e.status}. Please try again later or contact an administrator.",
                         ephemeral=True,
                         delete_after=config.message_timeout
                     )
-                    return
-
-                # Success - handle verification
-                await self.handle_successful_roblox_verification(interaction, roblox_username, roblox_user_id)
-                
-            except requests.exceptions.Timeout:
+                    logger.error(f"[Roblox API Error] Status {e.status}: {e.body}")
+                return
+            except RobloxTimeoutError:
                 await interaction.followup.send(
                     "❌ **Timeout Error:** Roblox servers are taking too long to respond. Please try again in a few minutes.",
                     ephemeral=True,
                     delete_after=config.message_timeout
                 )
                 return
-            except requests.exceptions.ConnectionError:
+            except RobloxConnectionError:
                 await interaction.followup.send(
                     "❌ **Connection Error:** Unable to connect to Roblox servers. Please check your internet connection and try again.",
                     ephemeral=True,
                     delete_after=config.message_timeout
                 )
                 return
-            except requests.exceptions.RequestException as e:
+            except RobloxError as e:
                 logger.error(f"[Roblox Request Error] {e}")
                 await interaction.followup.send(
                     "❌ **Network Error:** Failed to verify gamepass ownership. Please try again later.",
@@ -258,6 +218,22 @@ class VerifyLicenseModal(disnake.ui.Modal):
                 )
                 return
 
+            if not owns_gamepass:
+                gamepass_url = f"https://www.roblox.com/catalog/{self.gamepass_id}"
+                await interaction.followup.send(
+                    f"❌ **{roblox_username}** does not own the required gamepass for **{self.product_name}**.\n\n"
+                    f"🎮 **Gamepass ID:** {self.gamepass_id}\n"
+                    f"🛒 **Purchase here:** {gamepass_url}\n\n"
+                    f"**Please buy the gamepass first, then try verification again.**\n"
+                    f"⏰ It may take a few minutes for the purchase to register on Roblox.",
+                    ephemeral=True,
+                    delete_after=config.message_timeout
+                )
+                return
+
+            # Success - handle verification
+            await self.handle_successful_roblox_verification(interaction, roblox_username, roblox_user_id)
+
         except Exception as e:
             logger.error(f"[Roblox Verification Critical Error] {e}")
             await interaction.followup.send(
@@ -272,29 +248,24 @@ class VerifyLicenseModal(disnake.ui.Modal):
         user = interaction.author
         guild = interaction.guild
 
-        async with (await get_database_pool()).acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT role_id FROM products WHERE guild_id = $1 AND product_name = $2",
-                str(guild.id), self.product_name
+        role_id = await get_product_role_id(guild.id, self.product_name)
+        if not role_id:
+            await interaction.followup.send(
+                f"❌ Role information for '{self.product_name}' is missing.",
+                ephemeral=True,
+                delete_after=config.message_timeout
             )
-            if not row:
-                await interaction.followup.send(
-                    f"❌ Role information for '{self.product_name}' is missing.",
-                    ephemeral=True,
-                    delete_after=config.message_timeout
-                )
-                return
+            return
 
-            role_id = row["role_id"]
-            role = disnake.utils.get(guild.roles, id=int(role_id))
+        role = disnake.utils.get(guild.roles, id=int(role_id))
 
-            if not role:
-                await interaction.followup.send(
-                    "❌ The role associated with this product is missing or deleted.",
-                    ephemeral=True,
-                    delete_after=config.message_timeout
-                )
-                return
+        if not role:
+            await interaction.followup.send(
+                "❌ The role associated with this product is missing or deleted.",
+                ephemeral=True,
+                delete_after=config.message_timeout
+            )
+            return
 
         await user.add_roles(role)
         logger.info(f"[Roblox Role Assigned] Gave role '{role.name}' to {user} in '{guild.name}' for Roblox product '{self.product_name}'.")
@@ -368,21 +339,42 @@ class VerifyLicenseModal(disnake.ui.Modal):
         embed.timestamp = interaction.created_at
         
         await interaction.followup.send(embed=embed, ephemeral=True)
+        await self.record_sale(interaction)
         
         # Log the event in the server's log channel
         await self.log_roblox_verification(guild, user, role, auto_roles, roblox_username, embed)
 
+    async def record_sale(self, interaction):
+        """Count the sale and take one unit of stock for this product"""
+        guild = interaction.guild
+        try:
+            result = await record_product_sale(guild.id, self.product_name)
+        except Exception as e:
+            logger.error(f"[Sale Record Error] Failed to record sale of '{self.product_name}' in '{guild.name}': {e}")
+            return
+
+        if result is None:
+            return
+
+        previous_stock, remaining_stock = result
+        if previous_stock == 0:
+            logger.warning(f"[Stock Oversold] '{self.product_name}' verified in '{guild.name}' while already sold out")
+            return
+        if remaining_stock == 0:
+            logger.info(f"[Sold Out] '{self.product_name}' sold out in '{guild.name}'")
+
+        if previous_stock != remaining_stock:
+            stock_cog = interaction.bot.get_cog("StockManagement")
+            if stock_cog:
+                await stock_cog.update_stock_channel(guild.id, self.product_name, remaining_stock)
+
     async def log_roblox_verification(self, guild, user, role, auto_roles, roblox_username, embed):
         """Log the Roblox verification in the server log channel"""
         try:
-            async with (await get_database_pool()).acquire() as conn:
-                log_row = await conn.fetchrow(
-                    "SELECT channel_id FROM server_log_channels WHERE guild_id = $1",
-                    str(guild.id)
-                )
+            log_channel_id = await get_log_channel_id(guild.id)
 
-            if log_row:
-                log_channel = guild.get_channel(int(log_row["channel_id"]))
+            if log_channel_id:
+                log_channel = guild.get_channel(int(log_channel_id))
                 if log_channel:
                     log_embed = disnake.Embed(
                         title="🎮 Roblox Gamepass Verification",
@@ -427,17 +419,10 @@ class VerifyLicenseModal(disnake.ui.Modal):
             await interaction.response.send_message(f"❌ {str(e)}", ephemeral=True,delete_after=config.message_timeout)
             return
 
-        PAYHIP_VERIFY_URL = f"https://payhip.com/api/v2/license/verify?license_key={license_key}"
-        PAYHIP_INCREMENT_USAGE_URL = "https://payhip.com/api/v2/license/usage"
-
-        headers = {"product-secret-key": self.product_secret_key}
-
         try:
             await interaction.response.defer(ephemeral=True)
             
-            response = requests.get(PAYHIP_VERIFY_URL, headers=headers, timeout=10)
-            response.raise_for_status()
-            data = response.json().get("data")
+            data = await verify_license(self.product_secret_key, license_key)
 
             if not data or not data.get("enabled"):
                 logger.warning(f"[Invalid License] {interaction.user} tried to use a disabled or invalid license in '{interaction.guild.name}'.")
@@ -452,20 +437,13 @@ class VerifyLicenseModal(disnake.ui.Modal):
                 )
                 return
 
-            increment_response = requests.put(
-                PAYHIP_INCREMENT_USAGE_URL,
-                headers=headers,
-                data={"license_key": license_key},
-                timeout=10
-            )
-
-            if increment_response.status_code != 200:
+            if not await increment_license_usage(self.product_secret_key, license_key):
                 await interaction.followup.send("❌ Failed to mark the license as used.", ephemeral=True,delete_after=config.message_timeout)
                 return
 
             await self.handle_successful_verification(interaction, license_key)
 
-        except requests.exceptions.RequestException as e:
+        except PayhipError:
             await interaction.followup.send(
                 "❌ Unable to contact the verification server. Please try again later.",
                 ephemeral=True,delete_after=config.message_timeout
@@ -497,14 +475,10 @@ class VerifyLicenseModal(disnake.ui.Modal):
         
         # Log test verification
         try:
-            async with (await get_database_pool()).acquire() as conn:
-                log_row = await conn.fetchrow(
-                    "SELECT channel_id FROM server_log_channels WHERE guild_id = $1",
-                    str(guild.id)
-                )
+            log_channel_id = await get_log_channel_id(guild.id)
 
-            if log_row:
-                log_channel = guild.get_channel(int(log_row["channel_id"]))
+            if log_channel_id:
+                log_channel = guild.get_channel(int(log_channel_id))
                 if log_channel:
                     embed = disnake.Embed(
                         title="🧪 Test License Verification",
@@ -530,29 +504,24 @@ class VerifyLicenseModal(disnake.ui.Modal):
         user = interaction.author
         guild = interaction.guild
 
-        async with (await get_database_pool()).acquire() as conn:
-            row = await conn.fetchrow(
-                "SELECT role_id FROM products WHERE guild_id = $1 AND product_name = $2",
-                str(guild.id), self.product_name
+        role_id = await get_product_role_id(guild.id, self.product_name)
+        if not role_id:
+            await interaction.followup.send(
+                f"❌ Role information for '{self.product_name}' is missing.",
+                ephemeral=True,
+                delete_after=config.message_timeout
             )
-            if not row:
-                await interaction.followup.send(
-                    f"❌ Role information for '{self.product_name}' is missing.",
-                    ephemeral=True,
-                    delete_after=config.message_timeout
-                )
-                return
+            return
 
-            role_id = row["role_id"]
-            role = disnake.utils.get(guild.roles, id=int(role_id))
+        role = disnake.utils.get(guild.roles, id=int(role_id))
 
-            if not role:
-                await interaction.followup.send(
-                    "❌ The role associated with this product is missing or deleted.",
-                    ephemeral=True,
-                    delete_after=config.message_timeout
-                )
-                return
+        if not role:
+            await interaction.followup.send(
+                "❌ The role associated with this product is missing or deleted.",
+                ephemeral=True,
+                delete_after=config.message_timeout
+            )
+            return
 
         await user.add_roles(role)
         logger.info(f"[Role Assigned] Gave role '{role.name}' to {user} in '{guild.name}' for product '{self.product_name}'.")
@@ -573,17 +542,14 @@ class VerifyLicenseModal(disnake.ui.Modal):
         )
         
         await save_verified_license(interaction.author.id, interaction.guild.id, self.product_name, license_key)
+        await self.record_sale(interaction)
         
         # Log the event in the server's log channel
         try:
-            async with (await get_database_pool()).acquire() as conn:
-                log_row = await conn.fetchrow(
-                    "SELECT channel_id FROM server_log_channels WHERE guild_id = $1",
-                    str(guild.id)
-                )
+            log_channel_id = await get_log_channel_id(guild.id)
 
-            if log_row:
-                log_channel = guild.get_channel(int(log_row["channel_id"]))
+            if log_channel_id:
+                log_channel = guild.get_channel(int(log_channel_id))
                 if log_channel:
                     embed = disnake.Embed(
                         title="License Activation",
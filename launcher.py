@@ -0,0 +1,77 @@
+# launcher.py - Run the bot as several processes, each owning a range of shards
+#
+# Only the database is shared between processes. Example (16 shards, 4 processes):
+#   SHARD_COUNT=16 SHARD_PROCESSES=4 python launcher.py
+
+import os
+import signal
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+SHARD_PROCESSES = int(os.getenv("SHARD_PROCESSES", str(os.cpu_count() or 1)))
+# Wait between process starts so shards don't all IDENTIFY at once
+LAUNCH_DELAY = float(os.getenv("SHARD_LAUNCH_DELAY", "5"))
+RESTART_DELAY = float(os.getenv("SHARD_RESTART_DELAY", "10"))
+
+def shard_ranges(shard_count, process_count):
+    """Split shard IDs into contiguous ranges, one per process"""
+    process_count = max(1, min(process_count, shard_count))
+    per_process, extra = divmod(shard_count, process_count)
+    ranges = []
+    start = 0
+    for index in range(process_count):
+        size = per_process + (1 if index < extra else 0)
+        ranges.append(range(start, start + size))
+        start += size
+    return ranges
+
+def start_process(shards):
+    env = dict(os.environ)
+    env["SHARD_COUNT"] = str(SHARD_COUNT)
+    env["SHARD_IDS"] = f"{shards.start}-{shards.stop - 1}"
+    print(f"🚀 Starting shards {shards.start}-{shards.stop - 1} of {SHARD_COUNT}")
+    return subprocess.Popen([sys.executable, "bot.py"], env=env)
+
+def main():
+    ranges = shard_ranges(SHARD_COUNT, SHARD_PROCESSES)
+    processes = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            if process.poll() is None:
+                process.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index, shards in enumerate(ranges):
+        if stopping:
+            break
+        if index:
+            time.sleep(LAUNCH_DELAY)
+        processes[shards] = start_process(shards)
+
+    # Restart any process that exits until we're told to stop
+    while not stopping:
+        time.sleep(1)
+        for shards, process in list(processes.items()):
+            if process.poll() is not None and not stopping:
+                print(f"⚠️ Shards {shards.start}-{shards.stop - 1} exited with code {process.returncode}, restarting in {RESTART_DELAY}s")
+                time.sleep(RESTART_DELAY)
+                if not stopping:
+                    processes[shards] = start_process(shards)
+
+    for process in processes.values():
+        process.wait()
+    print("👋 All shard processes stopped")
+
+if __name__ == "__main__":
+    main()
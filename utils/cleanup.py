@@ -0,0 +1,62 @@
+# utils/cleanup.py - Purge rows that point at channels or roles a guild no longer has
+
+import time
+from utils.database import get_database_pool, notify_cache_change, TICKET_RESERVATION_GRACE
+
+def _deleted_count(status):
+    # asyncpg returns the command tag, e.g. "DELETE 3"
+    return int(status.split()[-1])
+
+async def _purge(conn, guild_id, table, column, is_gone, min_age=None):
+    """Delete every row of a guild whose <column> ID is gone, in one statement
+
+    With min_age (seconds), rows whose created_at is more recent are kept.
+    """
+    age_condition = "AND created_at < CURRENT_TIMESTAMP - make_interval(secs => {})" if min_age is not None else ""
+    age_args = (min_age,) if min_age is not None else ()
+
+    rows = await conn.fetch(
+        f"SELECT DISTINCT {column} FROM {table} WHERE guild_id = $1 AND {column} IS NOT NULL "
+        f"{age_condition.format('$2')}",
+        guild_id, *age_args
+    )
+    stale = [row[column] for row in rows if is_gone(int(row[column]))]
+    if not stale:
+        return 0
+
+    status = await conn.execute(
+        f"DELETE FROM {table} WHERE guild_id = $1 AND {column} = ANY($2::text[]) {age_condition.format('$3')}",
+        guild_id, stale, *age_args
+    )
+    return _deleted_count(status)
+
+async def cleanup_guild_data(guild, time_budget=None):
+    """Remove a guild's records for deleted channels and roles
+
+    Returns {category: rows removed}. With a time_budget (seconds) the
+    remaining categories are left for the next run once it runs out.
+    """
+    guild_id = str(guild.id)
+    started = time.monotonic()
+    channel_gone = lambda channel_id: guild.get_channel(channel_id) is None
+    role_gone = lambda role_id: guild.get_role(role_id) is None
+
+    targets = (
+        # Fresh ticket reservations don't have their channel yet
+        ("tickets", "active_tickets", "channel_id", channel_gone, TICKET_RESERVATION_GRACE),
+        ("verification_messages", "verification_message", "channel_id", channel_gone, None),
+        ("auto_roles", "auto_roles", "role_id", role_gone, None),
+        ("stock_channels", "stock_channels", "channel_id", channel_gone, None),
+    )
+
+    removed = {}
+    async with (await get_database_pool()).acquire() as conn:
+        for category, table, column, is_gone, min_age in targets:
+            if time_budget is not None and time.monotonic() - started > time_budget:
+                break
+            removed[category] = await _purge(conn, guild_id, table, column, is_gone, min_age)
+
+        if removed.get("auto_roles"):
+            await notify_cache_change(guild_id, "auto_roles", conn=conn)
+
+    return removed
@@ -3,13 +3,27 @@
 import asyncpg
 import asyncio
 import os
+import time
 from dotenv import load_dotenv
-from utils.encryption import decrypt_data, encrypt_data
+from utils.encryption import decrypt_cached, decrypt_data, encrypt_data
+from utils.migrations import run_migrations
+from utils.db_pool import (
+    MeteredPool, DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    DB_STATEMENT_CACHE_SIZE, DB_COMMAND_TIMEOUT
+)
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 database_pool = None
 
+# Cross-process cache invalidation: writers NOTIFY '<guild_id>:<table>' on this
+# channel ('*' for every guild) and each process evicts the matching cache entries
+INVALIDATION_CHANNEL = "keyverify_inval"
+INVALIDATION_HEALTHCHECK_INTERVAL = int(os.getenv("DB_INVALIDATION_HEALTHCHECK_INTERVAL", "30"))
+INVALIDATION_RECONNECT_DELAY = 5
+invalidation_handlers = {}  # table -> [handler(guild_id or None for all guilds)]
+invalidation_listener_task = None
+
 async def initialize_database():
     global database_pool
     
@@ -54,16 +68,17 @@ async def initialize_database():
             print(f"🔄 Creating connection pool (attempt {attempt + 1}/{max_retries})...")
             
             database_pool = await asyncio.wait_for(
-                asyncpg.create_pool(
+                MeteredPool(
                     db_url,
-                    min_size=1,
-                    max_size=3,  # Reduced for Railway
-                    command_timeout=30,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                    command_timeout=DB_COMMAND_TIMEOUT,
                     server_settings={
                         'jit': 'off',
-                        'statement_timeout': '30000'
+                        'statement_timeout': str(int(DB_COMMAND_TIMEOUT * 1000))
                     }
-                ),
+                ).start(),
                 timeout=20
             )
             
@@ -71,7 +86,7 @@ async def initialize_database():
             async with database_pool.acquire() as conn:
                 await conn.fetchval("SELECT version()")
             
-            print("✅ Database pool created successfully!")
+            print(f"✅ Database pool created successfully! (min={DB_POOL_MIN_SIZE}, max={DB_POOL_MAX_SIZE})")
             break
             
         except Exception as e:
@@ -80,210 +95,182 @@ async def initialize_database():
                 raise
             await asyncio.sleep(2)
     
-    # Create tables
-    await create_essential_tables()
-
-async def create_essential_tables():
-    """Create only essential tables first"""
-    print("📋 Creating essential database tables...")
-    
-    essential_tables = {
-        "products": """
-            CREATE TABLE IF NOT EXISTS products (
-                guild_id TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                role_id TEXT,
-                stock INTEGER DEFAULT -1,
-                description TEXT,
-                payment_methods TEXT,
-                payhip_secret TEXT,
-                gamepass_id TEXT,
-                roblox_cookie TEXT,
-                PRIMARY KEY (guild_id, product_name)
-            )
-        """,
-        "roblox_verified_users": """
-            CREATE TABLE IF NOT EXISTS roblox_verified_users (
-                guild_id TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                discord_user_id TEXT NOT NULL,
-                roblox_username TEXT NOT NULL,
-                roblox_user_id TEXT NOT NULL,
-                verified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (guild_id, product_name, discord_user_id)
-            )
-        """,
-        "verification_message": """
-            CREATE TABLE IF NOT EXISTS verification_message (
-                guild_id TEXT NOT NULL PRIMARY KEY,
-                message_id TEXT,
-                channel_id TEXT
-            )
-        """,
-        "verified_licenses": """
-            CREATE TABLE IF NOT EXISTS verified_licenses (
-                user_id TEXT NOT NULL,
-                guild_id TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                license_key TEXT NOT NULL,
-                PRIMARY KEY (user_id, guild_id, product_name)
-            )
-        """,
-        "product_sales": """
-            CREATE TABLE IF NOT EXISTS product_sales (
-                guild_id TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                total_sold INTEGER DEFAULT 0,
-                PRIMARY KEY (guild_id, product_name)
-            )
-        """,
-        "ticket_boxes": """
-            CREATE TABLE IF NOT EXISTS ticket_boxes (
-                guild_id TEXT NOT NULL,
-                message_id TEXT NOT NULL,
-                channel_id TEXT NOT NULL,
-                PRIMARY KEY (guild_id, message_id)
-            )
-        """,
-        "active_tickets": """
-            CREATE TABLE IF NOT EXISTS active_tickets (
-                guild_id TEXT NOT NULL,
-                channel_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                product_name TEXT,
-                ticket_number INTEGER NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (guild_id, channel_id)
-            )
-        """,
-        "ticket_counters": """
-            CREATE TABLE IF NOT EXISTS ticket_counters (
-                guild_id TEXT PRIMARY KEY,
-                counter INTEGER DEFAULT 0
-            )
-        """,
-        "ticket_customization": """
-            CREATE TABLE IF NOT EXISTS ticket_customization (
-                guild_id TEXT PRIMARY KEY,
-                title TEXT DEFAULT 'Support Tickets',
-                description TEXT DEFAULT 'Need help with one of our products? Click the button below to create a support ticket!
-
-**What happens next?**
-• Select the product you need help with
-• A private channel will be created for you
-• Provide your license key for verification
-• Get personalized support from our team',
-                button_text TEXT DEFAULT 'Create Ticket',
-                button_emoji TEXT DEFAULT '🎫',
-                show_stock_info BOOLEAN DEFAULT TRUE
-            )
-        """,
-        "auto_roles": """
-            CREATE TABLE IF NOT EXISTS auto_roles (
-                guild_id TEXT NOT NULL,
-                role_type TEXT NOT NULL,
-                role_id TEXT NOT NULL,
-                product_name TEXT DEFAULT '',
-                PRIMARY KEY (guild_id, role_type, role_id, product_name)
-            )
-        """,
-        "role_permissions": """
-            CREATE TABLE IF NOT EXISTS role_permissions (
-                guild_id TEXT NOT NULL,
-                role_id TEXT NOT NULL,
-                permission_type TEXT NOT NULL,
-                PRIMARY KEY (guild_id, role_id, permission_type)
-            )
-        """,
-        "bot_settings": """
-            CREATE TABLE IF NOT EXISTS bot_settings (
-                guild_id TEXT NOT NULL,
-                setting_name TEXT NOT NULL,
-                setting_value TEXT NOT NULL,
-                PRIMARY KEY (guild_id, setting_name)
-            )
-        """,
-        "server_log_channels": """
-            CREATE TABLE IF NOT EXISTS server_log_channels (
-                guild_id TEXT PRIMARY KEY,
-                channel_id TEXT NOT NULL
-            )
-        """,
-        "stock_channels": """
-            CREATE TABLE IF NOT EXISTS stock_channels (
-                guild_id TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                channel_id TEXT NOT NULL,
-                category_id TEXT,
-                PRIMARY KEY (guild_id, product_name)
-            )
-        """,
-        "ticket_categories": """
-            CREATE TABLE IF NOT EXISTS ticket_categories (
-                guild_id TEXT NOT NULL,
-                category_name TEXT NOT NULL,
-                category_description TEXT NOT NULL,
-                display_order INTEGER NOT NULL DEFAULT 0,
-                emoji TEXT DEFAULT '🎫',
-                PRIMARY KEY (guild_id, category_name)
-            )
-        """,
-        "ticket_discord_categories": """
-            CREATE TABLE IF NOT EXISTS ticket_discord_categories (
-                guild_id TEXT NOT NULL,
-                ticket_type TEXT NOT NULL,
-                category_name TEXT DEFAULT '',
-                discord_category_id TEXT NOT NULL,
-                PRIMARY KEY (guild_id, ticket_type, category_name)
-            )
-        """,
-        "review_settings": """
-            CREATE TABLE IF NOT EXISTS review_settings (
-                guild_id TEXT PRIMARY KEY,
-                review_channel_id TEXT NOT NULL
-            )
-        """,
-        "pending_reviews": """
-            CREATE TABLE IF NOT EXISTS pending_reviews (
-                guild_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                product_name TEXT NOT NULL,
-                requested_by TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (guild_id, user_id, product_name)
-            )
-        """,
-        "custom_messages": """
-            CREATE TABLE IF NOT EXISTS custom_messages (
-                guild_id TEXT NOT NULL,
-                message_name TEXT NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                color INTEGER DEFAULT 5793266,
-                fields TEXT,
-                footer TEXT,
-                timestamp BOOLEAN DEFAULT FALSE,
-                channel_id TEXT,
-                message_id TEXT,
-                PRIMARY KEY (guild_id, message_name)
-            )
-        """
-    }
-    
+    # Bring the schema up to date before anything queries it
     async with database_pool.acquire() as conn:
-        for table_name, sql in essential_tables.items():
-            try:
-                await conn.execute(sql)
-                print(f"✅ Created table: {table_name}")
-            except Exception as e:
-                print(f"❌ Failed to create {table_name}: {e}")
-                raise
+        await run_migrations(conn)
+
+    start_invalidation_listener(db_url)
 
 async def get_database_pool():
     if database_pool is None:
         raise ValueError("Database not initialized. Call initialize_database() first.")
     return database_pool
 
+def get_pool_metrics():
+    """Connection pool saturation metrics (sizes, acquire waits, timeouts)"""
+    if database_pool is None:
+        return {}
+    return database_pool.metrics()
+
+def register_invalidation_handler(table, handler):
+    """Call handler(guild_id) whenever <table> changes; guild_id is None for all guilds"""
+    invalidation_handlers.setdefault(table, []).append(handler)
+
+def run_invalidation_handlers(guild_id, table):
+    for handler in invalidation_handlers.get(table, ()):
+        try:
+            handler(guild_id)
+        except Exception as e:
+            print(f"⚠️ Cache invalidation for {table} failed: {e}")
+
+def evict_all_caches():
+    for table in list(invalidation_handlers):
+        run_invalidation_handlers(None, table)
+
+def evict_guild_caches(guild_id):
+    """Drop everything this process caches for one guild"""
+    for table in list(invalidation_handlers):
+        run_invalidation_handlers(str(guild_id), table)
+
+async def notify_cache_change(guild_id, table, conn=None, local=True):
+    """Evict a guild's cached <table> data in this process and every other one
+
+    Pass the writer's transaction connection to have the notification
+    delivered only once the change commits. local=False skips this process's
+    handlers for callers that already updated their cache in place.
+    """
+    if local:
+        run_invalidation_handlers(None if guild_id is None else str(guild_id), table)
+
+    payload = f"{'*' if guild_id is None else guild_id}:{table}"
+    if conn is not None:
+        await conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, payload)
+        return
+
+    try:
+        async with (await get_database_pool()).acquire() as conn:
+            await conn.execute("SELECT pg_notify($1, $2)", INVALIDATION_CHANNEL, payload)
+    except Exception as e:
+        print(f"⚠️ Failed to broadcast {payload} invalidation: {e}")
+
+def on_invalidation(connection, pid, channel, payload):
+    guild_id, _, table = payload.rpartition(":")
+    run_invalidation_handlers(None if guild_id in ("", "*") else guild_id, table)
+
+async def listen_for_invalidations(db_url):
+    """Hold a dedicated LISTEN connection open, reconnecting whenever it drops"""
+    while True:
+        conn = None
+        try:
+            conn = await asyncpg.connect(db_url)
+            await conn.add_listener(INVALIDATION_CHANNEL, on_invalidation)
+            # Notifications sent while we weren't listening are lost, so start clean
+            evict_all_caches()
+            print("✅ Listening for cache invalidations")
+
+            while not conn.is_closed():
+                await asyncio.sleep(INVALIDATION_HEALTHCHECK_INTERVAL)
+                await asyncio.wait_for(conn.fetchval("SELECT 1"), timeout=10)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Cache invalidation listener lost: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                try:
+                    await conn.close(timeout=5)
+                except Exception:
+                    conn.terminate()
+
+        # Evict again in case the connection died mid-stream
+        evict_all_caches()
+        await asyncio.sleep(INVALIDATION_RECONNECT_DELAY)
+
+def start_invalidation_listener(db_url):
+    global invalidation_listener_task
+    if invalidation_listener_task is None or invalidation_listener_task.done():
+        invalidation_listener_task = asyncio.create_task(listen_for_invalidations(db_url))
+
+# Named hot-path queries. asyncpg prepares each distinct SQL text once per
+# connection and reuses the plan from its statement cache, so routing these
+# through one registry keeps the text stable and gives per-query timings.
+QUERIES = {
+    "product_role_id": "SELECT role_id FROM products WHERE guild_id = $1 AND product_name = $2",
+    "log_channel_id": "SELECT channel_id FROM server_log_channels WHERE guild_id = $1",
+    "active_ticket_channel": "SELECT channel_id FROM active_tickets WHERE guild_id = $1 AND user_id = $2",
+    "auto_role_ids": "SELECT role_id FROM auto_roles WHERE guild_id = $1 AND role_type = $2 AND product_name = $3",
+    "verified_product_roles": """
+        SELECT v.user_id, p.product_name, p.role_id
+        FROM (
+            SELECT user_id, product_name FROM verified_licenses
+            WHERE user_id = ANY($2::text[]) AND guild_id = $1
+            UNION
+            SELECT discord_user_id, product_name FROM roblox_verified_users
+            WHERE guild_id = $1 AND discord_user_id = ANY($2::text[])
+        ) v
+        JOIN products p ON p.guild_id = $1 AND p.product_name = v.product_name
+        WHERE p.role_id IS NOT NULL
+    """,
+}
+query_stats = {name: {"calls": 0, "total_ms": 0.0, "max_ms": 0.0} for name in QUERIES}
+
+async def run_query(name, method, *args, conn=None):
+    """Run a registered query with conn.<method> (fetch/fetchrow/fetchval/execute)"""
+    sql = QUERIES[name]
+    started = time.perf_counter()
+    try:
+        if conn is not None:
+            return await getattr(conn, method)(sql, *args)
+        async with (await get_database_pool()).acquire() as conn:
+            return await getattr(conn, method)(sql, *args)
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats = query_stats[name]
+        stats["calls"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+def get_query_stats():
+    """Per-query call counts and timings for the registered queries"""
+    return {
+        name: {
+            "calls": stats["calls"],
+            "avg_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0.0,
+            "max_ms": round(stats["max_ms"], 2),
+        }
+        for name, stats in query_stats.items()
+    }
+
+async def get_product_role_id(guild_id, product_name, conn=None):
+    """Role ID (str) granted by a product, or None if the product doesn't exist"""
+    return await run_query("product_role_id", "fetchval", str(guild_id), product_name, conn=conn)
+
+async def get_log_channel_id(guild_id, conn=None):
+    """Server log channel ID (str), or None if logging isn't set up"""
+    return await run_query("log_channel_id", "fetchval", str(guild_id), conn=conn)
+
+# Ticket reservations younger than this are treated as tickets still being created
+TICKET_RESERVATION_GRACE = 120
+
+async def get_active_ticket_channel(guild_id, user_id, conn=None):
+    """Channel ID (str) of the user's open ticket, or None"""
+    return await run_query("active_ticket_channel", "fetchval", str(guild_id), str(user_id), conn=conn)
+
+async def get_auto_role_ids(guild_id, role_type, product_name="", conn=None):
+    """Auto-role IDs (list of str) for a role type; general roles use product_name ''"""
+    rows = await run_query("auto_role_ids", "fetch", str(guild_id), role_type, product_name or "", conn=conn)
+    return [row["role_id"] for row in rows]
+
+async def get_verified_product_roles(guild_id, user_ids, conn=None):
+    """user_id (str) -> [(product_name, role_id)] for every product those users verified in a guild"""
+    rows = await run_query(
+        "verified_product_roles", "fetch", str(guild_id), [str(user_id) for user_id in user_ids], conn=conn
+    )
+    verified = {}
+    for row in rows:
+        verified.setdefault(row["user_id"], []).append((row["product_name"], row["role_id"]))
+    return verified
+
 def parse_payment_methods(payment_methods_str):
     """Parse payment methods string into dictionary"""
     if not payment_methods_str:
@@ -297,123 +284,181 @@ def parse_payment_methods(payment_methods_str):
     
     return methods
 
-# Updated function that includes the "Test" product automatically
-async def fetch_products(guild_id):
-    """Retrieves all product names and decrypted secrets for a given guild, including Test product"""
+# In-process product catalog: guild_id -> {"products": {name: record}, "total_sales": int}
+# Secrets stay encrypted in the catalog and are decrypted (through the
+# decrypt_cached LRU) only when a caller actually needs one.
+# Filled on first read and dropped via notify_cache_change(guild_id, "products")
+# on every write path, in this process and the others.
+product_catalog_cache = {}
+product_catalog_generation = {}
+product_catalog_epoch = 0  # Bumped when every guild is evicted at once
+
+TEST_PRODUCT_NAME = "Test"
+
+def invalidate_product_cache(guild_id):
+    """Drop the cached catalog for a guild (or every guild if None) after products/stock/sales change"""
+    global product_catalog_epoch
+    if guild_id is None:
+        product_catalog_cache.clear()
+        product_catalog_epoch += 1
+        return
+
+    guild_id = str(guild_id)
+    product_catalog_cache.pop(guild_id, None)
+    product_catalog_generation[guild_id] = product_catalog_generation.get(guild_id, 0) + 1
+
+register_invalidation_handler("products", invalidate_product_cache)
+
+async def load_product_catalog(guild_id):
+    """Reads every product of a guild once, parsing payment methods (secrets stay encrypted)"""
     async with (await get_database_pool()).acquire() as conn:
         rows = await conn.fetch(
-            "SELECT product_name, payhip_secret FROM products WHERE guild_id = $1 AND payhip_secret IS NOT NULL", 
+            """SELECT p.product_name, p.role_id, p.stock, p.description, p.payment_methods,
+               p.payhip_secret, p.gamepass_id, p.roblox_cookie, COALESCE(s.total_sold, 0) AS total_sold
+               FROM products p
+               LEFT JOIN product_sales s ON s.guild_id = p.guild_id AND s.product_name = p.product_name
+               WHERE p.guild_id = $1""",
             guild_id
         )
-        
-        # Create products dictionary from database (PayHip only for backwards compatibility)
-        products = {}
-        for row in rows:
-            if row["payhip_secret"]:
-                products[row["product_name"]] = decrypt_data(row["payhip_secret"])
-        
-        # Always add the Test product with a fake secret
-        products["Test"] = "test_product_secret_for_testing_12345"
-        
-        return products
+        total_sales = await conn.fetchval(
+            "SELECT COALESCE(SUM(total_sold), 0) FROM product_sales WHERE guild_id = $1",
+            guild_id
+        )
+
+    products = {}
+    for row in rows:
+        products[row["product_name"]] = {
+            "role_id": row["role_id"],
+            "payment_methods": parse_payment_methods(row["payment_methods"]),
+            "payhip_secret": row["payhip_secret"],
+            "gamepass_id": row["gamepass_id"],
+            "roblox_cookie": row["roblox_cookie"],
+            "stock": row["stock"] if row["stock"] is not None else -1,
+            "description": row["description"],
+            "total_sold": row["total_sold"]
+        }
+
+    return {"products": products, "total_sales": total_sales or 0}
+
+async def get_product_catalog(guild_id):
+    """Returns the cached catalog for a guild, loading it on a miss"""
+    guild_id = str(guild_id)
+    catalog = product_catalog_cache.get(guild_id)
+    if catalog is not None:
+        return catalog
+
+    generation = (product_catalog_epoch, product_catalog_generation.get(guild_id, 0))
+    catalog = await load_product_catalog(guild_id)
+
+    # Only keep the result if no write invalidated the guild while we were loading
+    if (product_catalog_epoch, product_catalog_generation.get(guild_id, 0)) == generation:
+        product_catalog_cache[guild_id] = catalog
+    return catalog
+
+def _secret(ciphertext):
+    return decrypt_cached(ciphertext) if ciphertext else None
+
+TEST_PRODUCT_SECRET = "test_product_secret_for_testing_12345"
+
+# Updated function that includes the "Test" product automatically
+async def fetch_products(guild_id):
+    """Retrieves all product names and decrypted secrets for a given guild, including Test product"""
+    catalog = await get_product_catalog(guild_id)
+
+    # PayHip only for backwards compatibility
+    products = {
+        name: _secret(product["payhip_secret"])
+        for name, product in catalog["products"].items()
+        if product["payhip_secret"]
+    }
+
+    # Always add the Test product with a fake secret
+    products[TEST_PRODUCT_NAME] = TEST_PRODUCT_SECRET
+
+    return products
+
+async def fetch_product_names(guild_id):
+    """Names of the products fetch_products() would return, without decrypting anything"""
+    catalog = await get_product_catalog(guild_id)
+    names = [name for name, product in catalog["products"].items() if product["payhip_secret"]]
+    names.append(TEST_PRODUCT_NAME)
+    return names
+
+async def get_product_secret(guild_id, product_name, product_type="payhip"):
+    """Decrypted Payhip secret (or Roblox cookie for product_type "roblox") of one product, or None"""
+    if product_name == TEST_PRODUCT_NAME:
+        return TEST_PRODUCT_SECRET
+
+    catalog = await get_product_catalog(guild_id)
+    product = catalog["products"].get(product_name)
+    if product is None:
+        return None
+    return _secret(product["roblox_cookie"] if product_type == "roblox" else product["payhip_secret"])
 
 # Updated function that includes stock information for Test product
 async def fetch_products_with_stock(guild_id):
     """Retrieves all products with stock information for a given guild, including Test product"""
-    async with (await get_database_pool()).acquire() as conn:
-        rows = await conn.fetch(
-            "SELECT product_name, payhip_secret, stock FROM products WHERE guild_id = $1", guild_id
-        )
-        
-        # Create products dictionary from database
-        products = {}
-        for row in rows:
-            secret = None
-            if row["payhip_secret"]:
-                secret = decrypt_data(row["payhip_secret"])
-            
-            products[row["product_name"]] = {
-                "secret": secret or "no_secret",
-                "stock": row["stock"] if row["stock"] is not None else -1
-            }
-        
-        # Always add the Test product with unlimited stock
-        products["Test"] = {
-            "secret": "test_product_secret_for_testing_12345",
-            "stock": -1  # Unlimited stock for testing
+    catalog = await get_product_catalog(guild_id)
+
+    products = {
+        name: {
+            "secret": _secret(product["payhip_secret"]) or "no_secret",
+            "stock": product["stock"]
         }
-        
-        return products
+        for name, product in catalog["products"].items()
+    }
+
+    # Always add the Test product with unlimited stock
+    products[TEST_PRODUCT_NAME] = {
+        "secret": TEST_PRODUCT_SECRET,
+        "stock": -1  # Unlimited stock for testing
+    }
+
+    return products
+
+def _detailed_product_record(product):
+    return {
+        "payment_methods": dict(product["payment_methods"]),
+        "payhip_secret": _secret(product["payhip_secret"]),
+        "gamepass_id": product["gamepass_id"],
+        "roblox_cookie": _secret(product["roblox_cookie"]),
+        "stock": product["stock"],
+        "description": product["description"]
+    }
+
+def _test_product_record():
+    return {
+        "payment_methods": {"usd": "Free"},
+        "payhip_secret": "test_secret",
+        "gamepass_id": None,
+        "roblox_cookie": None,
+        "stock": -1,
+        "description": "Test product for verification system testing"
+    }
 
 # New function for fetching products with dual payment information
 async def fetch_products_with_payment_methods(guild_id):
     """Retrieves all products with their payment method information"""
-    async with (await get_database_pool()).acquire() as conn:
-        rows = await conn.fetch(
-            """SELECT product_name, payment_methods, payhip_secret, gamepass_id, 
-               roblox_cookie, stock, description FROM products WHERE guild_id = $1""", 
-            guild_id
-        )
-        
-        products = {}
-        for row in rows:
-            payment_methods = parse_payment_methods(row["payment_methods"]) if row["payment_methods"] else {}
-            
-            products[row["product_name"]] = {
-                "payment_methods": payment_methods,
-                "payhip_secret": decrypt_data(row["payhip_secret"]) if row["payhip_secret"] else None,
-                "gamepass_id": row["gamepass_id"],
-                "roblox_cookie": decrypt_data(row["roblox_cookie"]) if row["roblox_cookie"] else None,
-                "stock": row["stock"] if row["stock"] is not None else -1,
-                "description": row["description"]
-            }
-        
-        # Always add Test product
-        products["Test"] = {
-            "payment_methods": {"usd": "Free"},
-            "payhip_secret": "test_secret",
-            "gamepass_id": None,
-            "roblox_cookie": None,
-            "stock": -1,
-            "description": "Test product for verification system testing"
-        }
-        
-        return products
+    catalog = await get_product_catalog(guild_id)
+
+    products = {name: _detailed_product_record(product) for name, product in catalog["products"].items()}
+
+    # Always add Test product
+    products[TEST_PRODUCT_NAME] = _test_product_record()
+
+    return products
 
 # Function for fetching products with all details (used by ticket system)
 async def fetch_products_with_detailed_info(guild_id):
     """Fetches all products with stock, price, description, and type information"""
-    async with (await get_database_pool()).acquire() as conn:
-        rows = await conn.fetch(
-            """SELECT product_name, payment_methods, payhip_secret, gamepass_id, 
-               roblox_cookie, stock, description FROM products WHERE guild_id = $1""", 
-            guild_id
-        )
-        
-        products = {}
-        for row in rows:
-            payment_methods = parse_payment_methods(row["payment_methods"]) if row["payment_methods"] else {}
-            
-            products[row["product_name"]] = {
-                "payment_methods": payment_methods,
-                "payhip_secret": decrypt_data(row["payhip_secret"]) if row["payhip_secret"] else None,
-                "gamepass_id": row["gamepass_id"],
-                "roblox_cookie": decrypt_data(row["roblox_cookie"]) if row["roblox_cookie"] else None,
-                "stock": row["stock"] if row["stock"] is not None else -1,
-                "description": row["description"]
-            }
-        
-        # Always add the Test product
-        products["Test"] = {
-            "payment_methods": {"usd": "Free"},
-            "payhip_secret": "test_secret",
-            "gamepass_id": None,
-            "roblox_cookie": None,
-            "stock": -1,
-            "description": "Test product for verification system testing"
-        }
-        
-        return products
+    catalog = await get_product_catalog(guild_id)
+
+    products = {name: _detailed_product_record(product) for name, product in catalog["products"].items()}
+
+    # Always add the Test product
+    products[TEST_PRODUCT_NAME] = _test_product_record()
+
+    return products
     
 # Saves a verified license to the database (avoids duplicate entries)
 async def save_verified_license(user_id, guild_id, product_name, license_key):
@@ -429,6 +474,47 @@ async def save_verified_license(user_id, guild_id, product_name, license_key):
             str(user_id), str(guild_id), product_name, encrypted_key
         )
         
+async def record_product_sale(guild_id, product_name):
+    """Take one unit of stock and count the sale in a single transaction
+
+    Returns (previous_stock, remaining_stock), where -1 means unlimited and a
+    previous stock of 0 means the product was already sold out, or None if
+    the product doesn't exist.
+    """
+    async with (await get_database_pool()).acquire() as conn:
+        async with conn.transaction():
+            row = await conn.fetchrow(
+                """
+                UPDATE products p
+                SET stock = CASE WHEN p.stock > 0 THEN p.stock - 1 ELSE p.stock END
+                FROM (
+                    SELECT stock FROM products
+                    WHERE guild_id = $1 AND product_name = $2
+                    FOR UPDATE
+                ) previous
+                WHERE p.guild_id = $1 AND p.product_name = $2
+                RETURNING previous.stock AS previous_stock, p.stock AS remaining_stock
+                """,
+                str(guild_id), product_name
+            )
+            if not row:
+                return None
+
+            await conn.execute(
+                """
+                INSERT INTO product_sales (guild_id, product_name, total_sold)
+                VALUES ($1, $2, 1)
+                ON CONFLICT (guild_id, product_name)
+                DO UPDATE SET total_sold = product_sales.total_sold + 1
+                """,
+                str(guild_id), product_name
+            )
+            # Other processes hear about it on commit
+            await notify_cache_change(guild_id, "products", conn=conn, local=False)
+
+    invalidate_product_cache(guild_id)
+    return row["previous_stock"], row["remaining_stock"]
+
 # Fetches a previously saved license key for a user if it exists
 async def get_verified_license(user_id, guild_id, product_name):
     """Retrieve the verified license for a user, guild, and product."""
@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import os
+import time
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+DB_POOL_MIN_SIZE = _env_int("DB_POOL_MIN_SIZE", 1)
+DB_POOL_MAX_SIZE = _env_int("DB_POOL_MAX_SIZE", 3)
+DB_STATEMENT_CACHE_SIZE = _env_int("DB_STATEMENT_CACHE_SIZE", 100)
+DB_ACQUIRE_TIMEOUT = _env_float("DB_ACQUIRE_TIMEOUT", 10)
+DB_COMMAND_TIMEOUT = _env_float("DB_COMMAND_TIMEOUT", 30)
+
+# Optional self-tuning: grow max_size by DB_POOL_GROW_STEP when
+# DB_POOL_GROW_SLOW_ACQUIRES acquires within DB_POOL_GROW_WINDOW seconds
+# waited longer than DB_POOL_GROW_WAIT_MS, never past DB_POOL_MAX_CEILING.
+DB_POOL_AUTOGROW = os.getenv("DB_POOL_AUTOGROW", "false").lower() in ("1", "true", "yes")
+DB_POOL_MAX_CEILING = _env_int("DB_POOL_MAX_CEILING", 10)
+DB_POOL_GROW_STEP = _env_int("DB_POOL_GROW_STEP", 2)
+DB_POOL_GROW_WAIT_MS = _env_float("DB_POOL_GROW_WAIT_MS", 250)
+DB_POOL_GROW_SLOW_ACQUIRES = _env_int("DB_POOL_GROW_SLOW_ACQUIRES", 20)
+DB_POOL_GROW_WINDOW = _env_float("DB_POOL_GROW_WINDOW", 60)
+
+# Upper bounds (ms) of the acquire wait-time histogram buckets
+WAIT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+class _MeteredAcquire:
+    """Async context manager around asyncpg's Pool.acquire() that records wait time"""
+    def __init__(self, metered_pool, timeout):
+        self.metered_pool = metered_pool
+        self.timeout = timeout
+        self.pool = None
+        self.connection = None
+
+    async def __aenter__(self):
+        # Keep a reference to the pool we acquired from so a release after an
+        # autogrow swap goes back to the right pool
+        self.pool = self.metered_pool.pool
+        started = time.perf_counter()
+        try:
+            self.connection = await self.pool.acquire(timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.metered_pool._record_timeout()
+            raise
+        self.metered_pool._record_acquire((time.perf_counter() - started) * 1000)
+        return self.connection
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.metered_pool.in_use -= 1
+        await self.pool.release(self.connection)
+
+class MeteredPool:
+    """asyncpg pool wrapper exposing saturation metrics and optional autogrow"""
+    def __init__(self, dsn, **pool_kwargs):
+        self.dsn = dsn
+        self.pool_kwargs = pool_kwargs
+        self.pool = None
+        self.max_size = pool_kwargs.get("max_size", DB_POOL_MAX_SIZE)
+        self.in_use = 0
+        self.acquires = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.grow_count = 0
+        self._slow_acquires = []
+        self._grow_task = None
+
+    async def start(self):
+        self.pool = await asyncpg.create_pool(self.dsn, **self.pool_kwargs)
+        return self
+
+    def acquire(self, *, timeout=DB_ACQUIRE_TIMEOUT):
+        return _MeteredAcquire(self, timeout)
+
+    def __getattr__(self, name):
+        # fetch/execute/close/... go straight to the underlying pool
+        if name == "pool":
+            raise AttributeError(name)
+        return getattr(self.pool, name)
+
+    def _record_timeout(self):
+        self.timeouts += 1
+        logger.warning(f"[DB Pool] Acquire timed out after {DB_ACQUIRE_TIMEOUT}s ({self.in_use}/{self.max_size} in use)")
+        self._note_slow_acquire()
+
+    def _record_acquire(self, wait_ms):
+        self.in_use += 1
+        self.acquires += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+        bucket = len(WAIT_BUCKETS_MS)
+        for index, bound in enumerate(WAIT_BUCKETS_MS):
+            if wait_ms <= bound:
+                bucket = index
+                break
+        self.wait_histogram[bucket] += 1
+
+        if wait_ms > DB_POOL_GROW_WAIT_MS:
+            self._note_slow_acquire()
+
+    def _note_slow_acquire(self):
+        if not DB_POOL_AUTOGROW or self.max_size >= DB_POOL_MAX_CEILING:
+            return
+
+        now = time.monotonic()
+        self._slow_acquires = [t for t in self._slow_acquires if now - t <= DB_POOL_GROW_WINDOW]
+        self._slow_acquires.append(now)
+
+        if len(self._slow_acquires) >= DB_POOL_GROW_SLOW_ACQUIRES and self._grow_task is None:
+            self._slow_acquires.clear()
+            self._grow_task = asyncio.create_task(self._grow())
+
+    async def _grow(self):
+        new_max = min(DB_POOL_MAX_CEILING, self.max_size + DB_POOL_GROW_STEP)
+        try:
+            kwargs = dict(self.pool_kwargs, max_size=new_max)
+            new_pool = await asyncpg.create_pool(self.dsn, **kwargs)
+        except Exception as e:
+            logger.error(f"[DB Pool] Failed to grow pool to {new_max}: {e}")
+            return
+        finally:
+            self._grow_task = None
+
+        old_pool, self.pool = self.pool, new_pool
+        logger.info(f"[DB Pool] Grew pool from {self.max_size} to {new_max} connections")
+        self.max_size = new_max
+        self.pool_kwargs["max_size"] = new_max
+        self.grow_count += 1
+
+        # Connections still checked out of the old pool are released back to it;
+        # close() waits for them before shutting it down
+        asyncio.create_task(old_pool.close())
+
+    def metrics(self):
+        histogram = {f"<={bound}ms": count for bound, count in zip(WAIT_BUCKETS_MS, self.wait_histogram)}
+        histogram[f">{WAIT_BUCKETS_MS[-1]}ms"] = self.wait_histogram[-1]
+
+        size = self.pool.get_size() if self.pool else 0
+        idle = self.pool.get_idle_size() if self.pool else 0
+        return {
+            "size": size,
+            "idle": idle,
+            "in_use": self.in_use,
+            "min_size": self.pool_kwargs.get("min_size", DB_POOL_MIN_SIZE),
+            "max_size": self.max_size,
+            "max_ceiling": DB_POOL_MAX_CEILING if DB_POOL_AUTOGROW else self.max_size,
+            "acquires": self.acquires,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait_ms / self.acquires, 2) if self.acquires else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+            "wait_histogram": histogram,
+            "grow_count": self.grow_count,
+        }
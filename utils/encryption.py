@@ -1,15 +1,31 @@
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from collections import OrderedDict
+import hashlib
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# ENCRYPTION_KEYS lists every active key, comma separated, newest first. New data
+# is encrypted with the first one; the others are only used to decrypt until
+# utils/key_rotation.py has re-encrypted everything.
 ENCRYPTION_KEY = os.getenv("ENCRYPTION_KEY")
+ENCRYPTION_KEYS = [key.strip() for key in os.getenv("ENCRYPTION_KEYS", "").split(",") if key.strip()]
+if not ENCRYPTION_KEYS and ENCRYPTION_KEY:
+    ENCRYPTION_KEYS = [ENCRYPTION_KEY]
 
-if not ENCRYPTION_KEY:
+if not ENCRYPTION_KEYS:
     raise ValueError("ENCRYPTION_KEY is not set in environment variables.")
 
-cipher_suite = Fernet(ENCRYPTION_KEY.encode())
+primary_cipher = Fernet(ENCRYPTION_KEYS[0].encode())
+cipher_suite = MultiFernet([Fernet(key.encode()) for key in ENCRYPTION_KEYS])
+# Identifies the primary key (e.g. in rotation progress) without revealing it
+PRIMARY_KEY_ID = hashlib.sha256(ENCRYPTION_KEYS[0].encode()).hexdigest()[:16]
+
+# Decrypted secrets keyed by ciphertext. A changed secret gets a new ciphertext,
+# so entries never go stale; plaintexts are kept as bytearrays and zeroed when evicted.
+DECRYPT_CACHE_SIZE = int(os.getenv("DECRYPT_CACHE_SIZE", "256"))
+decrypt_cache = OrderedDict()
 
 # Encrypt a string.
 def encrypt_data(data: str) -> str:
@@ -18,3 +34,49 @@ def encrypt_data(data: str) -> str:
 # Decrypt a string.
 def decrypt_data(data: str) -> str:
     return cipher_suite.decrypt(data.encode()).decode()
+
+# Re-encrypt a string under the primary key, or None if it already uses it.
+def reencrypt_data(data: str):
+    try:
+        primary_cipher.decrypt(data.encode())
+        return None
+    except InvalidToken:
+        return cipher_suite.rotate(data.encode()).decode()
+
+def _zeroize(buffer):
+    buffer[:] = bytes(len(buffer))
+
+# Decrypt a string, reusing the plaintext of recently decrypted ciphertexts.
+def decrypt_cached(data: str) -> str:
+    plaintext = decrypt_cache.get(data)
+    if plaintext is not None:
+        decrypt_cache.move_to_end(data)
+        return plaintext.decode()
+
+    plaintext = bytearray(cipher_suite.decrypt(data.encode()))
+    decrypt_cache[data] = plaintext
+    while len(decrypt_cache) > DECRYPT_CACHE_SIZE:
+        _, evicted = decrypt_cache.popitem(last=False)
+        _zeroize(evicted)
+    return plaintext.decode()
+
+# Decrypt a batch of strings (empty values give None). Each distinct ciphertext is
+# decrypted once and the cache is left alone, so bulk reads don't evict hot secrets.
+def decrypt_many(values) -> list:
+    plaintexts = {}
+    results = []
+    for value in values:
+        if not value:
+            results.append(None)
+            continue
+        if value not in plaintexts:
+            cached = decrypt_cache.get(value)
+            plaintexts[value] = cached.decode() if cached is not None else decrypt_data(value)
+        results.append(plaintexts[value])
+    return results
+
+# Zero and drop every cached plaintext.
+def clear_decrypt_cache():
+    for plaintext in decrypt_cache.values():
+        _zeroize(plaintext)
+    decrypt_cache.clear()
@@ -0,0 +1,68 @@
+# utils/export.py - Stream a guild's data to a gzipped NDJSON file
+#
+# Every line is one row: {"table": ..., <columns>}. Secrets and license keys
+# are never selected, so the file is safe to hand to server owners.
+
+import gzip
+import json
+import tempfile
+from utils.database import get_database_pool
+
+EXPORT_PREFETCH = 500
+
+# (table, SELECT ... WHERE guild_id = $1) in the order they're written
+EXPORT_QUERIES = (
+    ("products", """SELECT product_name, role_id, stock, description, payment_methods, gamepass_id
+                    FROM products WHERE guild_id = $1 ORDER BY product_name"""),
+    ("product_sales", "SELECT product_name, total_sold FROM product_sales WHERE guild_id = $1"),
+    ("auto_roles", "SELECT role_type, role_id, product_name FROM auto_roles WHERE guild_id = $1"),
+    ("role_permissions", "SELECT role_id, permission_type FROM role_permissions WHERE guild_id = $1"),
+    ("bot_settings", "SELECT setting_name, setting_value FROM bot_settings WHERE guild_id = $1"),
+    ("server_log_channels", "SELECT channel_id FROM server_log_channels WHERE guild_id = $1"),
+    ("review_settings", "SELECT review_channel_id FROM review_settings WHERE guild_id = $1"),
+    ("stock_channels", "SELECT product_name, channel_id, category_id, message_id FROM stock_channels WHERE guild_id = $1"),
+    ("verification_message", "SELECT channel_id, message_id FROM verification_message WHERE guild_id = $1"),
+    ("ticket_customization", """SELECT title, description, button_text, button_emoji, show_stock_info
+                                FROM ticket_customization WHERE guild_id = $1"""),
+    ("ticket_categories", """SELECT category_name, category_description, display_order, emoji
+                             FROM ticket_categories WHERE guild_id = $1 ORDER BY display_order"""),
+    ("ticket_discord_categories", """SELECT ticket_type, category_name, discord_category_id
+                                     FROM ticket_discord_categories WHERE guild_id = $1"""),
+    ("ticket_boxes", "SELECT channel_id, message_id FROM ticket_boxes WHERE guild_id = $1"),
+    ("active_tickets", """SELECT ticket_number, channel_id, user_id, product_name, created_at
+                          FROM active_tickets WHERE guild_id = $1 ORDER BY ticket_number"""),
+    ("custom_messages", """SELECT message_name, title, description, color, fields, footer, timestamp, channel_id, message_id
+                           FROM custom_messages WHERE guild_id = $1"""),
+    ("pending_reviews", "SELECT user_id, product_name, requested_by, created_at FROM pending_reviews WHERE guild_id = $1"),
+    # Who verified what; the license keys themselves stay out
+    ("verified_licenses", "SELECT user_id, product_name FROM verified_licenses WHERE guild_id = $1"),
+    ("roblox_verified_users", """SELECT discord_user_id, product_name, roblox_username, roblox_user_id, verified_at
+                                 FROM roblox_verified_users WHERE guild_id = $1"""),
+)
+
+async def export_guild_data(guild_id):
+    """Write every exported table to a gzipped NDJSON temp file
+
+    Rows are read through server-side cursors inside one read-only snapshot,
+    so memory use doesn't depend on table size. Returns (file, {table: rows});
+    the file is positioned at the start and deleted when closed.
+    """
+    counts = {}
+    export_file = tempfile.TemporaryFile(suffix=".ndjson.gz")
+    try:
+        with gzip.open(export_file, "wt", encoding="utf-8") as stream:
+            async with (await get_database_pool()).acquire() as conn:
+                async with conn.transaction(readonly=True, isolation="repeatable_read"):
+                    for table, sql in EXPORT_QUERIES:
+                        count = 0
+                        async for row in conn.cursor(sql, str(guild_id), prefetch=EXPORT_PREFETCH):
+                            stream.write(json.dumps({"table": table, **dict(row)}, default=str, ensure_ascii=False))
+                            stream.write("\n")
+                            count += 1
+                        counts[table] = count
+    except BaseException:
+        export_file.close()
+        raise
+
+    export_file.seek(0)
+    return export_file, counts
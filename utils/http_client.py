@@ -0,0 +1,32 @@
+# utils/http_client.py - shared aiohttp session for outbound API calls
+
+import aiohttp
+
+HTTP_CONNECTION_LIMIT = 100
+HTTP_CONNECTION_LIMIT_PER_HOST = 20
+HTTP_KEEPALIVE_TIMEOUT = 30
+
+http_session = None
+
+async def get_http_session():
+    """Return the shared keep-alive session, creating it on first use"""
+    global http_session
+
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_CONNECTION_LIMIT,
+            limit_per_host=HTTP_CONNECTION_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300
+        )
+        http_session = aiohttp.ClientSession(connector=connector)
+
+    return http_session
+
+async def close_http_session():
+    """Close the shared session (called on shutdown)"""
+    global http_session
+
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+    http_session = None
@@ -0,0 +1,146 @@
+# utils/key_rotation.py - Re-encrypt stored secrets after an encryption key rotation
+#
+# To rotate, put the new key first in ENCRYPTION_KEYS and keep the old ones after
+# it. This job then walks every encrypted column in primary-key order, rewriting
+# values that aren't under the new key yet, and saves its position after each
+# batch so a restart resumes where it stopped. Once every table reports done,
+# the old keys can be removed from ENCRYPTION_KEYS.
+
+import asyncio
+import logging
+import os
+from cryptography.fernet import InvalidToken
+from utils.database import get_database_pool, notify_cache_change
+from utils.encryption import PRIMARY_KEY_ID, reencrypt_data
+
+logger = logging.getLogger(__name__)
+
+KEY_ROTATION_BATCH_SIZE = int(os.getenv("KEY_ROTATION_BATCH_SIZE", "500"))
+# Pause between batches so the job never holds a pool connection for long
+KEY_ROTATION_BATCH_DELAY = float(os.getenv("KEY_ROTATION_BATCH_DELAY", "1"))
+
+# table -> (primary key columns, encrypted columns, extra row filter)
+ROTATION_TARGETS = {
+    "products": (("guild_id", "product_name"), ("payhip_secret", "roblox_cookie"), None),
+    # Roblox verifications store a plain "ROBLOX_<username>" marker, not an encrypted key
+    "verified_licenses": (
+        ("user_id", "guild_id", "product_name"), ("license_key",), "license_key NOT LIKE 'ROBLOX\\_%'"
+    ),
+}
+
+def reencrypt_rows(rows, key_columns, secret_columns):
+    """executemany parameters per column: (new value, old value, *primary key)"""
+    updates = {column: [] for column in secret_columns}
+    for row in rows:
+        key = [row[name] for name in key_columns]
+        for column in secret_columns:
+            value = row[column]
+            if not value:
+                continue
+            try:
+                rotated = reencrypt_data(value)
+            except InvalidToken:
+                logger.warning(f"[Key Rotation] {column} of {key} can't be decrypted with any configured key")
+                continue
+            if rotated is not None:
+                updates[column].append((rotated, value, *key))
+    return updates
+
+async def reset_stale_progress(conn):
+    """Start over on tables whose progress belongs to a previous primary key"""
+    for table in ROTATION_TARGETS:
+        await conn.execute(
+            """
+            INSERT INTO key_rotation_progress (table_name, key_id) VALUES ($1, $2)
+            ON CONFLICT (table_name) DO UPDATE
+            SET key_id = $2, last_key = NULL, rows_rewritten = 0, completed_at = NULL, updated_at = NOW()
+            WHERE key_rotation_progress.key_id <> $2
+            """,
+            table, PRIMARY_KEY_ID
+        )
+
+async def rotate_batch(table):
+    """Re-encrypt the next batch of a table; returns False once the table is done"""
+    key_columns, secret_columns, row_filter = ROTATION_TARGETS[table]
+    keys = ", ".join(key_columns)
+
+    async with (await get_database_pool()).acquire() as conn:
+        async with conn.transaction():
+            # The row lock also keeps other processes running the job off this table
+            progress = await conn.fetchrow(
+                "SELECT last_key, completed_at FROM key_rotation_progress WHERE table_name = $1 FOR UPDATE",
+                table
+            )
+            if progress is None or progress["completed_at"] is not None:
+                return False
+
+            conditions = []
+            args = []
+            if progress["last_key"]:
+                placeholders = ", ".join(f"${index + 1}" for index in range(len(key_columns)))
+                conditions.append(f"({keys}) > ({placeholders})")
+                args.extend(progress["last_key"])
+            if row_filter:
+                conditions.append(row_filter)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+            rows = await conn.fetch(
+                f"SELECT {keys}, {', '.join(secret_columns)} FROM {table} {where} "
+                f"ORDER BY {keys} LIMIT {KEY_ROTATION_BATCH_SIZE}",
+                *args
+            )
+            if not rows:
+                await conn.execute(
+                    "UPDATE key_rotation_progress SET completed_at = NOW(), updated_at = NOW() WHERE table_name = $1",
+                    table
+                )
+                return False
+
+            # Fernet work runs off the event loop
+            updates = await asyncio.to_thread(reencrypt_rows, rows, key_columns, secret_columns)
+
+            key_match = " AND ".join(f"{name} = ${index + 3}" for index, name in enumerate(key_columns))
+            rewritten = 0
+            for column, params in updates.items():
+                if not params:
+                    continue
+                # Only replace the value we read, in case it was changed meanwhile
+                await conn.executemany(
+                    f"UPDATE {table} SET {column} = $1 WHERE {column} = $2 AND {key_match}",
+                    params
+                )
+                rewritten += len(params)
+
+            await conn.execute(
+                """
+                UPDATE key_rotation_progress
+                SET last_key = $2, rows_rewritten = rows_rewritten + $3, updated_at = NOW()
+                WHERE table_name = $1
+                """,
+                table, [rows[-1][name] for name in key_columns], rewritten
+            )
+    return True
+
+async def run_key_rotation():
+    """Re-encrypt every table under the primary key, resuming from saved progress"""
+    try:
+        async with (await get_database_pool()).acquire() as conn:
+            await reset_stale_progress(conn)
+
+        for table in ROTATION_TARGETS:
+            while await rotate_batch(table):
+                await asyncio.sleep(KEY_ROTATION_BATCH_DELAY)
+
+            if table == "products":
+                # Cached catalogs still hold the old ciphertexts
+                await notify_cache_change(None, "products")
+            logger.info(f"[Key Rotation] {table} is fully encrypted with the primary key")
+    except Exception as e:
+        logger.error(f"[Key Rotation] Stopped, will resume on next start: {e}")
+
+async def get_rotation_status():
+    """Progress rows of the re-encryption job"""
+    async with (await get_database_pool()).acquire() as conn:
+        return await conn.fetch(
+            "SELECT table_name, key_id, rows_rewritten, completed_at, updated_at FROM key_rotation_progress ORDER BY table_name"
+        )
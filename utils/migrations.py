@@ -0,0 +1,351 @@
+# Schema migrations, applied in order by run_migrations(). Each entry is
+# (version, description, apply) where apply(conn) runs inside the migration
+# transaction. Never edit a released migration; add a new one instead.
+
+# Arbitrary key for pg_advisory_lock so only one process migrates at a time
+MIGRATION_LOCK_ID = 720_451_001
+
+BASELINE_TABLES = {
+    "products": """
+        CREATE TABLE IF NOT EXISTS products (
+            guild_id TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            role_id TEXT,
+            stock INTEGER DEFAULT -1,
+            description TEXT,
+            payment_methods TEXT,
+            payhip_secret TEXT,
+            gamepass_id TEXT,
+            roblox_cookie TEXT,
+            PRIMARY KEY (guild_id, product_name)
+        )
+    """,
+    "roblox_verified_users": """
+        CREATE TABLE IF NOT EXISTS roblox_verified_users (
+            guild_id TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            discord_user_id TEXT NOT NULL,
+            roblox_username TEXT NOT NULL,
+            roblox_user_id TEXT NOT NULL,
+            verified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, product_name, discord_user_id)
+        )
+    """,
+    "verification_message": """
+        CREATE TABLE IF NOT EXISTS verification_message (
+            guild_id TEXT NOT NULL PRIMARY KEY,
+            message_id TEXT,
+            channel_id TEXT
+        )
+    """,
+    "verified_licenses": """
+        CREATE TABLE IF NOT EXISTS verified_licenses (
+            user_id TEXT NOT NULL,
+            guild_id TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            license_key TEXT NOT NULL,
+            PRIMARY KEY (user_id, guild_id, product_name)
+        )
+    """,
+    "product_sales": """
+        CREATE TABLE IF NOT EXISTS product_sales (
+            guild_id TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            total_sold INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, product_name)
+        )
+    """,
+    "ticket_boxes": """
+        CREATE TABLE IF NOT EXISTS ticket_boxes (
+            guild_id TEXT NOT NULL,
+            message_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            PRIMARY KEY (guild_id, message_id)
+        )
+    """,
+    "active_tickets": """
+        CREATE TABLE IF NOT EXISTS active_tickets (
+            guild_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            product_name TEXT,
+            ticket_number INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, channel_id)
+        )
+    """,
+    "ticket_counters": """
+        CREATE TABLE IF NOT EXISTS ticket_counters (
+            guild_id TEXT PRIMARY KEY,
+            counter INTEGER DEFAULT 0
+        )
+    """,
+    "ticket_customization": """
+        CREATE TABLE IF NOT EXISTS ticket_customization (
+            guild_id TEXT PRIMARY KEY,
+            title TEXT DEFAULT 'Support Tickets',
+            description TEXT DEFAULT 'Need help with one of our products? Click the button below to create a support ticket!
+
+**What happens next?**
+• Select the product you need help with
+• A private channel will be created for you
+• Provide your license key for verification
+• Get personalized support from our team',
+            button_text TEXT DEFAULT 'Create Ticket',
+            button_emoji TEXT DEFAULT '🎫',
+            show_stock_info BOOLEAN DEFAULT TRUE
+        )
+    """,
+    "auto_roles": """
+        CREATE TABLE IF NOT EXISTS auto_roles (
+            guild_id TEXT NOT NULL,
+            role_type TEXT NOT NULL,
+            role_id TEXT NOT NULL,
+            product_name TEXT DEFAULT '',
+            PRIMARY KEY (guild_id, role_type, role_id, product_name)
+        )
+    """,
+    "role_permissions": """
+        CREATE TABLE IF NOT EXISTS role_permissions (
+            guild_id TEXT NOT NULL,
+            role_id TEXT NOT NULL,
+            permission_type TEXT NOT NULL,
+            PRIMARY KEY (guild_id, role_id, permission_type)
+        )
+    """,
+    "bot_settings": """
+        CREATE TABLE IF NOT EXISTS bot_settings (
+            guild_id TEXT NOT NULL,
+            setting_name TEXT NOT NULL,
+            setting_value TEXT NOT NULL,
+            PRIMARY KEY (guild_id, setting_name)
+        )
+    """,
+    "server_log_channels": """
+        CREATE TABLE IF NOT EXISTS server_log_channels (
+            guild_id TEXT PRIMARY KEY,
+            channel_id TEXT NOT NULL
+        )
+    """,
+    "stock_channels": """
+        CREATE TABLE IF NOT EXISTS stock_channels (
+            guild_id TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            channel_id TEXT NOT NULL,
+            category_id TEXT,
+            message_id TEXT,
+            PRIMARY KEY (guild_id, product_name)
+        )
+    """,
+    "ticket_categories": """
+        CREATE TABLE IF NOT EXISTS ticket_categories (
+            guild_id TEXT NOT NULL,
+            category_name TEXT NOT NULL,
+            category_description TEXT NOT NULL,
+            display_order INTEGER NOT NULL DEFAULT 0,
+            emoji TEXT DEFAULT '🎫',
+            PRIMARY KEY (guild_id, category_name)
+        )
+    """,
+    "ticket_discord_categories": """
+        CREATE TABLE IF NOT EXISTS ticket_discord_categories (
+            guild_id TEXT NOT NULL,
+            ticket_type TEXT NOT NULL,
+            category_name TEXT DEFAULT '',
+            discord_category_id TEXT NOT NULL,
+            PRIMARY KEY (guild_id, ticket_type, category_name)
+        )
+    """,
+    "review_settings": """
+        CREATE TABLE IF NOT EXISTS review_settings (
+            guild_id TEXT PRIMARY KEY,
+            review_channel_id TEXT NOT NULL
+        )
+    """,
+    "pending_reviews": """
+        CREATE TABLE IF NOT EXISTS pending_reviews (
+            guild_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            requested_by TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (guild_id, user_id, product_name)
+        )
+    """,
+    "custom_messages": """
+        CREATE TABLE IF NOT EXISTS custom_messages (
+            guild_id TEXT NOT NULL,
+            message_name TEXT NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            color INTEGER DEFAULT 5793266,
+            fields TEXT,
+            footer TEXT,
+            timestamp BOOLEAN DEFAULT FALSE,
+            channel_id TEXT,
+            message_id TEXT,
+            PRIMARY KEY (guild_id, message_name)
+        )
+    """
+}
+
+
+async def create_baseline_tables(conn):
+    for table_name, sql in BASELINE_TABLES.items():
+        await conn.execute(sql)
+        print(f"✅ Created table: {table_name}")
+
+async def migrate_dual_payment(conn):
+    """Move single-payment products (product_type/product_secret) to payment_methods"""
+    await conn.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS stock INTEGER DEFAULT -1")
+    await conn.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS payment_methods TEXT")
+    await conn.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS payhip_secret TEXT")
+    await conn.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS gamepass_id TEXT")
+    await conn.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS roblox_cookie TEXT")
+    await conn.execute("ALTER TABLE products ADD COLUMN IF NOT EXISTS description TEXT")
+
+    has_legacy_columns = await conn.fetchval(
+        """
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'products' AND column_name = 'product_secret'
+        )
+        """
+    )
+    if not has_legacy_columns:
+        return
+
+    migrated = 0
+    for product in await conn.fetch("SELECT * FROM products WHERE payment_methods IS NULL OR payment_methods = ''"):
+        product_secret = product.get('product_secret')
+        if not product_secret:
+            continue
+
+        if product.get('product_type', 'payhip') == 'roblox':
+            # Roblox-only product; the cookie was stored as the secret
+            payment_methods, payhip_secret, roblox_cookie = "robux:Robux Price", None, product_secret
+        else:
+            payment_methods, payhip_secret, roblox_cookie = "usd:USD Price", product_secret, None
+
+        await conn.execute(
+            """
+            UPDATE products SET 
+                payment_methods = $1,
+                payhip_secret = $2,
+                roblox_cookie = $3
+            WHERE guild_id = $4 AND product_name = $5
+            """,
+            payment_methods, payhip_secret, roblox_cookie, product['guild_id'], product['product_name']
+        )
+        migrated += 1
+
+    await conn.execute("ALTER TABLE products DROP COLUMN IF EXISTS product_type")
+    await conn.execute("ALTER TABLE products DROP COLUMN IF EXISTS product_secret")
+    print(f"✅ Migrated {migrated} single-payment product(s)")
+
+async def add_stock_channel_message_id(conn):
+    await conn.execute("ALTER TABLE stock_channels ADD COLUMN IF NOT EXISTS message_id TEXT")
+
+async def add_active_ticket_user_index(conn):
+    # Keep only the newest ticket for users who managed to open several
+    await conn.execute("""
+        DELETE FROM active_tickets a
+        USING active_tickets b
+        WHERE a.guild_id = b.guild_id AND a.user_id = b.user_id
+        AND (a.created_at, a.channel_id) < (b.created_at, b.channel_id)
+    """)
+    # One open ticket per user per guild; also serves the "already has a ticket" lookup
+    await conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS active_tickets_guild_user_idx
+        ON active_tickets (guild_id, user_id)
+    """)
+
+async def add_key_rotation_progress(conn):
+    # Resume point of the background re-encryption job, one row per table
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS key_rotation_progress (
+            table_name TEXT PRIMARY KEY,
+            key_id TEXT NOT NULL,
+            last_key TEXT[],
+            rows_rewritten BIGINT NOT NULL DEFAULT 0,
+            completed_at TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+async def add_roblox_verified_user_index(conn):
+    # Rejoin role restore looks members up by guild; verified_licenses is already
+    # covered by its (user_id, guild_id, product_name) primary key
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS roblox_verified_users_guild_user_idx
+        ON roblox_verified_users (guild_id, discord_user_id)
+    """)
+
+async def add_active_ticket_number_index(conn):
+    # Keyset pagination of /list_tickets and lookups by ticket number
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS active_tickets_guild_number_idx
+        ON active_tickets (guild_id, ticket_number DESC)
+    """)
+
+async def add_verified_license_guild_index(conn):
+    # Per-guild license counts and exports; the primary key leads with user_id
+    await conn.execute("""
+        CREATE INDEX IF NOT EXISTS verified_licenses_guild_user_idx
+        ON verified_licenses (guild_id, user_id)
+    """)
+
+MIGRATIONS = [
+    (1, "baseline tables", create_baseline_tables),
+    (2, "dual payment product columns", migrate_dual_payment),
+    (3, "stock channel monitor message id", add_stock_channel_message_id),
+    (4, "one open ticket per user", add_active_ticket_user_index),
+    (5, "key rotation progress", add_key_rotation_progress),
+    (6, "roblox verified user lookup index", add_roblox_verified_user_index),
+    (7, "active ticket number index", add_active_ticket_number_index),
+    (8, "verified license guild index", add_verified_license_guild_index),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+async def get_schema_version(conn):
+    """Current schema version (0 for a database that predates schema_version)"""
+    if not await conn.fetchval("SELECT to_regclass('schema_version')"):
+        return 0
+    return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+async def run_migrations(conn):
+    """Apply pending migrations in one transaction; returns the resulting version"""
+    # Warm restart: schema is current, no DDL or locking needed
+    version = await get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        print(f"✅ Database schema up to date (version {version})")
+        return version
+
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_ID)
+    try:
+        async with conn.transaction():
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # Another process may have migrated while we waited for the lock
+            version = await get_schema_version(conn)
+
+            for migration_version, description, apply in MIGRATIONS:
+                if migration_version <= version:
+                    continue
+                print(f"🔄 Applying migration {migration_version}: {description}")
+                await apply(conn)
+                await conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES ($1, $2)",
+                    migration_version, description
+                )
+                version = migration_version
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATION_LOCK_ID)
+
+    print(f"✅ Database schema migrated to version {version}")
+    return version
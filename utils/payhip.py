@@ -0,0 +1,48 @@
+# utils/payhip.py - async client for the Payhip license API
+
+import asyncio
+import aiohttp
+import logging
+from utils.http_client import get_http_session
+
+logger = logging.getLogger(__name__)
+
+PAYHIP_VERIFY_URL = "https://payhip.com/api/v2/license/verify"
+PAYHIP_INCREMENT_USAGE_URL = "https://payhip.com/api/v2/license/usage"
+PAYHIP_TIMEOUT = 10
+
+class PayhipError(Exception):
+    """Raised when the Payhip API can't be reached or answers with an error"""
+
+async def verify_license(product_secret, license_key, timeout=PAYHIP_TIMEOUT):
+    """Look up a license key and return Payhip's `data` payload (or None)"""
+    session = await get_http_session()
+    try:
+        async with session.get(
+            PAYHIP_VERIFY_URL,
+            params={"license_key": license_key},
+            headers={"product-secret-key": product_secret},
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            response.raise_for_status()
+            payload = await response.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        logger.warning(f"[Payhip Verify Error] {type(e).__name__}: {e}")
+        raise PayhipError(str(e)) from e
+
+    return (payload or {}).get("data")
+
+async def increment_license_usage(product_secret, license_key, timeout=PAYHIP_TIMEOUT):
+    """Mark a license as used once; returns True when Payhip accepted the update"""
+    session = await get_http_session()
+    try:
+        async with session.put(
+            PAYHIP_INCREMENT_USAGE_URL,
+            headers={"product-secret-key": product_secret},
+            data={"license_key": license_key},
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            return response.status == 200
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.warning(f"[Payhip Usage Error] {type(e).__name__}: {e}")
+        raise PayhipError(str(e)) from e
@@ -1,28 +1,97 @@
 # Updated utils/permissions.py
 
 import functools
-from utils.database import get_database_pool
+from utils.database import get_database_pool, register_invalidation_handler
 import disnake
 from disnake.ext import commands
 import config
 
-async def has_permission(user, guild, permission_type):
-    """Check if user has specific permission"""
-    # Server owner always has all permissions
-    if user.id == guild.owner_id:
-        return True
+# guild_id -> {role_id: {permission_type, ...}}, loaded once per guild and
+# kept in sync by toggle_permission() in cogs/role_management.py; other
+# processes drop their copy through the "role_permissions" invalidation
+role_permission_cache = {}
+role_permission_generation = {}
 
+def _bump_permission_generation(guild_id):
+    role_permission_generation[guild_id] = role_permission_generation.get(guild_id, 0) + 1
+
+async def get_role_permission_map(guild_id):
+    """Return the cached role -> permissions map for a guild"""
+    guild_id = str(guild_id)
+    role_map = role_permission_cache.get(guild_id)
+    if role_map is not None:
+        return role_map
+
+    generation = role_permission_generation.setdefault(guild_id, 0)
     async with (await get_database_pool()).acquire() as conn:
-        # Check if any of user's roles have the permission
-        user_role_ids = [str(role.id) for role in user.roles]
-        if not user_role_ids:
-            return False
-
-        result = await conn.fetchrow(
-            "SELECT 1 FROM role_permissions WHERE guild_id = $1 AND role_id = ANY($2) AND permission_type = $3",
-            str(guild.id), user_role_ids, permission_type
+        rows = await conn.fetch(
+            "SELECT role_id, permission_type FROM role_permissions WHERE guild_id = $1",
+            guild_id
         )
-        return result is not None
+
+    role_map = {}
+    for row in rows:
+        role_map.setdefault(row["role_id"], set()).add(row["permission_type"])
+
+    # Only keep it if no write or invalidation arrived while we were loading
+    if role_permission_generation.get(guild_id) == generation:
+        role_permission_cache[guild_id] = role_map
+    return role_map
+
+def set_cached_role_permission(guild_id, role_id, permission_type, granted):
+    """Apply a role_permissions write to the cache (no-op if the guild isn't loaded)"""
+    guild_id = str(guild_id)
+    _bump_permission_generation(guild_id)
+    role_map = role_permission_cache.get(guild_id)
+    if role_map is None:
+        return
+
+    permissions = role_map.setdefault(str(role_id), set())
+    if granted:
+        permissions.add(permission_type)
+    else:
+        permissions.discard(permission_type)
+        if not permissions:
+            del role_map[str(role_id)]
+
+def invalidate_permission_cache(guild_id):
+    """Forget a guild's permissions (every guild's if None) so the next check reloads them"""
+    if guild_id is None:
+        role_permission_cache.clear()
+        for cached_guild_id in role_permission_generation:
+            _bump_permission_generation(cached_guild_id)
+        return
+
+    guild_id = str(guild_id)
+    role_permission_cache.pop(guild_id, None)
+    _bump_permission_generation(guild_id)
+
+register_invalidation_handler("role_permissions", invalidate_permission_cache)
+
+async def get_role_permissions(user, guild):
+    """Union of the permissions granted to the user's roles"""
+    role_map = await get_role_permission_map(guild.id)
+    permissions = set()
+    for role in user.roles:
+        permissions |= role_map.get(str(role.id), set())
+    return permissions
+
+async def get_roles_with_permissions(guild_id, permission_types):
+    """Role IDs that hold any of the given permissions"""
+    role_map = await get_role_permission_map(guild_id)
+    wanted = set(permission_types)
+    return {role_id for role_id, permissions in role_map.items() if permissions & wanted}
+
+async def has_any_permission(user, guild, permission_types):
+    """Check if user has at least one of the given permissions"""
+    if user.id == guild.owner_id:
+        return True
+
+    return bool(await get_role_permissions(user, guild) & set(permission_types))
+
+async def has_permission(user, guild, permission_type):
+    """Check if user has specific permission"""
+    return await has_any_permission(user, guild, {permission_type})
 
 def requires_permission(permission_type):
     """Decorator to check permissions for slash commands"""
@@ -63,8 +132,6 @@ def owner_or_permission(permission_type):
 
 async def get_user_permissions(user, guild):
     """Get all permissions for a specific user"""
-    permissions = set()
-    
     # Server owner gets all permissions
     if user.id == guild.owner_id:
         return {
@@ -74,16 +141,7 @@ async def get_user_permissions(user, guild):
             "manage_bot_settings", "request_reviews"
         }
     
-    async with (await get_database_pool()).acquire() as conn:
-        user_role_ids = [str(role.id) for role in user.roles]
-        if user_role_ids:
-            results = await conn.fetch(
-                "SELECT permission_type FROM role_permissions WHERE guild_id = $1 AND role_id = ANY($2)",
-                str(guild.id), user_role_ids
-            )
-            permissions = {row["permission_type"] for row in results}
-    
-    return permissions
+    return await get_role_permissions(user, guild)
 
 class PermissionView(disnake.ui.View):
     """A view for displaying user permissions"""
@@ -127,8 +185,6 @@ class PermissionView(disnake.ui.View):
 async def check_ticket_access(user, guild):
     """Check if user can access/handle tickets"""
     return (
-        user.id == guild.owner_id or
-        await has_permission(user, guild, "handle_tickets") or
-        await has_permission(user, guild, "manage_tickets") or
+        await has_any_permission(user, guild, {"handle_tickets", "manage_tickets"}) or
         any(role.permissions.manage_channels for role in user.roles)
     )
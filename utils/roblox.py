@@ -0,0 +1,153 @@
+# utils/roblox.py - async client for the Roblox user and inventory APIs
+
+import asyncio
+import aiohttp
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from utils.http_client import get_http_session
+
+logger = logging.getLogger(__name__)
+
+ROBLOX_USERNAME_URL = "https://api.roblox.com/users/get-by-username"
+ROBLOX_OWNERSHIP_URL = "https://inventory.roblox.com/v1/users/{user_id}/items/GamePass/{gamepass_id}/is-owned"
+ROBLOX_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+USERNAME_LOOKUP_TIMEOUT = 15
+OWNERSHIP_TIMEOUT = 20
+USERNAME_CACHE_SIZE = 5000
+USERNAME_CACHE_TTL = 3600  # Roblox user IDs never change, names rarely do
+BAD_COOKIE_TTL = 3600
+
+# lowercased username -> (user_id, expires_at), oldest first
+username_cache = OrderedDict()
+# cookie fingerprint -> time the cookie was rejected with a 401
+bad_cookies = {}
+
+class RobloxError(Exception):
+    """Raised when the Roblox API can't be reached"""
+
+class RobloxTimeoutError(RobloxError):
+    """Raised when Roblox takes longer than the per-call timeout"""
+
+class RobloxConnectionError(RobloxError):
+    """Raised when no connection to Roblox could be made"""
+
+class RobloxAPIError(RobloxError):
+    """Raised when Roblox answers with an unexpected status or body"""
+    def __init__(self, status, body=""):
+        super().__init__(f"Roblox API returned status {status}")
+        self.status = status
+        self.body = body
+
+class RobloxAuthError(RobloxAPIError):
+    """Raised when the product's .ROBLOSECURITY cookie is rejected"""
+    def __init__(self, body=""):
+        super().__init__(401, body)
+
+def cookie_fingerprint(cookie):
+    return hashlib.sha256(cookie.encode()).hexdigest()
+
+def is_cookie_marked_bad(cookie):
+    """Whether this cookie recently failed authentication"""
+    fingerprint = cookie_fingerprint(cookie)
+    marked_at = bad_cookies.get(fingerprint)
+    if marked_at is None:
+        return False
+    if time.monotonic() - marked_at > BAD_COOKIE_TTL:
+        bad_cookies.pop(fingerprint, None)
+        return False
+    return True
+
+def _get_cached_user_id(username):
+    key = username.lower()
+    entry = username_cache.get(key)
+    if entry is None:
+        return None
+
+    user_id, expires_at = entry
+    if time.monotonic() > expires_at:
+        del username_cache[key]
+        return None
+
+    username_cache.move_to_end(key)
+    return user_id
+
+def _cache_user_id(username, user_id):
+    key = username.lower()
+    username_cache[key] = (user_id, time.monotonic() + USERNAME_CACHE_TTL)
+    username_cache.move_to_end(key)
+    while len(username_cache) > USERNAME_CACHE_SIZE:
+        username_cache.popitem(last=False)
+
+async def _request_json(url, timeout, headers=None, params=None):
+    """GET a Roblox endpoint and return (status, parsed_json_or_None, text)"""
+    session = await get_http_session()
+    try:
+        async with session.get(
+            url,
+            headers=headers,
+            params=params,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            text = await response.text()
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = None
+            return response.status, data, text
+    except asyncio.TimeoutError as e:
+        raise RobloxTimeoutError("Roblox request timed out") from e
+    except aiohttp.ClientConnectionError as e:
+        raise RobloxConnectionError(str(e)) from e
+    except aiohttp.ClientError as e:
+        raise RobloxError(str(e)) from e
+
+async def get_user_id(username):
+    """Resolve a Roblox username to its user ID, or None if it doesn't exist"""
+    cached = _get_cached_user_id(username)
+    if cached is not None:
+        return cached
+
+    status, data, _ = await _request_json(
+        ROBLOX_USERNAME_URL,
+        USERNAME_LOOKUP_TIMEOUT,
+        params={"username": username}
+    )
+    if status != 200 or not isinstance(data, dict):
+        return None
+
+    user_id = data.get("Id")
+    if user_id:
+        _cache_user_id(username, user_id)
+    return user_id
+
+async def owns_gamepass(cookie, user_id, gamepass_id):
+    """Check gamepass ownership using the product owner's cookie"""
+    if is_cookie_marked_bad(cookie):
+        raise RobloxAuthError()
+
+    headers = {
+        "Cookie": f".ROBLOSECURITY={cookie}",
+        "User-Agent": ROBLOX_USER_AGENT,
+        "Accept": "application/json",
+        "Content-Type": "application/json"
+    }
+    status, data, text = await _request_json(
+        ROBLOX_OWNERSHIP_URL.format(user_id=user_id, gamepass_id=gamepass_id),
+        OWNERSHIP_TIMEOUT,
+        headers=headers
+    )
+
+    logger.info(f"[Roblox API] Status: {status}, Response: {text[:200]}")
+
+    if status == 401:
+        bad_cookies[cookie_fingerprint(cookie)] = time.monotonic()
+        raise RobloxAuthError(text)
+    if status != 200:
+        raise RobloxAPIError(status, text)
+    if not isinstance(data, dict):
+        raise RobloxAPIError(status, text)
+
+    return bool(data.get("isOwned", False))
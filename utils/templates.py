@@ -0,0 +1,135 @@
+import re
+from collections import OrderedDict
+from datetime import datetime
+from utils.database import get_product_catalog, TEST_PRODUCT_NAME
+
+# Ticket box description variables, e.g. {SERVER_NAME} or {My_Product.STOCK}
+VARIABLE_PATTERN = re.compile(r'\{([^{}]+)\}')
+STOCK_SUFFIX = ".STOCK"
+TEMPLATE_VARIABLES = {
+    "SERVER_NAME", "SERVER_MEMBER_COUNT", "SERVER_OWNER",
+    "CURRENT_DATE", "CURRENT_TIME",
+    "PRODUCT_COUNT", "TOTAL_STOCK", "PRODUCTS_IN_STOCK", "PRODUCTS_SOLD_OUT", "TOTAL_SALES",
+}
+
+COMPILED_TEMPLATE_CACHE_SIZE = 512
+compiled_templates = OrderedDict()  # text -> (tokens, variables used)
+catalog_aggregates = {}  # guild_id -> (catalog, aggregates)
+rendered_templates = {}  # guild_id -> (text, fingerprint, rendered)
+
+def compile_template(text):
+    """Split a description into literal, variable and per-product stock tokens (cached)"""
+    compiled = compiled_templates.get(text)
+    if compiled is not None:
+        compiled_templates.move_to_end(text)
+        return compiled
+
+    tokens = []
+    variables = []
+    position = 0
+    for match in VARIABLE_PATTERN.finditer(text):
+        name = match.group(1)
+        if name in TEMPLATE_VARIABLES:
+            token = ("var", name)
+        elif name.endswith(STOCK_SUFFIX) and len(name) > len(STOCK_SUFFIX):
+            # Underscores stand in for spaces in product names
+            token = ("stock", name[:-len(STOCK_SUFFIX)].replace("_", " "))
+        else:
+            continue  # Unknown variables are left as typed
+
+        if match.start() > position:
+            tokens.append(("text", text[position:match.start()]))
+        tokens.append(token)
+        if token not in variables:
+            variables.append(token)
+        position = match.end()
+
+    if position < len(text):
+        tokens.append(("text", text[position:]))
+
+    compiled = (tuple(tokens), tuple(variables))
+    compiled_templates[text] = compiled
+    if len(compiled_templates) > COMPILED_TEMPLATE_CACHE_SIZE:
+        compiled_templates.popitem(last=False)
+    return compiled
+
+def _stock_text(stock):
+    if stock == -1:
+        return "Unlimited"
+    if stock == 0:
+        return "SOLD OUT"
+    return str(stock)
+
+def _aggregate(stocks, total_sales):
+    total_stock = sum(stock for stock in stocks.values() if stock != -1)
+    unlimited_count = sum(1 for stock in stocks.values() if stock == -1)
+    return {
+        "stocks": stocks,
+        "PRODUCT_COUNT": str(len(stocks)),
+        "TOTAL_STOCK": f"{total_stock} + {unlimited_count} unlimited" if unlimited_count else str(total_stock),
+        "PRODUCTS_IN_STOCK": str(sum(1 for stock in stocks.values() if stock != 0)),
+        "PRODUCTS_SOLD_OUT": str(sum(1 for stock in stocks.values() if stock == 0)),
+        "TOTAL_SALES": f"{total_sales:,}",
+    }
+
+async def get_catalog_aggregates(guild_id):
+    """Stock and sales aggregates for a guild, recomputed only when its catalog changes"""
+    guild_id = str(guild_id)
+    catalog = await get_product_catalog(guild_id)
+
+    cached = catalog_aggregates.get(guild_id)
+    if cached is not None and cached[0] is catalog:
+        return cached[1]
+
+    stocks = {name: product["stock"] for name, product in catalog["products"].items()}
+    stocks[TEST_PRODUCT_NAME] = -1  # Test product is always listed, unlimited
+    aggregates = _aggregate(stocks, catalog["total_sales"])
+
+    catalog_aggregates[guild_id] = (catalog, aggregates)
+    return aggregates
+
+def _resolve(token, guild, aggregates, now):
+    kind, name = token
+    if kind == "stock":
+        stock = aggregates["stocks"].get(name)
+        return "N/A" if stock is None else _stock_text(stock)
+
+    if name == "SERVER_NAME":
+        return guild.name
+    if name == "SERVER_MEMBER_COUNT":
+        return str(guild.member_count)
+    if name == "SERVER_OWNER":
+        return guild.owner.mention if guild.owner else "Unknown"
+    if name == "CURRENT_DATE":
+        return now.strftime("%B %d, %Y")
+    if name == "CURRENT_TIME":
+        return now.strftime("%H:%M")
+    return aggregates[name]
+
+async def render_template(text, guild):
+    """Render a ticket box description for a guild
+
+    Only the variables the template actually uses are resolved, and the
+    rendered string is reused until one of their values changes.
+    """
+    if not text:
+        return text
+
+    tokens, variables = compile_template(text)
+    if not variables:
+        return text
+
+    aggregates = await get_catalog_aggregates(guild.id)
+
+    now = datetime.now()
+    values = {token: _resolve(token, guild, aggregates, now) for token in variables}
+    fingerprint = tuple(values[token] for token in variables)
+
+    guild_id = str(guild.id)
+    cached = rendered_templates.get(guild_id)
+    if cached is not None and cached[0] == text and cached[1] == fingerprint:
+        return cached[2]
+
+    rendered = "".join(value if kind == "text" else values[(kind, value)] for kind, value in tokens)
+    rendered_templates[guild_id] = (text, fingerprint, rendered)
+    return rendered